@@ -0,0 +1,58 @@
+import json
+import logging
+import argparse
+from rag_pipeline.retrieval import Hybrid_Retriever, load_serialized_docs, qwen_configs
+from rag_pipeline.reranking import Qwenvl_Reranker, ScoreCache
+from rag_pipeline.reasoning import DeepSeek_Client, Context_Packer, ResponseCache
+from rag_pipeline.serving import Batch_Runner, Concurrency_Gate
+from rag_pipeline.monitoring import add_sink, JSONL_Sink
+
+
+# 离线批量问答：python batch_qa.py --queries eval.jsonl --out answers.jsonl
+# 输入每行 {"id": ..., "query": ...}；中断后用同样的命令重跑即可从断点继续
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries",        type=str,   required=True)
+    parser.add_argument("--out",            type=str,   required=True)
+    parser.add_argument("--limit",          type=int,   default=None)   # 本次最多跑多少条（调试用）
+    parser.add_argument("--parents",        type=str,   default="/data/huali_mm/chunks/mm_parents.json")
+    parser.add_argument("--children",       type=str,   default="/data/huali_mm/chunks/mm_children.json")
+    parser.add_argument("--top_text",       type=int,   default=20)
+    parser.add_argument("--top_media",      type=int,   default=5)
+    parser.add_argument("--rerank_batch",   type=int,   default=8)      # 单个 query 内的打分线程数
+    parser.add_argument("--retrieve_batch", type=int,   default=32)     # 每次批量检索的 query 数
+    parser.add_argument("--rerank_queries", type=int,   default=4)      # 同时重排的 query 数
+    parser.add_argument("--rerank_limit",   type=int,   default=16)     # 全局远程打分并发上限
+    parser.add_argument("--llm_limit",      type=int,   default=4)      # 同时进行的推理流上限
+    parser.add_argument("--score_cache",    type=str,   default=None)
+    parser.add_argument("--context_budget", type=int,   default=None)
+    parser.add_argument("--response_cache", type=str,   default=None)
+    parser.add_argument("--metrics_jsonl",  type=str,   default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.metrics_jsonl:
+        add_sink(JSONL_Sink(args.metrics_jsonl))
+
+    mm_parents  = load_serialized_docs(args.parents)
+    mm_children = load_serialized_docs(args.children)
+    retriever   = Hybrid_Retriever((mm_children, mm_parents), qwen_configs)
+
+    gate     = Concurrency_Gate(args.rerank_limit)
+    reranker = Qwenvl_Reranker(score_cache=ScoreCache(args.score_cache) if args.score_cache else None,
+                               limiter=gate)
+    reasoner = DeepSeek_Client(max_connections=args.llm_limit,
+                               packer=Context_Packer(args.context_budget) if args.context_budget else None,
+                               response_cache=ResponseCache(args.response_cache) if args.response_cache else None)
+    reasoner.warmup()
+
+    runner = Batch_Runner(retriever, reranker, reasoner,
+                          top_text      =args.top_text,
+                          top_media     =args.top_media,
+                          rerank_batch  =args.rerank_batch,
+                          retrieve_batch=args.retrieve_batch,
+                          rerank_queries=args.rerank_queries,
+                          llm_limit     =args.llm_limit,
+                          gate          =gate)
+    report = runner.run(args.queries, args.out, limit=args.limit)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    reasoner.close()
@@ -0,0 +1,76 @@
+"""
+DashScope_AsyncClient 基准：对本地限流桩服务发起大量打分请求
+用法：python benchmarks/bench_async_client.py [--n 300] [--capacity 8] [--error_rate 0.02]
+
+桩服务（benchmarks/stubs.py 的 Fake_OpenAI_Server）同时在处理的请求超过 capacity 时返回 429。
+对比：固定并发线程池（每次调用一个请求，失败即失败）vs 共享异步客户端（AIMD + 重试），
+报告耗时、成功 / 失败数、429 次数与客户端最终并发上限。
+"""
+import sys
+import time
+import argparse
+import urllib.request
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from stubs import Fake_OpenAI_Server
+from rag_pipeline.remote import AIMD_Limiter, DashScope_AsyncClient, RemoteCallError
+
+
+def make_messages(i: int):
+    return [{"role": "user", "content": [{"text": f"Query: q{i % 7} theorem\n\nContext (text):\nq{i % 5} theorem body\n\n请给出"}]}]
+
+
+def fixed_pool(base_url: str, n: int, workers: int):
+    import json
+
+    def one(i):
+        req = urllib.request.Request(
+            f"{base_url}/chat/completions",
+            data=json.dumps({"model": "stub", "messages": make_messages(i)}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req) as resp:
+                return resp.status == 200
+        except Exception:
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        return sum(ex.map(one, range(n)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n",          type=int,   default=300)
+    parser.add_argument("--capacity",   type=int,   default=8)
+    parser.add_argument("--latency_ms", type=float, default=100.0)
+    parser.add_argument("--error_rate", type=float, default=0.02)
+    parser.add_argument("--workers",    type=int,   default=16)
+    args = parser.parse_args()
+
+    server = Fake_OpenAI_Server(capacity=args.capacity, latency_ms=args.latency_ms, error_rate=args.error_rate)
+    base_url = server.start()
+
+    t0 = time.perf_counter()
+    ok = fixed_pool(base_url, args.n, args.workers)
+    t_pool = time.perf_counter() - t0
+    print(f"fixed pool (workers={args.workers}): {t_pool:6.2f}s  ok={ok}/{args.n}  "
+          f"server 429s={server.counts['throttled']}")
+
+    server.counts.update(ok=0, throttled=0, errors=0, peak_in_flight=0)
+    client = DashScope_AsyncClient(model="stub", api_key="stub", base_url=base_url,
+                                   limiter=AIMD_Limiter(initial=4, max_limit=64),
+                                   backoff_base_s=0.05, backoff_max_s=1.0, deadline_s=30.0)
+    t0 = time.perf_counter()
+    results = client.gather_sync([make_messages(i) for i in range(args.n)])
+    t_async = time.perf_counter() - t0
+    failed = [r for r in results if isinstance(r, RemoteCallError)]
+    print(f"async AIMD client        : {t_async:6.2f}s  ok={args.n - len(failed)}/{args.n}  "
+          f"server 429s={server.counts['throttled']}  peak in-flight={server.counts['peak_in_flight']}")
+    print(f"client stats: {client.stats()}")
+
+    client.close()
+    server.stop()
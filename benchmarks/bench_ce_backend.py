@@ -0,0 +1,54 @@
+"""
+CrossEncoder_Reranker CPU 推理后端基准：torch(fp32) vs int8 动态量化 vs ONNX Runtime
+用法：python benchmarks/bench_ce_backend.py --model_dir ./models/MiniLM-L-6-v2 [--backends torch int8 onnx] [--num_threads 4]
+
+候选块与 bench_ce_rerank.py 相同（合成文本），报告各后端 candidates/s，
+以及相对 fp32 分数的 Spearman / Kendall 排序一致性与 top-k 重合率。
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_ce_rerank import make_blocks, timed
+from rag_pipeline.reranking import CrossEncoder_Reranker
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir",   type=str, required=True)
+    parser.add_argument("--backends",    type=str, nargs="+", default=["torch", "int8", "onnx"])
+    parser.add_argument("--n",           type=int, default=200)
+    parser.add_argument("--batch_size",  type=int, default=32)
+    parser.add_argument("--num_threads", type=int, default=None)
+    parser.add_argument("--repeat",      type=int, default=3)
+    parser.add_argument("--topk",        type=int, default=20)
+    args = parser.parse_args()
+
+    query  = "Explain the convolution theorem in the frequency domain"
+    blocks = make_blocks(args.n)
+
+    reference = None
+    for name in ["torch"] + [b for b in args.backends if b != "torch"]:
+        t0 = time.perf_counter()
+        rr = CrossEncoder_Reranker(args.model_dir, device="cpu", batch_size=args.batch_size,
+                                   backend=name, num_threads=args.num_threads)
+        t_load = time.perf_counter() - t0
+
+        rr._score_blocks(query, blocks[:4])                # warm-up
+        t, scores = timed(lambda: rr._score_blocks(query, blocks), args.repeat)
+        line = f"{name:6s} load={t_load:6.1f}s  {args.n / t:8.1f} candidates/s  ({t * 1000:.0f} ms)"
+
+        if reference is None:
+            reference = scores
+        else:
+            report  = rr.parity_check(query, blocks, reference=reference)
+            top_ref = set(sorted(range(args.n), key=lambda i: reference[i], reverse=True)[:args.topk])
+            top_new = set(sorted(range(args.n), key=lambda i: scores[i],    reverse=True)[:args.topk])
+            line += (f"  spearman={report['spearman']:.4f} kendall={report['kendall']:.4f}"
+                     f"  max_abs_err={report['max_abs_err']:.4f}"
+                     f"  top-{args.topk} overlap={len(top_ref & top_new) / args.topk:.2%}")
+        print(line)
+        del rr
@@ -0,0 +1,65 @@
+"""
+请求对冲基准：注入长尾延迟的本地桩服务上，对比 不对冲 vs Hedger 的 p50 / p99
+用法：python benchmarks/bench_hedging.py [--n 400] [--tail_prob 0.03] [--tail_ms 2000] [--percentile 95]
+
+远程调用由 benchmarks/stubs.py 的 Fake_QwenVL 代替（tail_prob 概率额外慢 tail_ms），
+经 Qwenvl_Reranker._call 发出（即重排真实走的调用点），并发 --workers 个线程。
+报告延迟分位数、对冲率、副本胜出数与额外请求占比。
+"""
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from stubs import Fake_QwenVL
+from rag_pipeline.remote import Hedger
+from rag_pipeline.reranking import Qwenvl_Reranker
+
+
+MESSAGES = [{"role": "user", "content": [{"text": "Query: fourier theorem\n\nContext (text):\nfourier transform theorem\n\n请给出"}]}]
+
+
+def run(args, hedger):
+    stub = Fake_QwenVL(base_ms=args.base_ms, per_item_ms=0, tail_prob=args.tail_prob, tail_ms=args.tail_ms, seed=1)
+    rr   = Qwenvl_Reranker(call_fn=stub, hedger=hedger)
+
+    def one(_):
+        t0 = time.perf_counter()
+        rr._call(MESSAGES)
+        return time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:
+        lat = sorted(ex.map(one, range(args.n)))
+    return lat, stub
+
+
+def pct(lat, p):
+    return lat[min(len(lat) - 1, int(p / 100 * len(lat)))] * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n",          type=int,   default=400)
+    parser.add_argument("--workers",    type=int,   default=8)
+    parser.add_argument("--base_ms",    type=float, default=100.0)
+    parser.add_argument("--tail_prob",  type=float, default=0.03)
+    parser.add_argument("--tail_ms",    type=float, default=2000.0)
+    parser.add_argument("--percentile", type=float, default=95.0)
+    parser.add_argument("--max_extra",  type=float, default=0.1)
+    args = parser.parse_args()
+
+    lat0, stub0 = run(args, None)
+    hedger = Hedger(percentile=args.percentile, initial_delay_s=0.3, max_extra=args.max_extra)
+    lat1, stub1 = run(args, hedger)
+
+    for name, lat, stub in (("no hedging", lat0, stub0), ("hedged", lat1, stub1)):
+        print(f"{name:10s}: p50={pct(lat, 50):7.1f}ms  p99={pct(lat, 99):7.1f}ms  "
+              f"mean={statistics.mean(lat) * 1000:7.1f}ms  remote calls={stub.calls}")
+    s = hedger.stats()
+    print(f"hedge rate={s['hedge_rate']:.2%}  wins={s['hedge_wins']}/{s['hedged']}  "
+          f"denied={s['denied']}  delay={s['delay_s'] * 1000:.0f}ms  "
+          f"extra load={(stub1.calls - args.n) / args.n:.2%}")
@@ -0,0 +1,70 @@
+"""
+启动耗时基准：python -X importtime 统计各入口的累计 import 时间
+用法：python benchmarks/bench_import.py [--budget_ms 500] [--top 10]
+
+只需要语料 / BM25 的 CLI 与 worker（前两条）必须在 budget 内完成 import，
+否则以非零状态退出；其余入口只报告耗时与最重的若干模块。
+"""
+import os
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# (名称, 语句, 是否受 budget 约束)
+TARGETS = [
+    ("corpus",    "from rag_pipeline.retrieval import load_serialized_docs",             True),
+    ("bm25",      "from rag_pipeline.retrieval import BM25_Matrix, Sparse_Retriever_bm25", True),
+    ("reranking", "import rag_pipeline.reranking",                                      True),
+    ("reasoning", "import rag_pipeline.reasoning",                                      True),
+    ("serving",   "import rag_pipeline.serving",                                        True),
+    ("chunking",  "import corpus_building.chunking",                                    True),
+    ("captions",  "import corpus_building.post_processing",                             True),
+    ("rewriting", "import post_processing",                                             True),
+    ("hybrid",    "from rag_pipeline.retrieval import Hybrid_Retriever",                False),
+]
+
+
+def import_profile(stmt: str):
+    """返回 (总耗时 us, [(累计 us, 模块名), ...])"""
+    env = {**os.environ, "PYTHONPATH": str(REPO_ROOT)}
+    env.pop("DASHSCOPE_API_KEY", None)            # 证明 import 阶段不再检查 API Key
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", stmt],
+                          cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum_us, name = line.split("|", 2)
+        rows.append((int(cum_us), name[1:].rstrip()))
+    # 顶层模块（无缩进）的累计时间之和即总 import 时间
+    total = sum(us for us, name in rows if not name.startswith(" "))
+    return total, sorted(rows, reverse=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget_ms", type=float, default=500.0)
+    parser.add_argument("--top",       type=int,   default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for name, stmt, bounded in TARGETS:
+        try:
+            total_us, rows = import_profile(stmt)
+        except RuntimeError as e:
+            print(f"{name:<10} {'-':>10}  skipped ({e})")
+            continue
+        over = bounded and total_us / 1000 > args.budget_ms
+        failed |= over
+        flag = "OVER BUDGET" if over else ("ok" if bounded else "")
+        print(f"{name:<10} {total_us / 1000:>8.1f}ms  {flag}")
+        for us, mod in rows[:args.top]:
+            print(f"{'':<12}{us / 1000:>8.1f}ms  {mod.strip()}")
+
+    sys.exit(1 if failed else 0)
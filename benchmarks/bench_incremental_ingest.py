@@ -0,0 +1,91 @@
+"""
+增量入库基准：内容哈希清单下重复运行 parse_pdfs，只解析变化的书且 book_idx 保持稳定
+用法：python benchmarks/bench_incremental_ingest.py [--n 40] [--workers 4] [--page_ms 5]
+
+用桩函数代替 MinerU（写出 content_list 并返回页数），依次运行：
+    1. 首次全量入库
+    2. 书库不变再跑一次            → 全部跳过
+    3. 改名 1 本、同名替换内容 1 本、新增 1 本、删除 1 本 → 只解析 2 本
+报告每次的耗时、解析文件数，并校验未变化 / 改名的书 book_idx 不变、删除的书不出现在合并结果中、
+.delta.json 只含变化的书且 drop_books 列出了更新 / 删除的书。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from functools import partial
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from corpus_building.data_parsing.mineru import parse_pdfs
+
+
+def stub_parse(path: str, output_dir: str, page_ms: float) -> int:
+    stem  = os.path.splitext(os.path.basename(path))[0]
+    body  = Path(path).read_text()
+    pages = 10 + len(body) % 50
+    time.sleep(pages * page_ms / 1000)
+    os.makedirs(os.path.join(output_dir, stem), exist_ok=True)
+    with open(os.path.join(output_dir, stem, f"{stem}_content_list.json"), "w", encoding="utf-8") as f:
+        json.dump([{"type": "text", "text": body, "page_idx": p} for p in range(pages)], f)
+    return pages
+
+
+def book_map(merged: str) -> dict:
+    with open(merged, encoding="utf-8") as f:
+        return {inst["text"]: inst["book_idx"] for inst in json.load(f)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n",       type=int,   default=40)
+    parser.add_argument("--workers", type=int,   default=4)
+    parser.add_argument("--page_ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root   = Path(tmp) / "library"
+        root.mkdir()
+        for i in range(args.n):
+            (root / f"book{i:03d}.pdf").write_text(f"%PDF-stub book {i} " + "x" * i)
+        merged   = os.path.join(tmp, "corpus.json")
+        manifest = os.path.join(tmp, "manifest.json")
+        run = partial(parse_pdfs, str(root), merged, workers=args.workers, timeout_s=60,
+                      parse_fn=partial(stub_parse, page_ms=args.page_ms), init_fn=None, manifest=manifest)
+
+        def timed(label):
+            t0 = time.perf_counter()
+            changes = run()
+            ms = (time.perf_counter() - t0) * 1000
+            print(f"[{label}] {ms:8.1f}ms  added={changes['added']} updated={changes['updated']} "
+                  f"removed={changes['removed']} unchanged={len(changes['unchanged'])}")
+            return changes
+
+        timed("首次全量")
+        before = book_map(merged)
+        timed("书库不变")
+
+        (root / "book001.pdf").rename(root / "renamed.pdf")              # 只改名
+        (root / "book002.pdf").write_text("%PDF-stub book 2 revised")    # 同名换内容
+        (root / "book003.pdf").unlink()                                  # 删除
+        (root / "new.pdf").write_text("%PDF-stub new book")              # 新增
+        changes = timed("增量变化")
+        after = book_map(merged)
+
+        stable = all(after.get(text) == idx for text, idx in before.items()
+                     if not text.startswith(("%PDF-stub book 2 ", "%PDF-stub book 3 ")))
+        with open(os.path.splitext(merged)[0] + ".delta.json", encoding="utf-8") as f:
+            delta = json.load(f)
+        delta_books = sorted({inst["book_idx"] for inst in delta["items"]})
+        print(f"未变化 / 改名的书 book_idx 稳定={stable}  "
+              f"book002 沿用编号={after['%PDF-stub book 2 revised'] == before['%PDF-stub book 2 xx']}  "
+              f"删除的书已移出={before['%PDF-stub book 3 xxx'] not in after.values()}  "
+              f"delta 中的书={delta_books}  变化集合={sorted(changes['added'] + changes['updated'])}  "
+              f"需删除旧数据的书={delta['drop_books']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+并行 PDF 解析基准：用桩函数代替 MinerU，验证进程池的吞吐与故障隔离
+用法：python benchmarks/bench_parse_pdfs.py [--n 32] [--workers 8] [--page_ms 20]
+
+在临时目录生成 n 个假 PDF（文件名携带页数），另加三个坏文件：
+    bad_*.pdf   解析时抛异常        → failed
+    hang_*.pdf  一直不返回           → timeout（worker 被杀掉并重启）
+    crash_*.pdf 进程直接退出         → crashed（worker 重启）
+分别用 1 个与 workers 个进程跑一遍，报告 pages/s 与失败汇总；最后经 parse_pdfs(parse_fn=...) 走一遍完整入口。
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from functools import partial
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from corpus_building.data_parsing.parallel import Parallel_Parser, print_summary
+from corpus_building.data_parsing.mineru import parse_pdfs
+
+
+def load_stub_models(load_ms: float):
+    time.sleep(load_ms / 1000)                         # 模拟每个 worker 加载一次模型
+
+
+def stub_parse(path: str, output_dir: str = None, page_ms: float = 20.0) -> int:
+    name = os.path.basename(path)
+    if name.startswith("bad_"):
+        raise ValueError("broken xref table")
+    if name.startswith("hang_"):
+        time.sleep(3600)
+    if name.startswith("crash_"):
+        os._exit(139)
+    pages = int(name.split("_")[1].split(".")[0])
+    time.sleep(pages * page_ms / 1000)
+    return pages
+
+
+def make_library(root: Path, n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    for i in range(n):
+        (root / f"book{i:03d}_{rnd.randint(20, 120)}.pdf").write_bytes(b"%PDF-stub")
+    for bad in ("bad_1.pdf", "hang_1.pdf", "crash_1.pdf"):
+        (root / bad).write_bytes(b"%PDF-stub")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n",         type=int,   default=32)
+    parser.add_argument("--workers",   type=int,   default=8)
+    parser.add_argument("--page_ms",   type=float, default=20.0)
+    parser.add_argument("--load_ms",   type=float, default=500.0)
+    parser.add_argument("--timeout_s", type=float, default=3.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        make_library(root, args.n)
+        files = sorted(str(p) for p in root.glob("*.pdf"))
+        parse_fn = partial(stub_parse, page_ms=args.page_ms)
+        init_fn  = partial(load_stub_models, args.load_ms)
+
+        for workers in (1, args.workers):
+            print(f"==== workers={workers} ====")
+            summary = Parallel_Parser(parse_fn, workers=workers, timeout_s=args.timeout_s,
+                                      init_fn=init_fn, poll_s=0.1).run(files)
+            print_summary(summary)
+
+        print("==== parse_pdfs(parse_fn=stub) ====")
+        parse_pdfs(tmp, os.path.join(tmp, "merged.json"), workers=args.workers,
+                   timeout_s=args.timeout_s, parse_fn=parse_fn, init_fn=init_fn)
+
+
+if __name__ == "__main__":
+    main()
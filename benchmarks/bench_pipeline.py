@@ -0,0 +1,123 @@
+"""
+流水线编排基准：串行（检索 → 全量重排 → 生成）vs Pipelined_RAG（召回两路并发、边召回边重排、top-k 稳定即生成）
+用法：python benchmarks/bench_pipeline.py [--n 5] [--dense_ms 120] [--sparse_ms 300] [--score_ms 150]
+
+远程服务全部用本地桩代替：重排走 Fake_QwenVL（pointwise，workers 个并发），
+生成走 Fake_OpenAI_Server 的 SSE 流（DeepSeek_Client）；检索两路用 sleep 模拟。
+报告首 token 延迟（TTFT）p50、已打分比例，以及提前生成时 top-k 与全量重排结果的重合率。
+"""
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from langchain.docstore.document import Document
+from stubs import Fake_QwenVL, Fake_OpenAI_Server
+from rag_pipeline.reranking import Qwenvl_Reranker, Anytime_Reranker
+from rag_pipeline.reasoning import DeepSeek_Client
+from rag_pipeline.serving import Pipelined_RAG, Stability_Rule
+
+WORDS = ("signal transform fourier convolution kernel frequency filter sampling "
+         "spectrum noise matrix gradient theorem domain").split()
+QUERY = "convolution theorem frequency domain"
+
+
+class Fake_Retriever():
+    """稠密一路返回前 n_dense 个父块（含图表），BM25 一路返回文本父块（与稠密部分重叠）"""
+
+    def __init__(self, n_dense: int, n_sparse: int, dense_ms: float, sparse_ms: float, seed: int = 0):
+        rnd = random.Random(seed)
+        docs = [
+            Document(page_content=" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 120))),
+                     metadata={"type": "parent" if i % 5 else "table", "book_idx": 0, "page_idx": i})
+            for i in range(n_dense + n_sparse)
+        ]
+        self.dense     = docs[:n_dense]
+        self.sparse    = [d for d in docs[n_dense // 2:] if d.metadata["type"] == "parent"][:n_sparse]
+        self.dense_ms  = dense_ms
+        self.sparse_ms = sparse_ms
+
+    merge_key = staticmethod(lambda d: (d.metadata["book_idx"], d.metadata["page_idx"], d.metadata["type"]))
+
+    def dense_retrieve_parents(self, query):
+        time.sleep(self.dense_ms / 1000)
+        return [], list(self.dense)
+
+    def bm25_retrieve_text_parents(self, query):
+        time.sleep(self.sparse_ms / 1000)
+        return [], list(self.sparse)
+
+    def hybrid_retrieve_parents(self, query):
+        _, dense  = self.dense_retrieve_parents(query)
+        _, sparse = self.bm25_retrieve_text_parents(query)
+        seen = {self.merge_key(d) for d in dense}
+        return dense + [d for d in sparse if self.merge_key(d) not in seen]
+
+
+def serial(retriever, reranker, reason_fn, args):
+    t0 = time.perf_counter()
+    parents = retriever.hybrid_retrieve_parents(QUERY)
+    top_text, top_media = Anytime_Reranker(reranker, deadline_s=1e9, workers=args.workers).rerank_parents(
+        QUERY, parents, args.top_text, args.top_media)
+    token_iter, _ = reason_fn(QUERY, top_text, top_media)
+    ttft = None
+    for _ in token_iter:
+        ttft = ttft or time.perf_counter() - t0
+    return ttft, top_text + top_media
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n",         type=int,   default=5)
+    parser.add_argument("--n_dense",   type=int,   default=40)
+    parser.add_argument("--n_sparse",  type=int,   default=20)
+    parser.add_argument("--dense_ms",  type=float, default=120.0)
+    parser.add_argument("--sparse_ms", type=float, default=300.0)
+    parser.add_argument("--score_ms",  type=float, default=150.0)
+    parser.add_argument("--workers",   type=int,   default=6)
+    parser.add_argument("--top_text",  type=int,   default=5)
+    parser.add_argument("--top_media", type=int,   default=2)
+    parser.add_argument("--min_fraction", type=float, default=0.6)
+    parser.add_argument("--patience",  type=int,   default=6)
+    args = parser.parse_args()
+
+    stub = Fake_OpenAI_Server(capacity=10 ** 6, token_ms=2.0)
+    reason_fn = DeepSeek_Client(model="stub", api_key="sk-stub", base_url=stub.start())
+    reason_fn.warmup()
+    retriever = Fake_Retriever(args.n_dense, args.n_sparse, args.dense_ms, args.sparse_ms)
+    reranker  = Qwenvl_Reranker(call_fn=Fake_QwenVL(base_ms=args.score_ms, per_item_ms=0))
+    key = lambda docs: {Fake_Retriever.merge_key(d) for d in docs}
+
+    ttfts, ref = [], None
+    for _ in range(args.n):
+        ttft, ref = serial(retriever, reranker, reason_fn, args)
+        ttfts.append(ttft)
+    ttfts.sort()
+    print(f"[serial   ] ttft p50={ttfts[len(ttfts) // 2] * 1000:7.1f}ms")
+
+    rules = {"full":   Stability_Rule(min_fraction=1.0),
+             "stable": Stability_Rule(min_fraction=args.min_fraction, patience=args.patience)}
+    for name, rule in rules.items():
+        pipe = Pipelined_RAG(retriever, reranker, reason_fn, top_text=args.top_text,
+                             top_media=args.top_media, rule=rule, workers=args.workers)
+        ttfts, fraction = [], []
+        for _ in range(args.n):
+            for _ in pipe.run(QUERY):
+                pass
+            ttfts.append(pipe.last_report["ttft_s"])
+            fraction.append(pipe.last_report["scored"] / pipe.last_report["total"])
+        top_text, top_media, _ = pipe.select(QUERY)
+        ttfts.sort()
+        print(f"[pipe/{name:6s}] ttft p50={ttfts[len(ttfts) // 2] * 1000:7.1f}ms  "
+              f"scored={sum(fraction) / len(fraction):4.0%}  "
+              f"top-k 与全量重排重合={len(key(top_text + top_media) & key(ref)) / len(ref):4.0%}")
+
+    reason_fn.close()
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
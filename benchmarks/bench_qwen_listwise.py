@@ -0,0 +1,61 @@
+"""
+Qwenvl_Reranker 打分模式基准：pointwise（每候选一次调用）vs listwise（每次调用一组候选）
+用法：python benchmarks/bench_qwen_listwise.py [--n 200] [--group_size 8] [--drop_rate 0.05]
+
+远程调用由 benchmarks/stubs.py 的 Fake_QwenVL 代替，报告端到端耗时、远程调用次数、
+两种模式 top-k 的一致率；drop_rate > 0 时同时验证缺失候选的逐条补打分。
+"""
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from langchain.docstore.document import Document
+from stubs import Fake_QwenVL
+from rag_pipeline.reranking import Qwenvl_Reranker
+
+WORDS = ("signal transform fourier convolution kernel frequency filter sampling "
+         "spectrum noise matrix gradient theorem domain").split()
+
+
+def make_parents(n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    return [
+        Document(page_content=" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 200))),
+                 metadata={"type": "parent" if i % 5 else "table", "book_idx": 0, "page_idx": i})
+        for i in range(n)
+    ]
+
+
+def run(mode: str, args, parents, query):
+    stub = Fake_QwenVL(base_ms=args.base_ms, per_item_ms=args.per_item_ms, drop_rate=args.drop_rate)
+    rr   = Qwenvl_Reranker(mode=mode, group_size=args.group_size, call_fn=stub)
+    t0   = time.perf_counter()
+    top_text, top_media = rr.rerank_parents(query, parents, args.topk, args.topk, batch=args.batch)
+    return time.perf_counter() - t0, stub, top_text + top_media
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n",           type=int,   default=200)
+    parser.add_argument("--group_size",  type=int,   default=8)
+    parser.add_argument("--batch",       type=int,   default=5)
+    parser.add_argument("--topk",        type=int,   default=20)
+    parser.add_argument("--base_ms",     type=float, default=400.0)
+    parser.add_argument("--per_item_ms", type=float, default=30.0)
+    parser.add_argument("--drop_rate",   type=float, default=0.0)
+    args = parser.parse_args()
+
+    query   = "convolution theorem frequency domain"
+    parents = make_parents(args.n)
+
+    t_pw, s_pw, top_pw = run("pointwise", args, parents, query)
+    t_lw, s_lw, top_lw = run("listwise",  args, parents, query)
+
+    ids = lambda docs: {d.metadata["page_idx"] for d in docs}
+    print(f"pointwise: {t_pw:6.2f}s  {s_pw.calls:4d} calls")
+    print(f"listwise : {t_lw:6.2f}s  {s_lw.calls:4d} calls  (group_size={args.group_size}, drop_rate={args.drop_rate})")
+    print(f"speed-up: {t_pw / t_lw:.2f}x   top-k agreement: {len(ids(top_pw) & ids(top_lw)) / max(len(top_pw), 1):.2%}")
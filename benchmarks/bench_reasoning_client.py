@@ -0,0 +1,114 @@
+"""
+DeepSeek_Client 基准：对本地 OpenAI 兼容桩服务做流式推理
+用法：python benchmarks/bench_reasoning_client.py [--n 50] [--concurrency 8] [--connect_ms 0]
+
+对比：每次调用新建 HTTP 客户端（DeepSeek_Stream 原做法）vs 长驻连接池客户端，
+报告首 token 延迟 p50 / p99 与服务端累计建立的连接数；
+另验证 async 并发流、提前中断时上游流被关闭（服务端记为 disconnect）以及 <think> 标记。
+--connect_ms 在每次新建连接时额外等待，粗略模拟真实环境的 TLS 握手开销。
+"""
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from stubs import Fake_OpenAI_Server
+from rag_pipeline.reasoning import DeepSeek_Client
+
+MESSAGES = [{"role": "user", "content": "Explain Fourier transform."}]
+
+
+def pct(vals, q):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(round(q / 100 * (len(vals) - 1))))] * 1000 if vals else 0.0
+
+
+def patch_connect_delay(ms: float):
+    if ms <= 0:
+        return
+    import httpcore._backends.sync as backend
+    orig = backend.SyncBackend.connect_tcp
+
+    def slow_connect(self, *args, **kwargs):
+        time.sleep(ms / 1000)
+        return orig(self, *args, **kwargs)
+
+    backend.SyncBackend.connect_tcp = slow_connect
+
+
+def run_sync(base_url, n, persistent: bool):
+    ttft = []
+    client = DeepSeek_Client(model="stub", api_key="sk-stub", base_url=base_url)
+    for _ in range(n):
+        if not persistent:
+            client = DeepSeek_Client(model="stub", api_key="sk-stub", base_url=base_url)
+        t0 = time.perf_counter()
+        it = client.stream(MESSAGES)
+        next(it)
+        ttft.append(time.perf_counter() - t0)
+        for _ in it:
+            pass
+        if not persistent:
+            client.close()
+    client.close()
+    return ttft
+
+
+async def run_async(base_url, n, concurrency):
+    client = DeepSeek_Client(model="stub", api_key="sk-stub", base_url=base_url)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            return "".join([tok async for tok in client.astream(MESSAGES)])
+
+    outs = await asyncio.gather(*(one() for _ in range(n)))
+    await client.aclose()
+    return outs, client.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n",           type=int,   default=50)
+    parser.add_argument("--concurrency", type=int,   default=8)
+    parser.add_argument("--connect_ms",  type=float, default=0.0)
+    parser.add_argument("--token_ms",    type=float, default=2.0)
+    args = parser.parse_args()
+    patch_connect_delay(args.connect_ms)
+
+    for persistent in (False, True):
+        stub = Fake_OpenAI_Server(capacity=10 ** 6, token_ms=args.token_ms)
+        base_url = stub.start()
+        ttft = run_sync(base_url, args.n, persistent)
+        stub.stop()
+        name = "persistent" if persistent else "per-call"
+        print(f"[sync {name:10s}] ttft p50={pct(ttft, 50):6.1f}ms p99={pct(ttft, 99):6.1f}ms "
+              f"connections={stub.counts['connections']}")
+
+    stub = Fake_OpenAI_Server(capacity=10 ** 6, token_ms=args.token_ms)
+    base_url = stub.start()
+    t0 = time.perf_counter()
+    outs, stats = asyncio.run(run_async(base_url, args.n, args.concurrency))
+    wall = time.perf_counter() - t0
+    ok = all(o.startswith("<think>r0 ") and "</think>a0 " in o for o in outs)
+    print(f"[async x{args.concurrency}] {args.n} 个流 {wall:.2f}s  <think> 标记正确={ok}  "
+          f"ttft p50={stats['ttft']['p50_ms']:.1f}ms connections={stub.counts['connections']}")
+
+    # 提前中断：读到 3 个 token 后放弃，上游连接应被关闭
+    client = DeepSeek_Client(model="stub", api_key="sk-stub", base_url=base_url)
+    stub.token_ms = 50.0
+    it = client.stream(MESSAGES)
+    head = [next(it) for _ in range(3)]
+    it.close()
+    time.sleep(0.3)
+    print(f"[cancel] 已读 {head}，客户端 {client.stats()['cancelled']} 个流取消，"
+          f"服务端 disconnects={stub.counts['disconnects']}")
+    client.close()
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+子块重排评估：整页父块打分（rerank_parents）vs 命中子块打分 + 父块聚合（rerank_parents_by_children）
+用法：
+    python benchmarks/eval_child_rerank.py --model_dir ./models/MiniLM-L-6-v2 \
+        --queries queries.txt --parents mm_parents.json --children mm_children.json [--pool max]
+
+queries 文件每行一个 query。对每个 query 先混合检索出父块及其命中子块，
+再分别用两种方式打分，报告：
+    • 父块排序的 Kendall tau（文本 / 多媒体分别计算后合并平均）
+    • top-k 重合率
+    • 每个 query 的前向 (query, context) 对数与耗时
+"""
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from scipy.stats import kendalltau
+from rag_pipeline.retrieval import Hybrid_Retriever, load_serialized_docs, qwen_configs
+from rag_pipeline.reranking import CrossEncoder_Reranker
+
+
+def topk_overlap(a, b, k):
+    ta = set(sorted(range(len(a)), key=lambda i: a[i], reverse=True)[:k])
+    tb = set(sorted(range(len(b)), key=lambda i: b[i], reverse=True)[:k])
+    return len(ta & tb) / max(min(k, len(a)), 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir",  type=str, required=True)
+    parser.add_argument("--queries",    type=str, required=True)
+    parser.add_argument("--parents",    type=str, default="/data/huali_mm/chunks/mm_parents.json")
+    parser.add_argument("--children",   type=str, default="/data/huali_mm/chunks/mm_children.json")
+    parser.add_argument("--dense_model", type=str, default="./models/Qwen3-Embedding-0.6B")
+    parser.add_argument("--index_path", type=str, default="./indexes/qwen/mm_hier_index")
+    parser.add_argument("--pool",       type=str, default="max", choices=["max", "mean"])
+    parser.add_argument("--topk",       type=int, default=20)
+    parser.add_argument("--batch_size", type=int, default=32)
+    args = parser.parse_args()
+
+    configs = {**qwen_configs, "DENSE_MODEL": args.dense_model, "INDEX_PATH": args.index_path}
+    hret = Hybrid_Retriever((load_serialized_docs(args.children),
+                             load_serialized_docs(args.parents)), configs)
+    rr   = CrossEncoder_Reranker(args.model_dir, batch_size=args.batch_size)
+
+    with open(args.queries, encoding="utf-8") as f:
+        queries = [q.strip() for q in f if q.strip()]
+
+    taus, overlaps = [], []
+    t_full, t_child, n_full, n_child = [], [], [], []
+    for query in queries:
+        parents, matched = hret.hybrid_retrieve_parents(query, with_children=True)
+        if len(parents) < 2:
+            continue
+
+        t0 = time.perf_counter()
+        s_full = rr._score_blocks(query, parents)
+        t_full.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        s_child = rr.score_parents_by_children(query, parents, matched, pool=args.pool)
+        t_child.append(time.perf_counter() - t0)
+
+        n_full.append(len(parents))
+        n_child.append(sum(len(kids) or 1 for kids in matched))
+
+        # 与 rerank_parents 一致：文本、多媒体各自排序
+        for group in ({"parent", "text"}, {"image", "table"}):
+            idx = [i for i, p in enumerate(parents) if p.metadata.get("type") in group]
+            if len(idx) < 2:
+                continue
+            a = [s_full[i] for i in idx]
+            b = [s_child[i] for i in idx]
+            tau = kendalltau(a, b)[0]
+            if tau == tau:                                # 排除 NaN（分数全相同）
+                taus.append(tau)
+            overlaps.append(topk_overlap(a, b, args.topk))
+
+    if not n_full:
+        sys.exit("没有可评估的 query")
+
+    print(f"queries evaluated : {len(n_full)}   pool={args.pool}")
+    if taus:
+        print(f"Kendall tau       : mean={statistics.mean(taus):.3f}  median={statistics.median(taus):.3f}")
+    print(f"top-{args.topk} overlap    : {statistics.mean(overlaps):.2%}")
+    print(f"pairs / query     : full={statistics.mean(n_full):.1f}  children={statistics.mean(n_child):.1f}")
+    print(f"ms / query        : full={statistics.mean(t_full) * 1000:.1f}  "
+          f"children={statistics.mean(t_child) * 1000:.1f}  "
+          f"speed-up={sum(t_full) / max(sum(t_child), 1e-9):.2f}x")
@@ -0,0 +1,229 @@
+"""
+本地桩服务：代替远程模型做基准 / 回归，不产生任何网络请求与费用
+
+Fake_QwenVL(messages) -> str
+    • 与 Qwenvl_Reranker 的 call_fn 接口一致
+    • 分数 = query 词与候选词的重合比例（确定性），pointwise / listwise 对同一候选给出相同分数
+    • 延迟 = base_ms + per_item_ms * 候选数 + per_image_ms * 图片数，模拟远程 RTT 与生成开销
+    • drop_rate 按概率在 listwise 回复中漏掉部分候选，用于验证逐条补打分
+    • tail_prob 按概率额外注入 tail_ms 的延迟，模拟长尾慢请求（用于对冲基准）
+
+Fake_OpenAI_Server(...).start() -> base_url
+    • 本地 HTTP 服务，实现 OpenAI 兼容的 POST /chat/completions，供 DashScope_AsyncClient 测试
+    • 同时在处理的请求数超过 capacity 时返回 429，模拟服务端限流
+    • error_rate 按概率返回 500；回复内容由 Fake_QwenVL 的打分规则生成
+    • 请求体 stream=true 时以 SSE 逐块返回 stream_reasoning 个思考 token + stream_answer 个正文 token，
+      块间隔 token_ms；客户端提前断开记入 counts["disconnects"]
+    • GET /models 供客户端预热；counts["connections"] 为累计建立的 TCP 连接数（用于验证连接复用）
+"""
+import re
+import json
+import time
+import socket
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def overlap_score(query: str, text: str) -> float:
+    q = set(query.lower().split())
+    t = set(text.lower().split())
+    return round(len(q & t) / len(q), 3) if q else 0.0
+
+
+class Fake_QwenVL():
+
+    def __init__(self,
+                 base_ms: float = 400.0,
+                 per_item_ms: float = 30.0,
+                 per_image_ms: float = 150.0,
+                 drop_rate: float = 0.0,
+                 tail_prob: float = 0.0,
+                 tail_ms: float = 3000.0,
+                 seed: int = 0):
+        self.tail_prob    = tail_prob
+        self.tail_ms      = tail_ms
+        self.base_ms      = base_ms
+        self.per_item_ms  = per_item_ms
+        self.per_image_ms = per_image_ms
+        self.drop_rate    = drop_rate
+        self._rnd   = random.Random(seed)
+        self._lock  = threading.Lock()
+        self.calls  = 0
+        self.items  = 0
+
+
+    def __call__(self, messages: list) -> str:
+        parts  = messages[-1]["content"]
+        text   = "".join(p.get("text", "") for p in parts)
+        images = sum("image" in p for p in parts)
+        query  = re.search(r"Query: (.*?)\n", text).group(1)
+
+        listwise = re.findall(r"\[(\d+)\] \(\w+\)\n(.*?)\n(?=\[\d+\] \(|\n请分别)", text, re.S)
+        n = len(listwise) if listwise else 1
+        with self._lock:
+            self.calls += 1
+            self.items += n
+            drops = [self._rnd.random() < self.drop_rate for _ in range(n)]
+            tail  = self.tail_ms if self._rnd.random() < self.tail_prob else 0.0
+        time.sleep((self.base_ms + self.per_item_ms * n + self.per_image_ms * images + tail) / 1000)
+
+        if not listwise:
+            ctx = re.search(r"Context \(\w+\):\n(.*?)\n\n请给出", text, re.S).group(1)
+            return str(overlap_score(query, ctx))
+        return json.dumps({no: overlap_score(query, ctx)
+                           for (no, ctx), drop in zip(listwise, drops) if not drop})
+
+
+
+class Fake_OpenAI_Server():
+
+    def __init__(self,
+                 capacity: int = 8,
+                 latency_ms: float = 200.0,
+                 error_rate: float = 0.0,
+                 retry_after: float = None,
+                 stream_reasoning: int = 8,
+                 stream_answer: int = 8,
+                 token_ms: float = 5.0,
+                 seed: int = 0):
+        self.stream_reasoning = stream_reasoning
+        self.stream_answer    = stream_answer
+        self.token_ms         = token_ms
+        self.capacity    = capacity
+        self.latency_ms  = latency_ms
+        self.error_rate  = error_rate
+        self.retry_after = retry_after
+        self.responder   = Fake_QwenVL(base_ms=0, per_item_ms=0, per_image_ms=0)
+        self._rnd   = random.Random(seed)
+        self._lock  = threading.Lock()
+        self.in_flight = 0
+        self.counts = {"ok": 0, "throttled": 0, "errors": 0, "peak_in_flight": 0,
+                       "connections": 0, "streams": 0, "disconnects": 0}
+        self._httpd = None
+
+
+    @staticmethod
+    def to_native(messages: list) -> list:
+        out = []
+        for m in messages:
+            content = m["content"]
+            if isinstance(content, list):
+                content = [{"image": p["image_url"]["url"]} if p.get("type") == "image_url"
+                           else {"text": p.get("text", "")} for p in content]
+            out.append({"role": m["role"], "content": content})
+        return out
+
+
+    def _handle(self, body: dict):
+        with self._lock:
+            self.in_flight += 1
+            self.counts["peak_in_flight"] = max(self.counts["peak_in_flight"], self.in_flight)
+            over  = self.in_flight > self.capacity
+            error = self._rnd.random() < self.error_rate
+        try:
+            if over:
+                self.counts["throttled"] += 1
+                return 429, {"error": {"message": "rate limited"}}
+            time.sleep(self.latency_ms / 1000)
+            if error:
+                self.counts["errors"] += 1
+                return 500, {"error": {"message": "internal error"}}
+            reply = self.responder(self.to_native(body["messages"]))
+            self.counts["ok"] += 1
+            return 200, {"choices": [{"message": {"role": "assistant", "content": reply}}]}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+    def _stream_chunks(self):
+        def chunk(delta):
+            return {"choices": [{"index": 0, "delta": delta}]}
+
+        yield chunk({"role": "assistant", "content": ""})
+        for i in range(self.stream_reasoning):
+            time.sleep(self.token_ms / 1000)
+            yield chunk({"reasoning_content": f"r{i} "})
+        for i in range(self.stream_answer):
+            time.sleep(self.token_ms / 1000)
+            yield chunk({"content": f"a{i} "})
+
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.counts["connections"] += 1
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionResetError:
+                    pass
+
+            def _send_json(self, code, obj):
+                data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self):
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)   # 流式小包不等 ACK
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                server.counts["streams"] += 1
+                try:
+                    for c in server._stream_chunks():
+                        self._write_chunk(f"data: {json.dumps(c, ensure_ascii=False)}\n\n")
+                    self._write_chunk("data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                    server.counts["ok"] += 1
+                except (BrokenPipeError, ConnectionResetError):
+                    server.counts["disconnects"] += 1
+                    self.close_connection = True
+
+            def _write_chunk(self, text):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                self._send_json(200, {"object": "list", "data": []})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if body.get("stream"):
+                    return self._send_stream()
+                code, obj = server._handle(body)
+                data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if code == 429 and server.retry_after is not None:
+                    self.send_header("Retry-After", str(server.retry_after))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return f"http://{host}:{self._httpd.server_address[1]}"
+
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
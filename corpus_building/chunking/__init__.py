@@ -1,2 +1,13 @@
-from .hierarchical_chunking import *  
-from .trivial_chunking import *
\ No newline at end of file
+"""
+懒加载：访问某个名字时才导入对应子模块（及其 langchain / tiktoken 依赖），
+`import` 本包本身不产生任何副作用。
+"""
+from rag_pipeline.lazy import lazy_exports
+
+_LAZY_ATTRS = {
+    "Hier_TextSplitter": ".hierarchical_chunking",
+    "TextSplitter":      ".trivial_chunking",
+}
+__all__ = list(_LAZY_ATTRS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _LAZY_ATTRS)
@@ -1,12 +1,14 @@
+from __future__ import annotations
 import json
-import tiktoken
 from collections import defaultdict
-from typing import List, Dict, Tuple
-from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from typing import TYPE_CHECKING, List, Dict, Tuple
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
 
 class Hier_TextSplitter:
     def count_tokens(self, text: str, encoding_name: str = "o200k_base") -> int:
+        import tiktoken
         enc = tiktoken.get_encoding(encoding_name)
         return len(enc.encode(text))
 
@@ -22,6 +24,9 @@ class Hier_TextSplitter:
           parents  : 供 LLM 使用的父块（page 级文本 + image/table 原文）
           children : 供稠密/稀疏检索的子块（text/equation 滑窗 + image/table 自身）
         """
+        from langchain.docstore.document import Document
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
         page_text: Dict[Tuple[int, int], List[str]] = defaultdict(list)
     
         parents:  List[Document] = []
@@ -1,12 +1,14 @@
-import tiktoken
-from typing import List
-from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from __future__ import annotations
+from typing import TYPE_CHECKING, List
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
 
 
 class TextSplitter:
     # ---------- 1. 计数工具 ----------
     def count_tokens(self, text: str, encoding_name: str = "o200k_base") -> int:
+        import tiktoken
         enc = tiktoken.get_encoding(encoding_name)
         return len(enc.encode(text))
 
@@ -23,6 +25,9 @@ class TextSplitter:
         - 直接按 `chunk_size` & `chunk_overlap` 切块
         - 返回统一的 List[Document]
         """
+        from langchain.docstore.document import Document
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
         splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
             model_name="gpt-4o",
             chunk_size=chunk_size,
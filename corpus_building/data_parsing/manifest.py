@@ -0,0 +1,172 @@
+import os
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """PDF 内容哈希（blake2b-128，流式读取，不受文件名 / 修改时间影响）"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+
+class Ingest_Manifest():
+    """
+    PDF 书库的增量入库清单：内容哈希 → 解析结果 → 稳定的 book_idx
+    --------------------------------------------------------------
+    • 每本书一条记录 books[hash] = {book_idx, file, size, mtime_ns, content_list, pages, status, parsed_at}
+    • book_idx 一经分配不再改变：新书取 next_id 递增；只改了文件名的书（内容哈希相同）沿用原编号；
+      同名文件内容变化时沿用旧编号并替换旧记录（下游应整本替换该 book_idx 的数据）
+    • 书库中已不存在的书标记为 removed（保留编号，不会被新书复用）
+    • 文件 (路径, 大小, mtime) 与记录一致时直接复用记录中的哈希，不重新读整个 PDF
+    • save() 先写临时文件再 os.replace，中途被杀不会留下半个清单
+    plan() 给出本次需要解析的文件与变化集合，merge() 按稳定编号合并全部书，merge_delta() 写出供下游增量处理的变化
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: "str | Path"):
+        self.path = Path(path)
+        self.data = {"version": self.VERSION, "next_id": 0, "books": {}}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    @property
+    def books(self) -> Dict[str, dict]:
+        return self.data["books"]
+
+
+    def _hash(self, path: str, known: Dict[str, tuple]) -> str:
+        st  = os.stat(path)
+        hit = known.get(os.path.abspath(path))
+        if hit is not None and hit[:2] == (st.st_size, st.st_mtime_ns):
+            return hit[2]
+        return file_hash(path)
+
+
+    def plan(self, pdf_paths: List[str]) -> Tuple[List[Tuple[str, str]], dict]:
+        """
+        返回 (todo, changes)：
+            todo    : [(pdf 路径, 内容哈希), ...] 需要（重新）解析的文件，已分配好 book_idx
+            changes : {"added": [...], "updated": [...], "removed": [...], "unchanged": [...]}（均为 book_idx）
+        """
+        known   = {rec.get("path"): (rec.get("size"), rec.get("mtime_ns"), h) for h, rec in self.books.items()}
+        current = {}
+        for p in sorted(pdf_paths):
+            current.setdefault(self._hash(p, known), p)    # 内容完全相同的两个文件只解析一次
+
+        by_name = {rec["file"]: h for h, rec in self.books.items()
+                   if rec.get("status") != "removed" and h not in current}
+        changes = {"added": [], "updated": [], "removed": [], "unchanged": []}
+        todo = []
+
+        for h, p in current.items():
+            st  = os.stat(p)
+            rec = self.books.get(h)
+            if rec is not None and rec.get("status") == "ok" and os.path.exists(rec.get("content_list") or ""):
+                rec.update(file=os.path.basename(p), path=os.path.abspath(p),
+                           size=st.st_size, mtime_ns=st.st_mtime_ns)
+                changes["unchanged"].append(rec["book_idx"])
+                continue
+
+            if rec is not None:                                # 上次解析失败 / 已移除后又放回来
+                book_idx = rec["book_idx"]
+                changes["added"].append(book_idx)
+            elif os.path.basename(p) in by_name:               # 同名文件内容变了：沿用旧编号
+                old = by_name.pop(os.path.basename(p))
+                book_idx = self.books.pop(old)["book_idx"]
+                changes["updated"].append(book_idx)
+            else:
+                book_idx = self.data["next_id"]
+                self.data["next_id"] += 1
+                changes["added"].append(book_idx)
+
+            self.books[h] = {"book_idx": book_idx, "file": os.path.basename(p), "path": os.path.abspath(p),
+                             "size": st.st_size, "mtime_ns": st.st_mtime_ns, "status": "pending"}
+            todo.append((p, h))
+
+        for h, rec in self.books.items():
+            if h not in current and rec.get("status") != "removed":
+                rec["status"] = "removed"
+                changes["removed"].append(rec["book_idx"])
+        return todo, changes
+
+
+    def record(self, h: str, status: str, content_list: Optional[str] = None, pages: int = 0):
+        """登记一本书的解析结果（status: ok / failed / timeout / crashed）"""
+        rec = self.books[h]
+        rec.update(status="ok" if status == "ok" else "failed",
+                   content_list=content_list, pages=pages,
+                   parsed_at=datetime.now().isoformat(timespec="seconds"))
+        if status != "ok":
+            rec["error"] = status
+
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".manifest-", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+
+    def book_ids(self, status: str = "ok") -> Dict[str, int]:
+        return {h: rec["book_idx"] for h, rec in self.books.items() if rec.get("status") == status}
+
+
+    def _items(self, only: Optional[List[int]] = None) -> list:
+        wanted  = set(only) if only is not None else None
+        records = sorted((rec for rec in self.books.values() if rec.get("status") == "ok"),
+                         key=lambda r: r["book_idx"])
+        all_instances = []
+        for rec in records:
+            if wanted is not None and rec["book_idx"] not in wanted:
+                continue
+            with open(rec["content_list"], encoding="utf-8") as f:
+                items = json.load(f)
+            for inst in items:
+                inst["book_idx"] = rec["book_idx"]
+            all_instances.extend(items)
+        return all_instances
+
+
+    @staticmethod
+    def _dump(obj, output_file: "str | Path"):
+        Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+
+
+    def merge(self, output_file: "str | Path", only: Optional[List[int]] = None) -> int:
+        """
+        按稳定 book_idx 合并各书的 content_list（与 merge_corpus 的输出格式相同）；
+        only 非空时只合并这些 book_idx，返回合并的条目数
+        """
+        items = self._items(only)
+        self._dump(items, output_file)
+        return len(items)
+
+
+    def merge_delta(self, output_file: "str | Path", changes: dict) -> int:
+        """
+        写出本次运行的增量文件，下游（load_corpus_mm → apply_docs_delta → 切块 → update_faiss_index）按它增量更新：
+            {"added": [...], "updated": [...], "removed": [...], "failed": [...],
+             "drop_books": 下游需先整本删除的 book_idx（updated + removed + failed），
+             "items":      新增 / 更新书的全部条目（与 merge 的格式相同）}
+        返回 items 条数
+        """
+        changed = changes["added"] + changes["updated"]
+        delta = {k: sorted(changes.get(k, [])) for k in ("added", "updated", "removed", "failed")}
+        delta["drop_books"] = sorted(set(changes["updated"] + changes["removed"] + changes.get("failed", [])))
+        delta["items"]      = self._items(changed)
+        self._dump(delta, output_file)
+        return len(delta["items"])
@@ -1,10 +1,10 @@
-import os, uuid, argparse, json
-from magic_pdf.data.data_reader_writer import FileBasedDataWriter, FileBasedDataReader
-from magic_pdf.data.dataset import PymuDocDataset
-from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
-from magic_pdf.config.enums import SupportedPdfParseMethod
+import os, uuid, argparse, json, shutil
+from pathlib import Path
+from functools import partial
 from datetime import datetime
 from .utils import download_json, download_and_modify_json
+from .parallel import Parallel_Parser, print_summary
+from .manifest import Ingest_Manifest
 
 
 
@@ -16,6 +16,12 @@ def process_single_pdf(pdf_file_name, output_dir, image_subdir, simple_output):
     :param image_subdir: 图片子目录名，默认为'images'
     :param simple_output: 是否使用简单输出模式
     """
+    # MinerU 依赖较重，只在真正解析时导入（并行模式下在各 worker 进程内导入）
+    from magic_pdf.data.data_reader_writer import FileBasedDataWriter, FileBasedDataReader
+    from magic_pdf.data.dataset import PymuDocDataset
+    from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
+    from magic_pdf.config.enums import SupportedPdfParseMethod
+
     # 从PDF绝对路径获取不带后缀的文件名
     name_without_suff = os.path.splitext(os.path.basename(pdf_file_name))[0]
     # 生成唯一标识符
@@ -76,7 +82,7 @@ def process_single_pdf(pdf_file_name, output_dir, image_subdir, simple_output):
 def merge_corpus(CORPUS_PATH, OUTPUT_FILE):
     all_instances = []
 
-    json_files = sorted(CORPUS_PATH.rglob("*.json"))  
+    json_files = sorted(Path(CORPUS_PATH).rglob("*.json"))
     for book_idx, json_file in enumerate(json_files):
         with open(json_file, "r", encoding="utf-8") as f:
             try:
@@ -99,13 +105,41 @@ def merge_corpus(CORPUS_PATH, OUTPUT_FILE):
 
 
 
+def _load_models():
+    """并行模式下每个 worker 启动时调用一次：导入 MinerU 并预加载版面分析 / OCR 模型，之后的文件复用"""
+    import magic_pdf.model.doc_analyze_by_custom_model as analyze
+
+    try:
+        from magic_pdf.libs.config_reader import get_layout_config, get_table_recog_config, get_formula_config
+        analyze.ModelSingleton().get_model(False, False, None, get_layout_config()["model"],
+                                           get_formula_config()["enable"], get_table_recog_config()["enable"])
+    except Exception as e:
+        # 不同 MinerU 版本的接口不同：预加载失败时退回到首个文件解析时再加载（同一 worker 内仍只加载一次）
+        print(f"[Warn] 预加载 MinerU 模型失败，改为首次解析时加载: {e}")
+
+
+def _parse_one(pdf_file_name, output_dir, image_subdir, simple_output) -> int:
+    """默认的单文件任务：MinerU 解析并返回页数（用于统计 pages/s）"""
+    import fitz
+
+    process_single_pdf(pdf_file_name, output_dir, image_subdir, simple_output)
+    with fitz.open(pdf_file_name) as doc:
+        return doc.page_count
+
+
+
 def parse_pdfs(file_root: str,  # 知识库文件根目录, 解析该路径下的所有文件
                # parse_output_dir: str, # 解析结果保存根目录, 即merge_corpus的第一个输入变量, 直接默认file_root下面创建一个文件夹就行了
                output_dir: str, # 合并后的最终解析结果保存目录, 即merge_corpus的第二个输入变量,
                image_dir: str = "/data/huali_mm/images", # 媒体文件保存根目录
                config_dir: str = "magic-pdf.json", # 配置文件路径
-               simple_output: bool = True
-              )
+               simple_output: bool = True,
+               workers: int = 1, # >1 时用进程池并行解析，每个 worker 各自加载一份模型
+               timeout_s: float = 3600.0, # 并行模式下单个文件的超时时间（秒），超时的文件跳过
+               parse_fn=None, # 单文件任务 parse_fn(pdf 路径, 输出目录) -> 页数（可 pickle），默认 MinerU；测试时可换成桩函数
+               init_fn=None, # 并行模式 worker 启动时的初始化函数，默认预加载 MinerU 模型
+               manifest: str = None # 增量入库清单路径（json），给定时只解析新增 / 变化的 PDF，book_idx 跨次运行保持不变
+              ):
 
     # 下载并修改配置json文件
     # json_url = 'https://gcore.jsdelivr.net/gh/opendatalab/MinerU@master/magic-pdf.template.json'
@@ -118,16 +152,105 @@ def parse_pdfs(file_root: str,  # 知识库文件根目录, 解析该路径下
 
     file_list = [f for f in os.listdir(file_root) if f.lower().endswith('.pdf')]
     # parse_file_list = []
+    if manifest is not None:
+        return _parse_incremental(file_root, file_list, output_dir, image_dir, simple_output,
+                                  workers, timeout_s, parse_fn, init_fn, manifest)
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M")
     parse_output_dir = os.path.join(file_root, f'parsed_{timestamp}')
     os.makedirs(parse_output_dir, exist_ok=True)
-    for file in file_list:
-        file_dir = process_single_pdf(pdf_file_name = os.path.join(file_root, file),
-                                      output_dir    = parse_output_dir,
-                                      image_subdir  = image_dir,
-                                      simple_output = simple_output)
-        # parse_file_list.append(file_dir)
-        
+    if workers > 1 or parse_fn is not None:
+        # 并行模式：单个文件失败 / 超时 / 崩溃只跳过该文件，结束后打印吞吐与失败汇总
+        parser = Parallel_Parser(
+            parse_fn  = partial(_parse_into,
+                                parse_fn   = parse_fn or partial(_parse_one, image_subdir=image_dir,
+                                                                 simple_output=simple_output),
+                                output_dir = parse_output_dir),
+            workers   = workers,
+            timeout_s = timeout_s,
+            init_fn   = init_fn if parse_fn is not None else (init_fn or _load_models),
+        )
+        summary = parser.run(os.path.join(file_root, f) for f in sorted(file_list))
+        print_summary(summary)
+    else:
+        for file in file_list:
+            file_dir = process_single_pdf(pdf_file_name = os.path.join(file_root, file),
+                                          output_dir    = parse_output_dir,
+                                          image_subdir  = image_dir,
+                                          simple_output = simple_output)
+            # parse_file_list.append(file_dir)
+
     merge_corpus(parse_output_dir, output_dir)
-    
+
+
+def _parse_into(pdf_file_name, parse_fn, output_dir=None, out_dirs=None) -> int:
+    """Parallel_Parser 只传文件路径：在这里补上输出目录（增量模式下由清单按 book_idx 给每本书分配）"""
+    return parse_fn(pdf_file_name, out_dirs[pdf_file_name] if out_dirs is not None else output_dir)
+
+
+def _content_list_path(out_dir, pdf_file_name) -> str:
+    stem = os.path.splitext(os.path.basename(pdf_file_name))[0]
+    return os.path.join(out_dir, stem, f"{stem}_content_list.json")
+
+
+def _parse_incremental(file_root, file_list, output_dir, image_dir, simple_output,
+                       workers, timeout_s, parse_fn, init_fn, manifest_path) -> dict:
+    """
+    增量入库：按内容哈希比对清单，只解析新增 / 内容变化（以及上次失败）的 PDF
+    • 解析结果固定放在 file_root/parsed/book_<book_idx>/ 下（不再按时间戳新建目录），下次运行直接复用
+    • 每个文件结束即写回清单，中途中断后重跑只会继续未完成的文件
+    • output_dir 写入全部书的合并结果（book_idx 稳定）；同目录下 <名>.delta.json 是本次的增量
+      （格式见 Ingest_Manifest.merge_delta），下游只处理变化的书：
+          new_docs = load_corpus_mm(delta_file, ...)                 # 只对新增 / 更新的书生成图注
+          docs     = apply_docs_delta(old_docs, new_docs, delta_file) # 删掉 drop_books 的旧文档后并入
+          parents, children = Hier_TextSplitter().split_docs(docs)    # 切块只是 CPU 计算，整体重跑保证 parent_id 连续
+          update_faiss_index(children, configs, delta_file)           # 未变化书的子块复用旧向量，只嵌入变化的书
+    """
+    mf = Ingest_Manifest(manifest_path)
+    todo, changes = mf.plan([os.path.join(file_root, f) for f in sorted(file_list)])
+    mf.save()
+    print(f"清单 {manifest_path}：新增 {len(changes['added'])}，更新 {len(changes['updated'])}，"
+          f"移除 {len(changes['removed'])}，未变化 {len(changes['unchanged'])}（跳过）")
+
+    parse_root = os.path.join(file_root, "parsed")
+    hashes     = dict(todo)
+    out_dirs   = {p: os.path.join(parse_root, f"book_{mf.books[h]['book_idx']:05d}") for p, h in todo}
+    for d in out_dirs.values():
+        shutil.rmtree(d, ignore_errors=True)           # 更新的书整本重解析，不残留旧文件
+
+    def done(path, status, pages):
+        mf.record(hashes[path], status,
+                  _content_list_path(out_dirs[path], path) if status == "ok" else None, pages)
+        mf.save()
+
+    if todo and (workers > 1 or parse_fn is not None):
+        parser = Parallel_Parser(
+            parse_fn  = partial(_parse_into,
+                                parse_fn = parse_fn or partial(_parse_one, image_subdir=image_dir,
+                                                               simple_output=simple_output),
+                                out_dirs = out_dirs),
+            workers   = workers,
+            timeout_s = timeout_s,
+            init_fn   = init_fn if parse_fn is not None else (init_fn or _load_models),
+        )
+        print_summary(parser.run((p for p, _ in todo), on_done=done))
+    else:
+        for path, _ in todo:
+            try:
+                pages = _parse_one(path, out_dirs[path], image_dir, simple_output)
+                done(path, "ok", pages)
+            except Exception as e:                     # 失败的书记入清单，下次运行自动重试
+                print(f"[Error] {os.path.basename(path)}: {e}")
+                done(path, "failed", 0)
+
+    changed = set(mf.book_ids("ok").values())
+    changes["failed"] = [i for i in changes["added"] + changes["updated"] if i not in changed]
+    changes["added"]   = [i for i in changes["added"] if i in changed]
+    changes["updated"] = [i for i in changes["updated"] if i in changed]
+
+    total = mf.merge(output_dir)
+    delta_file = os.path.splitext(output_dir)[0] + ".delta.json"
+    delta = mf.merge_delta(delta_file, changes)
+    print(f"Total merged instances: {total}（本次变化 {delta} 条）")
+    print(f"✅ Saved to {output_dir}，增量保存到 {delta_file}")
+    return changes
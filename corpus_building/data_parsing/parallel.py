@@ -0,0 +1,185 @@
+import os
+import time
+import traceback
+import multiprocessing as mp
+from multiprocessing.connection import wait
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+
+def _worker_main(conn, parse_fn, init_fn):
+    """
+    子进程主循环：先执行一次 init_fn（加载版面分析 / OCR 模型），之后逐个处理父进程发来的文件
+    parse_fn(path) 返回页数（int）或含 "pages" 的 dict
+    """
+    if init_fn is not None:
+        init_fn()
+    conn.send(("ready", None))
+    while True:
+        path = conn.recv()
+        if path is None:
+            break
+        t0 = time.perf_counter()
+        try:
+            out   = parse_fn(path)
+            pages = out.get("pages", 0) if isinstance(out, dict) else int(out or 0)
+            conn.send(("ok", (pages, time.perf_counter() - t0, None)))
+        except BaseException as e:                     # 单个文件失败不影响 worker 继续处理
+            err = f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}"
+            conn.send(("failed", (0, time.perf_counter() - t0, err)))
+    conn.close()
+
+
+
+class _Slot():
+    __slots__ = ("proc", "conn", "path", "t0", "ready")
+
+    def __init__(self, proc, conn):
+        self.proc, self.conn = proc, conn
+        self.path, self.t0, self.ready = None, 0.0, False
+
+
+
+class Parallel_Parser():
+    """
+    进程池并行解析 PDF（故障隔离版）
+    --------------------------------------------------------------
+    • workers 个常驻子进程，每个进程启动时调用一次 init_fn 加载模型，之后复用到所有分到的文件
+    • 每个 worker 同时只持有一个文件，父进程按需派发：待处理文件是惰性迭代的，
+      在途文件数不超过 workers（有界队列），不会一次把整个书库塞进管道
+    • 单文件超过 timeout_s 未完成时杀掉该 worker 并重启一个新的（重新加载模型），文件记为 timeout；
+      worker 崩溃（段错误 / OOM 被杀）时文件记为 crashed，同样重启；parse_fn 抛异常只记为 failed
+    • 默认 spawn 启动子进程，避免 fork 继承父进程的 CUDA 上下文
+    run(paths) 返回汇总：成功 / 失败文件数、总页数、耗时、pages/s 以及每个失败文件的原因
+    parse_fn / init_fn 必须可 pickle（模块级函数或 functools.partial），便于用桩函数替换 MinerU 做测试
+    """
+
+    def __init__(self,
+                 parse_fn: Callable,
+                 workers: int = os.cpu_count() or 1,
+                 timeout_s: Optional[float] = 3600.0,
+                 init_fn: Optional[Callable] = None,
+                 start_method: str = "spawn",
+                 poll_s: float = 0.5):
+        self.parse_fn  = parse_fn
+        self.workers   = workers
+        self.timeout_s = timeout_s
+        self.init_fn   = init_fn
+        self.poll_s    = poll_s
+        self._ctx      = mp.get_context(start_method)
+
+
+    def _spawn(self) -> _Slot:
+        parent, child = self._ctx.Pipe()
+        proc = self._ctx.Process(target=_worker_main, args=(child, self.parse_fn, self.init_fn), daemon=True)
+        proc.start()
+        child.close()
+        return _Slot(proc, parent)
+
+
+    @staticmethod
+    def _kill(slot: _Slot):
+        slot.proc.kill()
+        slot.proc.join()
+        slot.conn.close()
+
+
+    def run(self, paths: Iterable[str], on_done: Optional[Callable[[str, str, int], None]] = None) -> dict:
+        """on_done(path, status, pages) 在每个文件结束（ok / failed / timeout / crashed）时于父进程中调用"""
+        todo    = iter(paths)
+        slots   = [self._spawn() for _ in range(self.workers)]
+        summary = {"ok": 0, "failed": 0, "timeout": 0, "crashed": 0, "pages": 0, "restarts": 0}
+        failures: List[Dict[str, str]] = []
+        exhausted = False
+        t_start = time.perf_counter()
+
+        def finish(slot: _Slot, status: str, pages: int, seconds: float, err: Optional[str]):
+            summary[status] += 1
+            summary["pages"] += pages
+            if status != "ok":
+                failures.append({"path": slot.path, "status": status, "error": err or ""})
+                print(f"[Error] {os.path.basename(slot.path)} {status} ({seconds:.1f}s): {(err or '').splitlines()[0] if err else ''}")
+            else:
+                print(f"[OK] {os.path.basename(slot.path)}  {pages} 页  {seconds:.1f}s")
+            if on_done is not None:
+                on_done(slot.path, status, pages)
+            slot.path = None
+
+        def dispatch(slot: _Slot):
+            nonlocal exhausted
+            if exhausted or not slot.ready or slot.path is not None:
+                return
+            path = next(todo, None)
+            if path is None:
+                exhausted = True
+                return
+            slot.path, slot.t0 = path, time.perf_counter()
+            slot.conn.send(path)
+
+        try:
+            while True:
+                for slot in slots:
+                    dispatch(slot)
+                if exhausted and all(s.path is None for s in slots):
+                    break
+
+                for conn in wait([s.conn for s in slots if not s.conn.closed], timeout=self.poll_s):
+                    slot = next(s for s in slots if s.conn is conn)
+                    try:
+                        kind, payload = conn.recv()
+                    except (EOFError, OSError):
+                        continue                                # 进程已退出，下面按崩溃处理
+                    if kind == "ready":
+                        slot.ready = True
+                    else:
+                        finish(slot, kind, *payload)
+
+                now = time.perf_counter()
+                for i, slot in enumerate(slots):
+                    dead     = not slot.proc.is_alive()
+                    overtime = (slot.path is not None and self.timeout_s is not None
+                                and now - slot.t0 > self.timeout_s)
+                    if not dead and not overtime:
+                        continue
+                    if dead and not slot.ready:
+                        raise RuntimeError(f"worker 初始化失败（退出码 {slot.proc.exitcode}），请检查 init_fn / 模型配置")
+                    if slot.path is None and dead and exhausted:
+                        continue
+                    if slot.path is not None:
+                        status = "timeout" if overtime and not dead else "crashed"
+                        err    = (f"超过 {self.timeout_s:.0f}s" if status == "timeout"
+                                  else f"worker 退出码 {slot.proc.exitcode}")
+                        finish(slot, status, 0, now - slot.t0, err)
+                    self._kill(slot)
+                    if not exhausted:                           # 文件已派发完时不再补 worker
+                        slots[i] = self._spawn()
+                        summary["restarts"] += 1
+        finally:
+            for slot in slots:
+                if slot.conn.closed:
+                    continue
+                if slot.proc.is_alive() and slot.ready and slot.path is None:
+                    try:
+                        slot.conn.send(None)
+                    except OSError:
+                        pass
+                slot.proc.join(timeout=5)
+                if slot.proc.is_alive():
+                    self._kill(slot)
+
+        wall = time.perf_counter() - t_start
+        files = summary["ok"] + summary["failed"] + summary["timeout"] + summary["crashed"]
+        summary.update(files=files, wall_s=wall,
+                       pages_per_s=summary["pages"] / wall if wall > 0 else 0.0,
+                       files_per_s=files / wall if wall > 0 else 0.0,
+                       failures=failures)
+        return summary
+
+
+def print_summary(summary: dict):
+    print(f"共 {summary['files']} 个文件：成功 {summary['ok']}，失败 {summary['failed']}，"
+          f"超时 {summary['timeout']}，崩溃 {summary['crashed']}（重启 worker {summary['restarts']} 次）")
+    print(f"{summary['pages']} 页 / {summary['wall_s']:.1f}s = {summary['pages_per_s']:.2f} pages/s，"
+          f"{summary['files_per_s']:.3f} files/s")
+    for f in summary["failures"]:
+        print(f"  - [{f['status']}] {f['path']}")
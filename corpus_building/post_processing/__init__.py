@@ -1,3 +1,17 @@
-from .mm_caption import *
-from .trivial_process import *
-from .utils import *
+"""
+懒加载：访问某个名字时才导入对应子模块（及其 langchain / dashscope 依赖），
+`import` 本包本身不产生任何副作用。
+"""
+from rag_pipeline.lazy import lazy_exports
+
+_LAZY_ATTRS = {
+    "load_corpus_mm":      ".mm_caption",
+    "load_corpus_trivial": ".trivial_process",
+    "img_cap":             ".utils",
+    "analyze_kb_types":    ".utils",
+    "save_docs":           ".utils",
+    "apply_docs_delta":    ".utils",
+}
+__all__ = list(_LAZY_ATTRS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _LAZY_ATTRS)
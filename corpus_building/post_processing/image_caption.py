@@ -1,15 +1,20 @@
+from __future__ import annotations
 import os, json
-from tqdm import tqdm
-from typing import List
-from langchain.docstore.document import Document
+from typing import TYPE_CHECKING, List
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from .utils import _process_image_inst
+from .utils import _process_image_inst, load_kb_items
 
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+
+def load_corpus_image(KB_PATH, IMAGE_ROOT, parallel_image_workers: int = 16, client=None, hedger=None,
+                      image_cache=None) -> List[Document]:
+    from tqdm import tqdm
+    from langchain.docstore.document import Document
 
-def load_corpus_image(KB_PATH, IMAGE_ROOT, parallel_image_workers: int = 16) -> List[Document]:
     docs: List[Document] = []
-    with open(KB_PATH, encoding="utf-8") as f:
-        all_insts = json.load(f)
+    all_insts = load_kb_items(KB_PATH)
 
     # 1) 先把非 image 类型的都处理好
     image_insts = []
@@ -62,7 +67,7 @@ def load_corpus_image(KB_PATH, IMAGE_ROOT, parallel_image_workers: int = 16) ->
     # 2) 并行处理所有 image_inst
     with ThreadPoolExecutor(max_workers=parallel_image_workers) as ex:
         # 用 as_completed 可以加进度条
-        futures = { ex.submit(_process_image_inst, inst, IMAGE_ROOT): inst for inst in image_insts }
+        futures = { ex.submit(_process_image_inst, inst, IMAGE_ROOT, client, hedger, image_cache): inst for inst in image_insts }
         for fut in tqdm(as_completed(futures), total=len(futures), desc="Captioning images"):
             try:
                 docs.append(fut.result())
@@ -1,12 +1,15 @@
+from __future__ import annotations
 import os, json
-from tqdm import tqdm
-from typing import List
-from langchain.docstore.document import Document
+from typing import TYPE_CHECKING, List
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from .utils import _process_image_inst, _process_table_inst
+from .utils import _process_image_inst, _process_table_inst, load_kb_items
 
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
 
-def load_corpus_mm(KB_PATH, IMAGE_ROOT, parallel_image_workers: int = 16) -> List[Document]:
+
+def load_corpus_mm(KB_PATH, IMAGE_ROOT, parallel_image_workers: int = 16, client=None, hedger=None,
+                   image_cache=None) -> List[Document]:
     """
     读取 KB_PATH → 解析四类 inst → 并行调用 Qwen-VL
       · image  : 调用 _process_image_inst → caption+description
@@ -14,11 +17,18 @@ def load_corpus_mm(KB_PATH, IMAGE_ROOT, parallel_image_workers: int = 16) -> Lis
       · text   : 直接写入
       · equation: 直接写入
     返回统一的 docs 列表
+    client（DashScope_AsyncClient）非空时远程调用走共享客户端，
+    parallel_image_workers 只是上限，实际并发由其 AIMD 限流器按 429 / 延迟自适应；
+    不用 client 时可传 hedger 对慢请求补发副本；image_cache 非空时上传缩略图（metadata 中仍记原图路径）
+    KB_PATH 也可以是 parse_pdfs(manifest=...) 写出的 .delta.json：只处理其中新增 / 更新的书，
+    结果再经 apply_docs_delta 并入上次的 docs
     """
+    from tqdm import tqdm
+    from langchain.docstore.document import Document
+
     docs: List[Document] = []
     # ------- 读取原始 JSON -------
-    with open(KB_PATH, encoding="utf-8") as f:
-        all_insts = json.load(f)
+    all_insts = load_kb_items(KB_PATH)
 
     # ------- 按类型分桶 -------
     image_insts, table_insts = [], []
@@ -62,9 +72,9 @@ def load_corpus_mm(KB_PATH, IMAGE_ROOT, parallel_image_workers: int = 16) -> Lis
 
             # 提交任务
             for inst in image_insts:
-                fut2inst[ex.submit(_process_image_inst, inst, IMAGE_ROOT)] = ("image", inst)
+                fut2inst[ex.submit(_process_image_inst, inst, IMAGE_ROOT, client, hedger, image_cache)] = ("image", inst)
             for inst in table_insts:
-                fut2inst[ex.submit(_process_table_inst, inst, IMAGE_ROOT)] = ("table", inst)
+                fut2inst[ex.submit(_process_table_inst, inst, IMAGE_ROOT, client, hedger, image_cache)] = ("table", inst)
 
             # 收集结果
             for fut in tqdm(
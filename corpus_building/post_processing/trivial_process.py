@@ -1,16 +1,19 @@
+from __future__ import annotations
 import os, json
-from tqdm import tqdm
-from typing import List
+from typing import TYPE_CHECKING, List
 from .prompts import CAPTION_PROMPT
-from dashscope import MultiModalConversation
-from langchain.docstore.document import Document
+from .utils import load_kb_items
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
 
 def load_corpus_trivial(KB_PATH, parallel_image_workers: int = 16) -> List[Document]:
+    from langchain.docstore.document import Document
+
     docs: List[Document] = []
-    with open(KB_PATH, encoding="utf-8") as f:
-        all_insts = json.load(f)
+    all_insts = load_kb_items(KB_PATH)
 
     # 1) 先把非 image 类型的都处理好
     image_insts = []
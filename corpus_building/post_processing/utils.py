@@ -3,46 +3,63 @@ Merge every *.json file under /data/huali_data/  (each is a list of instances)
 into one big JSON list and save to /data/huali_mm/huali_corpus.json
 """
 import os, json
-from tqdm import tqdm
 from pathlib import Path
 from itertools import islice
 from collections import Counter, defaultdict
-from langchain.docstore.document import Document
 
 from .prompts import CAPTION_PROMPT
-from dashscope import MultiModalConversation
 
 
-# 初始化captioner
-qwen_key = os.getenv("DASHSCOPE_API_KEY")
-if not qwen_key:
-    raise RuntimeError("请先确保 DASHSCOPE_API_KEY 已正确设置并激活了 mmrag 环境")
+# captioner 的 API Key 在首次调用时检查
+def _get_qwen_key() -> str:
+    qwen_key = os.getenv("DASHSCOPE_API_KEY")
+    if not qwen_key:
+        raise RuntimeError("请先确保 DASHSCOPE_API_KEY 已正确设置并激活了 mmrag 环境")
+    return qwen_key
 
-def img_cap(image_path):
+
+def img_cap(image_path, client=None, hedger=None, image_cache=None):
+    """
+    client 为 rag_pipeline.remote.DashScope_AsyncClient 时走共享异步客户端
+    （自适应并发 + 重试，对冲由 client 自带的 hedger 负责），失败抛 RemoteCallError；
+    否则直接调用 DashScope SDK，hedger（rag_pipeline.remote.Hedger）非空时对慢请求补发副本
+    image_cache（rag_pipeline.remote.Image_Cache）非空时上传缩略图而不是原图
+    """
+    if image_cache is not None:
+        image_path = image_cache.get(image_path)
     messages = [{"role": "system",
                 "content": [{"text": "You are a helpful assistant for image captioning. Think step by step."}]},
                 {'role':'user',
                 'content': [{'image': image_path},   
                             {'text': CAPTION_PROMPT}
                            ]}]
-    response = MultiModalConversation.call(
-        # 若没有配置环境变量，请用百炼API Key将下行替换为：api_key="sk-xxx"
-        api_key=qwen_key,
-        model='qwen2.5-vl-7b-instruct', #'qwen2-vl-2b-instruct' free
-        messages=messages,
-        vl_high_resolution_images=False)
+    if client is not None:
+        return client.chat_sync(messages, model='qwen2.5-vl-7b-instruct')
+
+    from dashscope import MultiModalConversation
 
-    return response["output"]["choices"][0]["message"].content[0]["text"]
+    def _once():
+        response = MultiModalConversation.call(
+            # 若没有配置环境变量，请用百炼API Key将下行替换为：api_key="sk-xxx"
+            api_key=_get_qwen_key(),
+            model='qwen2.5-vl-7b-instruct', #'qwen2-vl-2b-instruct' free
+            messages=messages,
+            vl_high_resolution_images=False)
+        return response["output"]["choices"][0]["message"].content[0]["text"]
 
+    return hedger.call(_once) if hedger is not None else _once()
 
 
-def _process_image_inst(inst, IMAGE_ROOT):
+
+def _process_image_inst(inst, IMAGE_ROOT, client=None, hedger=None, image_cache=None):
     """
     辅助函数：给一个 inst 调用 img_cap 并返回一个 Document
     """
+    from langchain.docstore.document import Document
+
     img_path = os.path.join(IMAGE_ROOT, inst["img_path"])
     cap_list = inst.get("img_caption") or []
-    descrip_list = [img_cap(img_path).strip()]
+    descrip_list = [img_cap(img_path, client, hedger, image_cache).strip()]
     return Document(
         page_content=" ".join(cap_list + descrip_list),
         metadata={
@@ -58,13 +75,15 @@ def _process_image_inst(inst, IMAGE_ROOT):
 
 
 
-def _process_table_inst(inst, IMAGE_ROOT):
+def _process_table_inst(inst, IMAGE_ROOT, client=None, hedger=None, image_cache=None):
     """
     辅助函数：给一个 inst 调用 img_cap 并返回一个 Document
     """
+    from langchain.docstore.document import Document
+
     img_path = os.path.join(IMAGE_ROOT, inst["img_path"])
     cap_list = inst.get("table_caption") or []
-    descrip_list = [img_cap(img_path).strip()]
+    descrip_list = [img_cap(img_path, client, hedger, image_cache).strip()]
     return Document(
         page_content=" ".join(cap_list + descrip_list),
         metadata={
@@ -82,6 +101,8 @@ def _process_table_inst(inst, IMAGE_ROOT):
 
 
 def analyze_kb_types(kb_path):
+    from tqdm import tqdm
+
     with open(kb_path, encoding="utf-8") as f:
         all_insts = json.load(f)
 
@@ -115,6 +136,28 @@ def analyze_kb_types(kb_path):
 
 
 
+def load_kb_items(kb_path) -> list:
+    """读取合并后的语料（条目列表）；增量文件（dict，见 Ingest_Manifest.merge_delta）取其中的 items"""
+    with open(kb_path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data["items"] if isinstance(data, dict) else data
+
+
+def apply_docs_delta(old_docs, new_docs, delta):
+    """
+    把增量入库得到的 new_docs 并入上次的 old_docs：先整本删掉 delta["drop_books"]（更新 / 移除 / 重解析失败的书）
+    以及与 new_docs 同书的旧文档，再并入 new_docs，按 book_idx 稳定排序；delta 可为 .delta.json 路径或已读入的 dict
+    """
+    if not isinstance(delta, dict):
+        with open(delta, encoding="utf-8") as f:
+            delta = json.load(f)
+    drop = set(delta["drop_books"]) | {d.metadata.get("book_idx") for d in new_docs}
+    kept = [d for d in old_docs if d.metadata.get("book_idx") not in drop]
+    print(f"删除 {len(old_docs) - len(kept)} 条旧文档（{len(delta['drop_books'])} 本书），新增 {len(new_docs)} 条")
+    return sorted(kept + list(new_docs), key=lambda d: d.metadata.get("book_idx", -1))
+
+
+
 def save_docs(docs, OUTPUT_DOCS= Path("/data/huali_mm/docs.json")):
     serializable = [
         {"page_content": doc.page_content, "metadata": doc.metadata}
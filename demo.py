@@ -1,26 +1,22 @@
 import os
 import time
-from rag_pipeline.retrieval import Hybrid_Retriever, load_serialized_docs
+import logging
+import argparse
+from rag_pipeline.retrieval import Hybrid_Retriever, load_serialized_docs, qwen_configs
 from rag_pipeline.reranking import Qwenvl_Reranker
-from rag_pipeline.reasoning import DeepSeek_Stream
+from rag_pipeline.reasoning import DeepSeek_Stream, ResponseCache
+from rag_pipeline.serving import Pipelined_RAG
 from post_processing import rewrite_with_mllm, render_mm_results
 
 
+# 检索 / 重排的统计信息走 logging，保持 demo 中的输出
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
 # loading Corpus
 mm_parents  = load_serialized_docs("/data/huali_mm/chunks/mm_parents.json")
 mm_children = load_serialized_docs("/data/huali_mm/chunks/mm_children.json")
 
 # Initializaing Retriever
-qwen_configs={
-"DENSE_MODEL": "./models/Qwen3-Embedding-0.6B",
-"INDEX_PATH" : "./indexes/qwen/mm_hier_index",
-"DENSE_PICK" : 200,         # 稠密召回数
-"BATCH"      : 6,           # 嵌入模型batch大小 显存大约占用为21g
-"BM25_PICK"  : 200,         # 稀疏召回数
-"TOP_PARENT" : 200,
-"k_child"    : 200,
-"k_parent"   : 20
-}
 mm_hier_hret = Hybrid_Retriever((mm_children, mm_parents), qwen_configs)
 llm_reranker = Qwenvl_Reranker()
 
@@ -30,26 +26,45 @@ if __name__ == "__main__":
     parser.add_argument("--top_media",    type=int,  default=5)
     parser.add_argument("--rerank_batch", type=int,  default=8)
     parser.add_argument("--rewrite",      type=bool, default=False)    
+    parser.add_argument("--response_cache", type=str, default=None)   # 推理回复缓存 SQLite 路径（完全相同的 prompt 直接回放）
+    parser.add_argument("--pipelined",    action="store_true")        # 检索 / 重排 / 生成重叠执行，top-k 稳定后即开始生成
     args = parser.parse_args()
+    cache = ResponseCache(args.response_cache) if args.response_cache else None
 
     query = input()
-    # Retrieval
-    results = mm_hier_hret.hybrid_retrieve_parents(query)
-    # Reranking
-    top_text_parents, top_media_parents = llm_reranker.rerank_parents(
-    query  =query,
-    parents=results,
-    n_text =args.top_text,
-    n_media=args.top_media,
-    batch  =args.rerank_batch
-    )
-    # Reasoning
-    token_iter, response = DeepSeek_Stream(query,
-                                       top_text_parents,
-                                       top_media_parents)
-    # Printing Results
-    for tok in token_iter:           
-        print(tok, end="", flush=True)
+    if args.pipelined:
+        # Retrieval + Reranking + Reasoning（Pipelined_RAG），记下实际送入生成的图表父块供改写使用
+        captured = {}
+        def reason_fn(q, top_text, top_media):
+            token_iter, captured["response"] = DeepSeek_Stream(q, top_text, top_media, response_cache=cache)
+            captured["media"] = top_media
+            return token_iter, captured["response"]
+
+        rag = Pipelined_RAG(mm_hier_hret, llm_reranker, reason_fn,
+                            top_text=args.top_text, top_media=args.top_media)
+        for ev in rag.run(query):
+            if ev["event"] == "token":
+                print(ev["data"], end="", flush=True)
+        top_media_parents, response = captured["media"], captured["response"]
+    else:
+        # Retrieval
+        results = mm_hier_hret.hybrid_retrieve_parents(query)
+        # Reranking
+        top_text_parents, top_media_parents = llm_reranker.rerank_parents(
+        query  =query,
+        parents=results,
+        n_text =args.top_text,
+        n_media=args.top_media,
+        batch  =args.rerank_batch
+        )
+        # Reasoning
+        token_iter, response = DeepSeek_Stream(query,
+                                           top_text_parents,
+                                           top_media_parents,
+                                           response_cache=cache)
+        # Printing Results
+        for tok in token_iter:           
+            print(tok, end="", flush=True)
 
     if args.rewrite:
         text = response()
@@ -1 +1,19 @@
-from .mllm_rewriting import *
+"""
+懒加载：访问某个名字时才导入对应子模块（及其 dashscope / IPython / json5 等依赖），
+`import` 本包本身不产生任何副作用。
+"""
+from rag_pipeline.lazy import lazy_exports
+
+_LAZY_ATTRS = {
+    "build_media_inputs": ".mllm_rewriting",
+    "safe_json_load":     ".mllm_rewriting",
+    "rewrite_with_mllm":  ".mllm_rewriting",
+    "render_mm_results":  ".mllm_rewriting",
+    "rewrite_messages":   ".mllm_rewriting",
+    "Paragraph_Parser":   ".streaming_rewrite",
+    "rewrite_with_mllm_stream": ".streaming_rewrite",
+    "render_mm_stream":   ".streaming_rewrite",
+}
+__all__ = list(_LAZY_ATTRS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _LAZY_ATTRS)
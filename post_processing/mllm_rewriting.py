@@ -1,15 +1,19 @@
-import os, json5, re, textwrap
-from typing import List, Tuple
+from __future__ import annotations
+import os, re, textwrap
+from typing import TYPE_CHECKING, List, Tuple
 from .prompts import REWRITE_PROMPT
-from dashscope import MultiModalConversation
-from langchain.docstore.document import Document
 
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+
+# rewriter 的 API Key 在首次调用时检查
+def _get_qwen_key() -> str:
+    qwen_key = os.getenv("DASHSCOPE_API_KEY")
+    if not qwen_key:
+        raise RuntimeError("请先确保 DASHSCOPE_API_KEY 已正确设置并激活了 mmrag 环境")
+    return qwen_key
 
-# 初始化captioner
-qwen_key = os.getenv("DASHSCOPE_API_KEY")
-if not qwen_key:
-    raise RuntimeError("请先确保 DASHSCOPE_API_KEY 已正确设置并激活了 mmrag 环境")
-    
 
 def build_media_inputs(media_docs: List[Document],
                        max_n: int = 5) -> Tuple[List[str], str]:
@@ -46,6 +50,8 @@ def build_media_inputs(media_docs: List[Document],
 
 
 def safe_json_load(txt: str):
+    import json5
+
     # 把 ```json … ``` 外围去掉
     m = re.search(r"```json\s*(.*?)\s*```", txt, re.S | re.I)
     core = m.group(1) if m else txt
@@ -55,15 +61,11 @@ def safe_json_load(txt: str):
 
 
 
-def rewrite_with_mllm(answer_text: str,
-                      media_docs: List[Document],
-                      max_media: int = 5) -> dict:
-    """
-    调用 Qwen-VL 7B 让其润色 AnswerText 并决定 Media 插入点。
-    返回 {"enhanced_paragraphs":[...], "unused_media":[...]} (dict)
-    """
-    media_paths, media_block = build_media_inputs(media_docs, max_n=5)
-
+def rewrite_messages(answer_text: str,
+                     media_docs: List[Document],
+                     max_media: int = 5,
+                     image_cache=None) -> list:
+    """rewrite_with_mllm / rewrite_with_mllm_stream 共用的请求消息"""
     # ---------- 1. 组织 media_paths 与 media_block ----------
     media_paths, media_lines = [], []
     for idx, doc in enumerate(media_docs[:max_media], 1):
@@ -74,7 +76,7 @@ def rewrite_with_mllm(answer_text: str,
                    doc.metadata.get("table_caption") or "")
         cap = " ".join(cap_raw) if isinstance(cap_raw, list) else cap_raw
 
-        media_paths.append(path)
+        media_paths.append(image_cache.get(path) if image_cache is not None else path)
         media_lines.append(f"{tag}  ({typ})  caption: {cap}")
 
     media_block = "\n".join(media_lines)
@@ -98,17 +100,43 @@ def rewrite_with_mllm(answer_text: str,
         {"role": "user",
          "content": user_content}
     ]
+    return messages
+
+
+
+def rewrite_with_mllm(answer_text: str,
+                      media_docs: List[Document],
+                      max_media: int = 5,
+                      client=None,
+                      hedger=None,
+                      image_cache=None) -> dict:
+    """
+    调用 Qwen-VL 7B 让其润色 AnswerText 并决定 Media 插入点。
+    返回 {"enhanced_paragraphs":[...], "unused_media":[...]} (dict)
+    client 为 rag_pipeline.remote.DashScope_AsyncClient 时走共享异步客户端（重试 + 截止时间），
+    失败抛 RemoteCallError；不用 client 时可传 hedger（rag_pipeline.remote.Hedger）对慢请求补发副本
+    image_cache（rag_pipeline.remote.Image_Cache）非空时上传缩略图；返回的插入点仍以 <MEDIA_i> 标记，与原图路径无关
+    """
+    messages = rewrite_messages(answer_text, media_docs, max_media, image_cache)
 
     # ---------- 3. 调用 Dashscope MultiModalConversation ----------
-    resp = MultiModalConversation.call(
-        api_key = qwen_key,
-        model   = "qwen2.5-vl-72b-instruct",
-        messages= messages,
-        vl_high_resolution_images = False
-    )
+    if client is not None:
+        raw_txt = client.chat_sync(messages, model="qwen2.5-vl-72b-instruct")
+    else:
+        from dashscope import MultiModalConversation
+
+        def _once():
+            resp = MultiModalConversation.call(
+                api_key = _get_qwen_key(),
+                model   = "qwen2.5-vl-72b-instruct",
+                messages= messages,
+                vl_high_resolution_images = False
+            )
+            return resp["output"]["choices"][0]["message"].content[0]["text"]
+
+        raw_txt = hedger.call(_once) if hedger is not None else _once()
 
     # ---------- 4. 解析返回 JSON ----------
-    raw_txt = resp["output"]["choices"][0]["message"].content[0]["text"]
     result  = safe_json_load(raw_txt)
     return result
 
@@ -117,6 +145,8 @@ def rewrite_with_mllm(answer_text: str,
 def render_mm_results(result, 
                       top_media_parents: List[Document],
                       cot_text: str):
+    from IPython.display import display, Markdown, Image
+
     # 把 media tag 映射到路径 & caption
     tag2info = {}
     for idx, doc in enumerate(top_media_parents, 1):
@@ -128,7 +158,7 @@ def render_mm_results(result,
         tag2info[tag] = (path, caption)
 
     # 显示思考过程
-    display(Markdown("## 🤔 思考过程\n\n" + cot))
+    display(Markdown("## 🤔 思考过程\n\n" + cot_text))
 
     # 显示润色后回答并插入图表
     display(Markdown("## 💡 回答\n"))
@@ -0,0 +1,200 @@
+from __future__ import annotations
+import re
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional
+
+from .mllm_rewriting import _get_qwen_key, rewrite_messages, safe_json_load
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+REWRITE_MODEL = "qwen2.5-vl-72b-instruct"
+
+_ARRAY_START = re.compile(r"""["']enhanced_paragraphs["']\s*:\s*\[""")
+_MEDIA_TAG   = re.compile(r"<MEDIA_(\d+)>")
+_HEX         = re.compile(r"[0-9a-fA-F]*")
+_ESCAPES     = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "\n": ""}
+
+
+
+class Paragraph_Parser():
+    """
+    增量 JSON 解析器：只关心 "enhanced_paragraphs" 数组
+    --------------------------------------------------------------
+    • feed(chunk) 接收任意切分的模型输出，返回本次新闭合的段落字符串列表
+    • 支持 ```json 包裹、单 / 双引号字符串以及 \\n、\\"、\\uXXXX 等转义；
+      转义序列被 chunk 切断时等下一块到达再解析
+    • 非法转义（如 LaTeX 的 \\( ）按 json5 的规则保留转义后的字符
+    • 数组结束（遇到 ']'）后 done 为 True，后续内容（unused_media 等）只累积在 text 中
+    """
+
+    def __init__(self):
+        self.text  = ""
+        self.done  = False
+        self._pos  = None                   # 数组内下一个待读字符的位置；None 表示还没找到数组
+        self._quote = None                  # 正在读的字符串的引号；None 表示不在字符串内
+        self._buf  = []
+        self.paragraphs: List[str] = []
+
+
+    def feed(self, chunk: str) -> List[str]:
+        self.text += chunk
+        if self.done:
+            return []
+        if self._pos is None:
+            m = _ARRAY_START.search(self.text)
+            if m is None:
+                return []
+            self._pos = m.end()
+
+        out, text, i = [], self.text, self._pos
+        while i < len(text):
+            c = text[i]
+            if self._quote is None:
+                if c in "\"'":
+                    self._quote = c
+                elif c == "]":
+                    self.done = True
+                    i += 1
+                    break
+                i += 1
+                continue
+
+            if c == "\\":
+                if i + 1 >= len(text):
+                    break                                      # 转义被切断，等下一块
+                e = text[i + 1]
+                if e == "u":
+                    hexdigits = text[i + 2:i + 6]
+                    if len(hexdigits) < 4 and _HEX.fullmatch(hexdigits):
+                        break                                  # \uXX 被切断，等下一块
+                    if len(hexdigits) == 4 and _HEX.fullmatch(hexdigits):
+                        self._buf.append(chr(int(hexdigits, 16)))
+                        i += 6
+                        continue
+                    # 非 \uXXXX（如 LaTeX 的 \underline、\upsilon）：与其他非法转义一样保留 u
+                self._buf.append(_ESCAPES.get(e, e))
+                i += 2
+                continue
+
+            if c == self._quote:
+                para = "".join(self._buf)
+                self._buf, self._quote = [], None
+                self.paragraphs.append(para)
+                out.append(para)
+            else:
+                self._buf.append(c)
+            i += 1
+
+        self._pos = i
+        return out
+
+
+    def result(self) -> dict:
+        """流结束后的完整结果：能整体解析时以其为准，否则退回已流出的段落"""
+        try:
+            parsed = safe_json_load(self.text)
+            if isinstance(parsed, dict) and "enhanced_paragraphs" in parsed:
+                parsed.setdefault("unused_media", [])
+                return parsed
+        except Exception:
+            pass
+        return {"enhanced_paragraphs": list(self.paragraphs), "unused_media": []}
+
+
+
+def media_info(media_docs: List[Document]) -> Dict[str, dict]:
+    """<MEDIA_i> -> 图表路径 / 标题 / 类型（与 render_mm_results 的映射一致）"""
+    info = {}
+    for idx, doc in enumerate(media_docs, 1):
+        caption = (doc.metadata.get("img_caption") or
+                   doc.metadata.get("table_caption") or "")
+        info[f"<MEDIA_{idx}>"] = {
+            "tag":      f"<MEDIA_{idx}>",
+            "type":     doc.metadata.get("type"),
+            "img_path": doc.metadata.get("img_path"),
+            "caption":  " ".join(caption) if isinstance(caption, list) else caption,
+        }
+    return info
+
+
+def resolve_paragraph(paragraph: str, info: Dict[str, dict]) -> dict:
+    """去掉段内的 <MEDIA_i> 占位符，返回 {"text", "media": [按出现顺序的图表信息]}；未知编号丢弃"""
+    media = [info[m.group()] for m in _MEDIA_TAG.finditer(paragraph) if m.group() in info]
+    return {"text": _MEDIA_TAG.sub("", paragraph).strip(), "media": media}
+
+
+
+def _dashscope_stream(messages: list) -> Iterator[str]:
+    from dashscope import MultiModalConversation
+
+    responses = MultiModalConversation.call(
+        api_key  = _get_qwen_key(),
+        model    = REWRITE_MODEL,
+        messages = messages,
+        vl_high_resolution_images = False,
+        stream   = True,
+        incremental_output = True,
+    )
+    for resp in responses:
+        if resp.status_code != 200:
+            raise RuntimeError(f"DashScope 流式调用失败: {resp.code} {resp.message}")
+        for part in resp["output"]["choices"][0]["message"].content or []:
+            if part.get("text"):
+                yield part["text"]
+
+
+def rewrite_with_mllm_stream(answer_text: str,
+                             media_docs: List[Document],
+                             max_media: int = 5,
+                             client=None,
+                             stream_fn: Optional[Callable[[list], Iterator[str]]] = None,
+                             image_cache=None) -> Iterator[dict]:
+    """
+    rewrite_with_mllm 的流式版本：模型增量输出，每闭合一个 enhanced_paragraphs 元素立即产出
+        {"event": "paragraph", "index": i, "text": 去掉占位符的段落, "media": [{"tag", "type", "img_path", "caption"}]}
+    最后产出 {"event": "done", "result": 与 rewrite_with_mllm 相同的 dict, "first_paragraph_ms", "latency_ms"}
+    stream_fn(messages) -> 文本增量迭代器，可替换远程调用（如本地桩）；默认走 DashScope SDK 的 incremental_output 流
+    client（DashScope_AsyncClient）不支持流式：传入时整段返回后再逐段产出，结果与流式一致
+    """
+    media_docs = media_docs[:max_media]
+    info       = media_info(media_docs)
+    messages   = rewrite_messages(answer_text, media_docs, max_media, image_cache)
+    if client is not None:
+        chunks = iter([client.chat_sync(messages, model=REWRITE_MODEL)])
+    else:
+        chunks = (stream_fn or _dashscope_stream)(messages)
+
+    parser, first_ms = Paragraph_Parser(), None
+    t0 = time.perf_counter()
+    for chunk in chunks:
+        base  = len(parser.paragraphs)
+        fresh = parser.feed(chunk)
+        if fresh and first_ms is None:
+            first_ms = (time.perf_counter() - t0) * 1000
+        for i, para in enumerate(fresh, base):
+            yield {"event": "paragraph", "index": i, **resolve_paragraph(para, info)}
+
+    result = parser.result()
+    # 整体解析得到的段落多于流出的段落（如引号不规范导致增量解析提前结束）时补发剩余段落
+    for i, para in enumerate(result["enhanced_paragraphs"][len(parser.paragraphs):], len(parser.paragraphs)):
+        yield {"event": "paragraph", "index": i, **resolve_paragraph(para, info)}
+    yield {"event": "done", "result": result, "first_paragraph_ms": first_ms,
+           "latency_ms": (time.perf_counter() - t0) * 1000}
+
+
+
+def render_mm_stream(events: Iterator[dict], cot_text: str):
+    """逐段渲染 rewrite_with_mllm_stream 的输出（notebook 中使用），段落到达即显示"""
+    from IPython.display import display, Markdown, Image
+
+    display(Markdown("## 🤔 思考过程\n\n" + cot_text))
+    display(Markdown("## 💡 回答\n"))
+    for ev in events:
+        if ev["event"] != "paragraph":
+            continue
+        if ev["text"]:
+            display(Markdown(ev["text"]))
+        for m in ev["media"]:
+            display(Image(m["img_path"]))
+            display(Markdown(f"*{m['caption']}*"))
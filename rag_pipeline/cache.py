@@ -0,0 +1,170 @@
+from __future__ import annotations
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+
+
+class Tiered_Cache():
+    """
+    两级缓存的公共实现（ScoreCache / ResponseCache 共用）
+    --------------------------------------------------------------
+    • 一级：进程内 LRU（OrderedDict），容量 capacity
+    • 二级：SQLite（WAL），path 为空时只用内存；未命中内存时查盘并回填 LRU
+    • ttl 秒后条目视为过期（None 表示永不过期）
+    • 线程安全；SQLite 连接按进程惰性打开，pre-fork 后各 worker 各自持有连接
+    子类给出表名 / 值列（TABLE / COLUMN / COLUMN_TYPE）与值的编解码（_normalize / _encode / _decode）
+    stats() 返回 内存命中 / 磁盘命中 / 未命中 次数与命中率
+    """
+
+    TABLE       = "entries"
+    COLUMN      = "value"
+    COLUMN_TYPE = "TEXT"
+
+    def __init__(self,
+                 path: "str | Path | None" = None,
+                 capacity: int = 100_000,
+                 ttl: Optional[float] = 7 * 24 * 3600):
+        self.path     = str(path) if path else None
+        self.capacity = capacity
+        self.ttl      = ttl
+
+        self._lru  = OrderedDict()                     # key -> (value, ts)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid  = None
+        self._counts = {"mem_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+
+
+    # 值的编解码：_normalize 为内存中保存的形式，_encode / _decode 为与 SQLite 列之间的转换
+    def _normalize(self, value):
+        return value
+
+    def _encode(self, value):
+        return value
+
+    def _decode(self, raw):
+        return raw
+
+
+    def _db(self):
+        if self.path is None:
+            return None
+        if self._conn is None or self._pid != os.getpid():
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} "
+                         f"(key TEXT PRIMARY KEY, {self.COLUMN} {self.COLUMN_TYPE} NOT NULL, ts REAL NOT NULL)")
+            conn.commit()
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+
+    def _fresh(self, ts: float, now: float) -> bool:
+        return self.ttl is None or now - ts <= self.ttl
+
+
+    def _remember(self, key: str, value, ts: float):
+        self._lru[key] = (value, ts)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+
+    def get_many(self, keys: List[str]) -> dict:
+        """返回命中的 {key: value}；未命中 / 过期的键不出现在结果中"""
+        now, found, missing = time.time(), {}, []
+        with self._lock:
+            for k in keys:
+                hit = self._lru.get(k)
+                if hit is not None and self._fresh(hit[1], now):
+                    self._lru.move_to_end(k)
+                    found[k] = hit[0]
+                    self._counts["mem_hits"] += 1
+                else:
+                    missing.append(k)
+
+            db = self._db()
+            if db is not None and missing:
+                for i in range(0, len(missing), 500):     # SQLite 变量个数上限
+                    part = missing[i: i + 500]
+                    rows = db.execute(
+                        f"SELECT key, {self.COLUMN}, ts FROM {self.TABLE} "
+                        f"WHERE key IN ({','.join('?' * len(part))})",
+                        part,
+                    ).fetchall()
+                    for k, raw, ts in rows:
+                        if self._fresh(ts, now):
+                            found[k] = self._decode(raw)
+                            self._remember(k, found[k], ts)
+                            self._counts["disk_hits"] += 1
+
+            self._counts["misses"] += sum(k not in found for k in keys)
+        return found
+
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+
+    def put_many(self, items: Iterable[Tuple[str, object]]):
+        now   = time.time()
+        items = [(k, self._normalize(v)) for k, v in items]
+        if not items:
+            return
+        with self._lock:
+            for k, v in items:
+                self._remember(k, v, now)
+            self._counts["writes"] += len(items)
+            db = self._db()
+            if db is not None:
+                db.executemany(f"INSERT OR REPLACE INTO {self.TABLE} (key, {self.COLUMN}, ts) VALUES (?, ?, ?)",
+                               [(k, self._encode(v), now) for k, v in items])
+                db.commit()
+
+
+    def put(self, key: str, value):
+        self.put_many([(key, value)])
+
+
+    def purge_expired(self) -> int:
+        """删除磁盘上的过期条目，返回删除条数"""
+        if self.ttl is None:
+            return 0
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for k in [k for k, (_, ts) in self._lru.items() if ts < cutoff]:
+                del self._lru[k]
+            db = self._db()
+            if db is None:
+                return 0
+            n = db.execute(f"DELETE FROM {self.TABLE} WHERE ts < ?", (cutoff,)).rowcount
+            db.commit()
+        return n
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self._counts)
+            size = len(self._lru)
+        lookups = c["mem_hits"] + c["disk_hits"] + c["misses"]
+        hits    = c["mem_hits"] + c["disk_hits"]
+        return {
+            **c,
+            "lookups":   lookups,
+            "hit_rate":  hits / lookups if lookups else 0.0,
+            "mem_size":  size,
+        }
+
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
@@ -0,0 +1,22 @@
+import sys
+import importlib
+from typing import Callable, Dict, List, Tuple
+
+
+def lazy_exports(package: str, attrs: Dict[str, str]) -> Tuple[Callable, Callable]:
+    """
+    为包生成模块级 __getattr__ / __dir__：访问 attrs 中的名字时才导入对应子模块，
+    导入后的对象写回包的命名空间，之后的访问不再经过 __getattr__
+        __getattr__, __dir__ = lazy_exports(__name__, _LAZY_ATTRS)
+    """
+    def __getattr__(name: str):
+        if name in attrs:
+            value = getattr(importlib.import_module(attrs[name], package), name)
+            setattr(sys.modules[package], name, value)
+            return value
+        raise AttributeError(f"module {package!r} has no attribute {name!r}")
+
+    def __dir__() -> List[str]:
+        return sorted(set(vars(sys.modules[package])) | set(attrs))
+
+    return __getattr__, __dir__
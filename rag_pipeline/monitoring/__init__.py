@@ -0,0 +1,12 @@
+"""
+运行期监控：stage / trace 钩子与 sink。只依赖标准库，直接导入。
+"""
+from .hooks import (stage, trace, record, add_sink, remove_sink, clear_sinks,
+                    enabled, current_trace_id)
+from .sinks import Logging_Sink, Histogram_Sink, JSONL_Sink
+
+__all__ = [
+    "stage", "trace", "record", "add_sink", "remove_sink", "clear_sinks",
+    "enabled", "current_trace_id",
+    "Logging_Sink", "Histogram_Sink", "JSONL_Sink",
+]
@@ -0,0 +1,130 @@
+import time
+import uuid
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 已注册的 sink；整体替换而非原地修改，读取时无需加锁
+_SINKS: List = []
+_TRACE_ID = contextvars.ContextVar("flexrag_trace_id", default=None)
+_LINKS    = contextvars.ContextVar("flexrag_trace_links", default=None)
+
+
+
+def add_sink(sink):
+    """注册 sink（需实现 emit(event: dict)），返回 sink 本身"""
+    global _SINKS
+    _SINKS = _SINKS + [sink]
+    return sink
+
+
+def remove_sink(sink):
+    global _SINKS
+    _SINKS = [s for s in _SINKS if s is not sink]
+
+
+def clear_sinks():
+    global _SINKS
+    _SINKS = []
+
+
+def enabled() -> bool:
+    return bool(_SINKS)
+
+
+def current_trace_id() -> Optional[str]:
+    return _TRACE_ID.get()
+
+
+@contextmanager
+def trace(trace_id: Optional[str] = None, links: Optional[List[str]] = None):
+    """
+    为当前上下文设置 trace id；期间产生的所有 stage 事件都带上它。
+    links：批处理时一批请求共用一次计算，用于记录被合并的各请求 trace id。
+    """
+    tid = trace_id or uuid.uuid4().hex[:16]
+    tok_id, tok_links = _TRACE_ID.set(tid), _LINKS.set(links)
+    try:
+        yield tid
+    finally:
+        _TRACE_ID.reset(tok_id)
+        _LINKS.reset(tok_links)
+
+
+def record(name: str, seconds: float, **fields):
+    """直接上报一个已测得的耗时（如首 token 延迟）"""
+    sinks = _SINKS
+    if not sinks:
+        return
+    event = {
+        "ts":          time.time(),
+        "trace_id":    _TRACE_ID.get(),
+        "stage":       name,
+        "duration_ms": seconds * 1000,
+        **fields,
+    }
+    links = _LINKS.get()
+    if links:
+        event["links"] = links
+    for sink in sinks:
+        try:
+            sink.emit(event)
+        except Exception:
+            logger.exception("metrics sink %r failed", sink)
+
+
+
+class _NoopStage():
+    """未注册任何 sink 时 stage() 返回的单例，开销仅为一次函数调用"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NOOP = _NoopStage()
+
+
+
+class _Stage():
+    __slots__ = ("name", "fields", "t0")
+
+    def __init__(self, name: str, fields: dict):
+        self.name   = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.fields["error"] = exc_type.__name__
+        record(self.name, time.perf_counter() - self.t0, **self.fields)
+        return False
+
+    def set(self, **fields):
+        """在 stage 内补充字段（如命中数量）"""
+        self.fields.update(fields)
+
+
+
+def stage(name: str, **fields):
+    """
+    计时上下文：
+        with stage("faiss_search", k=200) as st:
+            ...
+            st.set(n_hits=len(hits))
+    """
+    if not _SINKS:
+        return _NOOP
+    return _Stage(name, fields)
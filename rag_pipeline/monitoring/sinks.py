@@ -0,0 +1,79 @@
+import json
+import logging
+import threading
+from collections import defaultdict, deque
+from typing import Dict
+
+
+
+class Logging_Sink():
+    """把 stage 事件写入 logging（默认 logger: flexrag.metrics, INFO 级别）"""
+
+    def __init__(self, logger_name: str = "flexrag.metrics", level: int = logging.INFO):
+        self.logger = logging.getLogger(logger_name)
+        self.level  = level
+
+    def emit(self, event: dict):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        extra = {k: v for k, v in event.items() if k not in {"ts", "trace_id", "stage", "duration_ms"}}
+        self.logger.log(self.level, "trace=%s stage=%s %.1fms %s",
+                        event["trace_id"], event["stage"], event["duration_ms"], extra or "")
+
+
+
+class Histogram_Sink():
+    """
+    进程内按 stage 聚合的延迟直方图
+    - 每个 stage 保留最近 window 个样本
+    - snapshot() 返回 count / mean / p50 / p90 / p99 / max（毫秒）
+    """
+
+    def __init__(self, window: int = 4096):
+        self._lock    = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._counts  = defaultdict(int)
+
+    def emit(self, event: dict):
+        with self._lock:
+            self._samples[event["stage"]].append(event["duration_ms"])
+            self._counts[event["stage"]] += 1
+
+    @staticmethod
+    def _pct(vals, q: float) -> float:
+        return vals[min(len(vals) - 1, int(round(q / 100 * (len(vals) - 1))))]
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            data = {k: sorted(v) for k, v in self._samples.items()}
+            counts = dict(self._counts)
+        return {
+            name: {
+                "count":   counts[name],
+                "mean_ms": sum(vals) / len(vals),
+                "p50_ms":  self._pct(vals, 50),
+                "p90_ms":  self._pct(vals, 90),
+                "p99_ms":  self._pct(vals, 99),
+                "max_ms":  vals[-1],
+            }
+            for name, vals in data.items() if vals
+        }
+
+
+
+class JSONL_Sink():
+    """每个事件一行 JSON 追加写入文件，多线程安全"""
+
+    def __init__(self, path: str):
+        self.path  = path
+        self._lock = threading.Lock()
+        self._f    = open(path, "a", encoding="utf-8", buffering=1)
+
+    def emit(self, event: dict):
+        line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._f.write(line)
+
+    def close(self):
+        with self._lock:
+            self._f.close()
@@ -1,2 +1,21 @@
-from .deepseek import *
-from .utils import *
\ No newline at end of file
+"""
+懒加载：访问某个名字时才导入对应子模块（及其 openai / httpx / tiktoken / langchain 依赖），
+`import` 本包本身不产生任何副作用。
+"""
+from ..lazy import lazy_exports
+
+_LAZY_ATTRS = {
+    "DeepSeek":               ".deepseek",
+    "DeepSeek_Stream":        ".deepseek",
+    "DeepSeek_Client":        ".client",
+    "Think_Tagger":           ".client",
+    "Context_Packer":         ".context_packer",
+    "Context_Compressor":     ".compression",
+    "ResponseCache":          ".response_cache",
+    "RAG_INSTRUCTION":        ".utils",
+    "block_fmt":              ".utils",
+    "build_retrieval_prompt": ".utils",
+}
+__all__ = list(_LAZY_ATTRS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _LAZY_ATTRS)
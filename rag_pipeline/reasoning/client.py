@@ -0,0 +1,438 @@
+from __future__ import annotations
+import os
+import json
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+from .utils import build_retrieval_prompt
+from ..monitoring.hooks import record
+from ..remote.async_client import RemoteCallError
+from ..serving.stats import LatencyStats
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+    from ..remote.hedging import Hedger
+    from .context_packer import Context_Packer
+    from .compression import Context_Compressor
+    from .response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+DEEPSEEK_URL = "https://api.deepseek.com"
+_DONE = object()
+
+
+
+class Think_Tagger():
+    """
+    把 (reasoning_content, content) 增量转成前端 token：
+        1) 推理阶段先输出 <think>…</think> 包裹的思考 token
+        2) 后续正文直接输出
+    同时累计完整的思考 / 正文文本，done() 返回 (reasoning, answer)
+    """
+
+    def __init__(self):
+        self.thinking_started = False
+        self.thinking_ended   = False
+        self.reasoning_parts: List[str] = []
+        self.answer_parts:    List[str] = []
+
+
+    def feed(self, reasoning: Optional[str], content: Optional[str]) -> List[str]:
+        out = []
+        if reasoning:
+            if not self.thinking_started:
+                self.thinking_started = True
+                out.append("<think>")
+            self.reasoning_parts.append(reasoning)
+            out.append(reasoning)
+            return out
+        if content:
+            if self.thinking_started and not self.thinking_ended:
+                self.thinking_ended = True
+                out.append("</think>")
+            self.answer_parts.append(content)
+            out.append(content)
+        return out
+
+
+    def done(self) -> Tuple[str, str]:
+        return "".join(self.reasoning_parts), "".join(self.answer_parts)
+
+
+
+def _parse_sse(line: str):
+    """SSE 数据行 -> (reasoning, content)；流结束返回 _DONE，其它行返回 None"""
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return _DONE
+    choices = json.loads(data).get("choices") or []
+    if not choices:
+        return None
+    delta = choices[0].get("delta") or {}
+    return delta.get("reasoning_content"), delta.get("content")
+
+
+def _events(lines) -> Iterator[Tuple[Optional[str], Optional[str]]]:
+    for line in lines:
+        ev = _parse_sse(line)
+        if ev is _DONE:
+            for _ in lines:                  # 读完响应体，连接才能回到连接池复用
+                pass
+            return
+        if ev is not None:
+            yield ev
+
+
+
+class DeepSeek_Client():
+    """
+    长驻的推理客户端（DeepSeek / 任意 OpenAI 兼容接口）
+    --------------------------------------------------------------
+    • 进程内复用同一个 httpx 连接池（keep-alive），TLS 与建连只在首次请求（或 warmup()）时付出，
+      不再像 DeepSeek_Stream 那样每次调用都新建 OpenAI 客户端
+    • stream() / astream() 分别是同步 / 异步流式生成器，<think> 标记规则与 DeepSeek_Stream 一致
+    • 调用方提前结束迭代（break / close() / aclose() / 任务取消）时立即关闭上游流，不再继续生成计费 token
+    • 首 token 延迟（从发出请求到首个非空 token）以 first_token 事件上报，并计入 stats()
+    • hedger 非空时同步流对“建立流 + 首个事件”做对冲，落败的流被关闭
+    • 实例可直接作为 RAG_Server 的 reason_fn：client(query, top_text, top_media) -> (token_iter, done)；
+      packer（Context_Packer）非空时检索上下文先按 token 预算打包；compressor（Context_Compressor）非空时文本父块先做抽取式压缩
+    • response_cache（ResponseCache）非空时，请求体完全相同的调用直接回放缓存的流，不再请求上游
+    pre-fork 部署时应在 fork 之后（每个 worker 内）创建，连接池不跨进程共享
+    base_url 可指向本地桩服务（benchmarks/stubs.py 的 Fake_OpenAI_Server）
+    """
+
+    def __init__(self,
+                 model: str = "deepseek-reasoner",
+                 api_key: Optional[str] = None,
+                 base_url: str = DEEPSEEK_URL,
+                 max_connections: int = 16,
+                 connect_timeout_s: float = 10.0,
+                 read_timeout_s: float = 300.0,
+                 hedger: Hedger | None = None,
+                 packer: Context_Packer | None = None,
+                 response_cache: ResponseCache | None = None,
+                 compressor: Context_Compressor | None = None):
+        self.model             = model
+        self.base_url          = base_url.rstrip("/")
+        self.max_connections   = max_connections
+        self.connect_timeout_s = connect_timeout_s
+        self.read_timeout_s    = read_timeout_s
+        self.hedger            = hedger
+        self.packer            = packer
+        self.compressor        = compressor
+        self.response_cache    = response_cache
+
+        self._api_key = api_key
+        self._http    = None
+        self._ahttp   = None
+        self._aloop   = None
+        self._stale   = set()                          # 正在关闭的旧异步连接池任务
+        self._lock    = threading.Lock()
+        self.ttft     = LatencyStats()
+        self.counters = {"streams": 0, "completed": 0, "cancelled": 0, "errors": 0, "cache_hits": 0}
+
+
+    @property
+    def api_key(self) -> str:
+        if self._api_key is None:
+            key = os.getenv("DEEPSEEK_API_KEY")
+            if not key:
+                raise RuntimeError("请先确保 DEEPSEEK_API_KEY 已正确设置并激活了 mmrag 环境")
+            self._api_key = key
+        return self._api_key
+
+
+    def _client_kwargs(self) -> dict:
+        import httpx
+
+        return dict(
+            base_url = self.base_url,
+            headers  = {"Authorization": f"Bearer {self.api_key}"},
+            limits   = httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            timeout  = httpx.Timeout(self.read_timeout_s, connect=self.connect_timeout_s),
+        )
+
+
+    def _sync_http(self):
+        with self._lock:
+            if self._http is None:
+                import httpx
+                self._http = httpx.Client(**self._client_kwargs())
+            return self._http
+
+
+    def _async_http(self):
+        # httpx.AsyncClient 绑定在创建它的事件循环上，换循环时关闭旧客户端并重建
+        loop = asyncio.get_running_loop()
+        if self._ahttp is None or self._aloop is not loop:
+            import httpx
+            if self._ahttp is not None:
+                self._close_stale(self._ahttp, self._aloop, loop)
+            self._ahttp = httpx.AsyncClient(**self._client_kwargs())
+            self._aloop = loop
+        return self._ahttp
+
+
+    def _close_stale(self, ahttp, old_loop, loop):
+        """关闭绑定在旧事件循环上的连接池：旧循环仍在运行时交给它关闭，否则在当前循环里尽力关闭"""
+        if old_loop is not None and old_loop.is_running() and not old_loop.is_closed():
+            asyncio.run_coroutine_threadsafe(ahttp.aclose(), old_loop)
+            return
+
+        async def _aclose():
+            try:
+                await ahttp.aclose()
+            except Exception as e:                     # 旧循环已关闭时底层连接可能已不可用
+                logger.debug("关闭旧的异步连接池失败: %s", e)
+        task = loop.create_task(_aclose())
+        self._stale.add(task)
+        task.add_done_callback(self._stale.discard)
+
+
+    def _payload(self, messages: List[dict], model: Optional[str], stream: bool, params: dict) -> dict:
+        return {"model": model or self.model, "messages": messages, "stream": stream, **params}
+
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+
+    def _first_token(self, seconds: float, model: str):
+        self.ttft.record(seconds)
+        record("first_token", seconds, model=model)
+
+
+    def _lookup(self, payload: dict):
+        """返回 (缓存键, 命中的增量序列)；未启用缓存时键为 None"""
+        if self.response_cache is None:
+            return None, None
+        key = self.response_cache.key(payload)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            self._count("cache_hits")
+        return key, cached
+
+
+    def warmup(self):
+        """提前建立连接（TLS 握手 + keep-alive），失败只记日志"""
+        try:
+            self._sync_http().get("/models").close()
+        except Exception as e:
+            logger.warning("推理客户端预热失败: %s", e)
+
+
+    # ------------------------------------------------------------------
+    # 同步接口
+    def complete(self, messages: List[dict], model: Optional[str] = None, **params) -> dict:
+        """非流式调用，返回 choices[0].message（含 reasoning_content / content）"""
+        payload = self._payload(messages, model, False, params)
+
+        def _once():
+            resp = self._sync_http().post("/chat/completions", json=payload)
+            if resp.status_code != 200:
+                raise RemoteCallError(f"HTTP {resp.status_code}: {resp.text[:200]}", resp.status_code, 1)
+            return resp.json()["choices"][0]["message"]
+
+        return self.hedger.call(_once) if self.hedger is not None else _once()
+
+
+    def _open(self, payload: dict):
+        http = self._sync_http()
+        resp = http.send(http.build_request("POST", "/chat/completions", json=payload), stream=True)
+        if resp.status_code != 200:
+            body = resp.read()[:200].decode("utf-8", "replace")
+            resp.close()
+            raise RemoteCallError(f"HTTP {resp.status_code}: {body}", resp.status_code, 1)
+        return resp
+
+
+    def _open_hedged(self, payload: dict):
+        def _first_event():
+            resp = self._open(payload)
+            it = _events(resp.iter_lines())
+            return resp, list(itertools.islice(it, 1)), it
+
+        resp, head, rest = self.hedger.call(_first_event, discard=lambda r: r[0].close())
+        return resp, itertools.chain(head, rest)
+
+
+    def stream(self,
+               messages: List[dict],
+               model: Optional[str] = None,
+               tagger: Optional[Think_Tagger] = None,
+               **params) -> Iterator[str]:
+        """逐 token 产出（含 <think> 标记）；首次 next() 时才发出请求"""
+        tagger  = tagger or Think_Tagger()
+        payload = self._payload(messages, model, True, params)
+        model   = payload["model"]
+        self._count("streams")
+
+        key, cached = self._lookup(payload)
+        if cached is not None:
+            for reasoning, content in cached:
+                yield from tagger.feed(reasoning, content)
+            return
+
+        t0 = time.perf_counter()
+        try:
+            if self.hedger is None:
+                resp = self._open(payload)
+                events = _events(resp.iter_lines())
+            else:
+                resp, events = self._open_hedged(payload)
+        except Exception:
+            self._count("errors")
+            raise
+
+        status, first, deltas = "cancelled", True, []
+        try:
+            for reasoning, content in events:
+                if first and (reasoning or content):
+                    first = False
+                    self._first_token(time.perf_counter() - t0, model)
+                if reasoning or content:
+                    deltas.append((reasoning, content))
+                yield from tagger.feed(reasoning, content)
+            status = "completed"
+        except Exception:
+            status = "errors"
+            raise
+        finally:
+            resp.close()                                       # 提前结束时关闭上游流
+            self._finish(status, t0, model, tagger, key, deltas)
+
+
+    # ------------------------------------------------------------------
+    # 异步接口
+    async def astream(self,
+                      messages: List[dict],
+                      model: Optional[str] = None,
+                      tagger: Optional[Think_Tagger] = None,
+                      **params) -> AsyncIterator[str]:
+        tagger  = tagger or Think_Tagger()
+        payload = self._payload(messages, model, True, params)
+        model   = payload["model"]
+        self._count("streams")
+
+        key, cached = self._lookup(payload)
+        if cached is not None:
+            for reasoning, content in cached:
+                for tok in tagger.feed(reasoning, content):
+                    yield tok
+            return
+
+        t0 = time.perf_counter()
+        status, first, deltas = "cancelled", True, []
+        try:
+            async with self._async_http().stream("POST", "/chat/completions", json=payload) as resp:
+                if resp.status_code != 200:
+                    body = (await resp.aread())[:200].decode("utf-8", "replace")
+                    raise RemoteCallError(f"HTTP {resp.status_code}: {body}", resp.status_code, 1)
+                finished = False
+                async for line in resp.aiter_lines():
+                    ev = None if finished else _parse_sse(line)
+                    if ev is _DONE:
+                        finished = True              # 继续读完响应体，连接才能回到连接池复用
+                        continue
+                    if ev is None:
+                        continue
+                    reasoning, content = ev
+                    if first and (reasoning or content):
+                        first = False
+                        self._first_token(time.perf_counter() - t0, model)
+                    if reasoning or content:
+                        deltas.append((reasoning, content))
+                    for tok in tagger.feed(reasoning, content):
+                        yield tok
+            status = "completed"
+        except Exception:
+            status = "errors"
+            raise
+        finally:
+            self._finish(status, t0, model, tagger, key, deltas)
+
+
+    def _finish(self, status: str, t0: float, model: str, tagger: Think_Tagger,
+                key: Optional[str] = None, deltas: Optional[list] = None):
+        self._count(status)
+        if status != "completed":
+            return
+        if key is not None:
+            self.response_cache.put(key, deltas)
+        reasoning, answer = tagger.done()
+        record("generation", time.perf_counter() - t0, model=model, stream=True,
+               reasoning_chars=len(reasoning), answer_chars=len(answer))
+
+
+    # ------------------------------------------------------------------
+    # 与 DeepSeek_Stream 相同的 RAG 调用方式
+    def rag_messages(self, query: str, top_text_parents: List[Document], top_media_parents: List[Document],
+                     **context) -> List[dict]:
+        """context：text_scores / media_scores / matched_children，透传给 build_retrieval_prompt（供 packer 使用）"""
+        prompt_input = build_retrieval_prompt(query, top_text_parents, top_media_parents,
+                                              self.packer, self.compressor, **context)
+        return [{"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user",   "content": prompt_input}]
+
+
+    def __call__(self,
+                 query: str,
+                 top_text_parents: List[Document],
+                 top_media_parents: List[Document],
+                 max_tokens: int = 64 * 1024,
+                 temperature: float = 0.7,
+                 model: Optional[str] = None,
+                 **context) -> Tuple[Iterator[str], Callable[[], Tuple[str, str]]]:
+        """返回 (token_iterator, done)，语义同 DeepSeek_Stream；model 为空时用 self.model，context 见 rag_messages"""
+        tagger = Think_Tagger()
+        messages = self.rag_messages(query, top_text_parents, top_media_parents, **context)
+        return self.stream(messages, model=model, tagger=tagger,
+                           max_tokens=max_tokens, temperature=temperature), tagger.done
+
+
+    def areason(self,
+                query: str,
+                top_text_parents: List[Document],
+                top_media_parents: List[Document],
+                max_tokens: int = 64 * 1024,
+                temperature: float = 0.7,
+                model: Optional[str] = None,
+                **context) -> Tuple[AsyncIterator[str], Callable[[], Tuple[str, str]]]:
+        """异步版本：返回 (async token_iterator, done)"""
+        tagger = Think_Tagger()
+        messages = self.rag_messages(query, top_text_parents, top_media_parents, **context)
+        return self.astream(messages, model=model, tagger=tagger,
+                            max_tokens=max_tokens, temperature=temperature), tagger.done
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+        return {**c,
+                "ttft":    self.ttft.snapshot(),
+                "context": dict(self.packer.last_report) if self.packer is not None else {},
+                "compression": dict(self.compressor.last_report) if self.compressor is not None else {},
+                "response_cache": self.response_cache.stats() if self.response_cache is not None else {},
+                "hedging": self.hedger.stats() if self.hedger is not None else {}}
+
+
+    def close(self):
+        with self._lock:
+            http, self._http = self._http, None
+        if http is not None:
+            http.close()
+
+
+    async def aclose(self):
+        ahttp, self._ahttp, self._aloop = self._ahttp, None, None
+        if ahttp is not None:
+            await ahttp.aclose()
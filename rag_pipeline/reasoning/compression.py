@@ -0,0 +1,151 @@
+from __future__ import annotations
+import re
+import math
+import time
+import numpy as np
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .context_packer import _CJK, _LATIN, Context_Packer, sentence_spans
+from ..monitoring.hooks import stage
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+
+_EQUATION = re.compile(r"\$\$.+?\$\$|\\\[.+?\\\]", re.S)
+
+
+def _tokens(text: str) -> List[str]:
+    """BM25 用的词项（保留重复）：英文按词、中文按相邻二字"""
+    text = text.lower()
+    cjk  = _CJK.findall(text)
+    return _LATIN.findall(text) + [a + b for a, b in zip(cjk, cjk[1:])]
+
+
+def split_units(text: str) -> List[Tuple[int, int, bool]]:
+    """
+    把页级父块切成 (start, end, is_equation) 单元：行间公式（$$…$$ / \\[…\\]）整体为一个单元，
+    其余部分按句切分
+    """
+    units, pos = [], 0
+    for m in _EQUATION.finditer(text):
+        units += [(pos + a, pos + b, False) for a, b in sentence_spans(text[pos:m.start()])]
+        units.append((m.start(), m.end(), True))
+        pos = m.end()
+    units += [(pos + a, pos + b, False) for a, b in sentence_spans(text[pos:])]
+    return units
+
+
+
+class Context_Compressor():
+    """
+    重排之后、拼 prompt 之前的抽取式上下文压缩（只处理文本父块，图表父块原样保留）
+    --------------------------------------------------------------
+    • 所有父块的所有句子一次性打分：
+          method="embedding"：embed_fn（一般为 retriever.embeddings.embed_documents，复用已加载的模型）
+                              对 [query] + 全部句子做一次嵌入，归一化后一次矩阵乘得到余弦相似度
+          method="bm25"     ：把全部句子当作一个小语料建 BM25_Matrix，一次 get_scores 得到各句分数
+    • 每个父块保留分数最高的 ratio 比例的句子（夹在 [min_keep, max_keep] 之间），按原文顺序拼接，
+      不相邻处用 “…” 连接；句子数不超过 min_keep 的短父块不压缩
+    • 行间公式的前一句或后一句被保留时公式一并保留（公式多由前一句引出、或由后一句解释）
+    返回压缩后的父块副本（原 Document 不被修改）；压缩率与耗时见 last_report 与 context_compress 阶段事件
+    """
+
+    def __init__(self,
+                 method: str = "bm25",
+                 embed_fn: Optional[Callable[[List[str]], Sequence[Sequence[float]]]] = None,
+                 ratio: float = 0.3,
+                 min_keep: int = 2,
+                 max_keep: Optional[int] = 12):
+        if method not in {"embedding", "bm25"}:
+            raise ValueError(f"未知的打分方式: {method}（可选 'embedding' / 'bm25'）")
+        if method == "embedding" and embed_fn is None:
+            raise ValueError("method='embedding' 需要传入 embed_fn")
+        self.method   = method
+        self.embed_fn = embed_fn
+        self.ratio    = ratio
+        self.min_keep = min_keep
+        self.max_keep = max_keep
+        self.last_report: Dict[str, float] = {}
+
+
+    def _score(self, query: str, sentences: List[str]) -> np.ndarray:
+        if not sentences:
+            return np.zeros(0)
+        if self.method == "embedding":
+            vecs  = np.asarray(self.embed_fn([query] + sentences), dtype="float32")
+            vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+            return vecs[1:] @ vecs[0]
+
+        from ..retrieval.bm25_matrix import BM25_Matrix
+        return BM25_Matrix.from_corpus([_tokens(s) for s in sentences]).get_scores(_tokens(query))
+
+
+    def _n_keep(self, n: int) -> int:
+        k = max(self.min_keep, math.ceil(self.ratio * n))
+        return min(k, self.max_keep) if self.max_keep is not None else k
+
+
+    @staticmethod
+    def _equations(units: List[Tuple[int, int, bool]], chosen: List[int]) -> List[int]:
+        """前 / 后相邻的句单元有一个被选中的公式单元下标"""
+        kept, eqs, prev, pending = set(chosen), [], None, []
+        for i, (_, _, is_eq) in enumerate(units):
+            if is_eq:
+                if prev in kept:
+                    eqs.append(i)
+                else:
+                    pending.append(i)                  # 等后一句决定
+                continue
+            if i in kept:
+                eqs += pending
+            pending, prev = [], i
+        return eqs
+
+
+    def compress(self, query: str, top_text_parents: List[Document]) -> List[Document]:
+        t0 = time.perf_counter()
+        report = {"blocks": len(top_text_parents), "compressed_blocks": 0,
+                  "sentences_in": 0, "sentences_kept": 0, "equations_kept": 0,
+                  "chars_in": 0, "chars_out": 0}
+
+        with stage("context_compress", method=self.method, blocks=len(top_text_parents)) as st:
+            layout, sentences = [], []
+            for doc in top_text_parents:
+                units = split_units(doc.page_content)
+                sent  = [i for i, u in enumerate(units) if not u[2]]
+                layout.append((units, sent, len(sentences)))
+                sentences += [doc.page_content[units[i][0]:units[i][1]].strip() for i in sent]
+
+            scores = self._score(query, sentences)
+
+            out = []
+            for doc, (units, sent, offset) in zip(top_text_parents, layout):
+                text = doc.page_content
+                report["chars_in"]     += len(text)
+                report["sentences_in"] += len(sent)
+                k = self._n_keep(len(sent))
+                if len(sent) <= k:
+                    out.append(doc)
+                    report["chars_out"]      += len(text)
+                    report["sentences_kept"] += len(sent)
+                    report["equations_kept"] += len(units) - len(sent)
+                    continue
+
+                block  = scores[offset:offset + len(sent)]
+                chosen = [sent[j] for j in np.argsort(-block, kind="stable")[:k]]
+                eqs    = self._equations(units, chosen)
+                keep   = sorted(chosen + eqs)
+                content = Context_Packer._join(text, units, keep)
+
+                out.append(type(doc)(page_content=content, metadata=dict(doc.metadata)))
+                report["compressed_blocks"] += 1
+                report["chars_out"]      += len(content)
+                report["sentences_kept"] += len(chosen)
+                report["equations_kept"] += len(eqs)
+
+            report["ratio"]      = report["chars_out"] / report["chars_in"] if report["chars_in"] else 1.0
+            report["latency_ms"] = (time.perf_counter() - t0) * 1000
+            st.set(**{k: v for k, v in report.items() if k not in {"blocks", "latency_ms"}})
+        self.last_report = report
+        return out
@@ -0,0 +1,235 @@
+from __future__ import annotations
+import re
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from .utils import block_header, context_order
+from ..monitoring.hooks import stage
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+
+_SENTENCE   = re.compile(r"(?:[^。！？；!?;\n.]|\.(?!\s|$))+[。！？；!?;.]*")
+_LATIN      = re.compile(r"[a-z0-9]+")
+_CJK        = re.compile(r"[一-鿿]")
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """按中英文句末标点与换行切句，返回各句在原文中的 (start, end)；小数点 / 缩写中的 '.' 不切"""
+    return [m.span() for m in _SENTENCE.finditer(text) if m.group().strip()]
+
+
+def _norm(sentence: str) -> str:
+    return re.sub(r"\s+", "", sentence).lower()
+
+
+def _terms(text: str) -> set:
+    """英文按词、中文按相邻二字切分，用于句子与 query 的词项重合度"""
+    text  = text.lower()
+    terms = set(_LATIN.findall(text))
+    cjk   = _CJK.findall(text)
+    terms.update(a + b for a, b in zip(cjk, cjk[1:]))
+    return terms
+
+
+
+class Context_Packer():
+    """
+    按 token 预算打包检索上下文（build_retrieval_prompt 的前置步骤）
+    --------------------------------------------------------------
+    • token 数用 tiktoken o200k_base（与切分器一致），按句缓存，重复出现的句子不重复编码
+    • 去重：按重排顺序遍历，与已选内容重复的句子（相邻父块的重叠区间、块内重复段落）直接丢弃，
+      去重后为空的父块整块跳过
+    • 块内裁剪：每块最多 per_block 个 token，句子按与 query 的词项重合度排序保留；
+      传入 matched_children 时，落在命中子块内的句子优先；保留的句子按原文顺序拼接，断开处用 “…”
+    • 预算分配：按重排分数（未给分数时即重排顺序）贪心填充，
+      图表块最多占 media_share 的预算，未用完的部分留给文本；装不下整块时裁到剩余预算，
+      剩余不足 min_block 个 token 则跳过该块
+    返回的是裁剪后的块副本（原 Document 不被修改），按打包时的分数顺序排列；进入 prompt 时
+    _assemble_prompt 再按 context_order（书 → 页 → 类型）重排并编号为 [01]、[02]…，
+    块头的 token 数按这一最终编号计算。预算使用情况见 last_report 与 context_pack 阶段事件
+    """
+
+    def __init__(self,
+                 budget: int = 6000,
+                 per_block: int = 800,
+                 min_block: int = 48,
+                 media_share: float = 0.3,
+                 encoding: str = "o200k_base",
+                 cache_size: int = 100_000):
+        self.budget      = budget
+        self.per_block   = per_block
+        self.min_block   = min_block
+        self.media_share = media_share
+        self.encoding    = encoding
+        self.cache_size  = cache_size
+
+        self._enc   = None
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock  = threading.Lock()
+        self.last_report: Dict[str, float] = {}
+
+
+    @property
+    def ENC(self):
+        if self._enc is None:
+            import tiktoken
+            self._enc = tiktoken.get_encoding(self.encoding)
+        return self._enc
+
+
+    def count(self, text: str, cache: bool = True) -> int:
+        """带 LRU 缓存的 token 计数；整段 prompt 这类一次性文本用 cache=False"""
+        if not cache:
+            return len(self.ENC.encode(text, disallowed_special=()))
+        with self._lock:
+            n = self._cache.get(text)
+            if n is not None:
+                self._cache.move_to_end(text)
+                return n
+        n = len(self.ENC.encode(text, disallowed_special=()))
+        with self._lock:
+            self._cache[text] = n
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return n
+
+
+    def truncate(self, text: str, limit: int) -> str:
+        ids = self.ENC.encode(text, disallowed_special=())
+        return text if len(ids) <= limit else self.ENC.decode(ids[:limit]) + " …"
+
+
+    # ------------------------------------------------------------------
+    def _head_bound(self, doc: Document, n: int) -> int:
+        """打包时块头 token 数的上界：最终编号要等整组选定、按 context_order 排序后才确定，取 1..n 中最多的"""
+        return max(self.count(block_header(doc, k)) for k in range(1, n + 1)) + 2
+
+
+    def _head_tokens(self, docs: Sequence[Document]) -> int:
+        """按 _assemble_prompt 的最终顺序与编号计算整组块头的 token 数（+2 为块头后的换行与块间空行）"""
+        return sum(self.count(block_header(d, i + 1)) + 2 for i, d in enumerate(sorted(docs, key=context_order)))
+
+
+    def _select(self, sentences: List[str], scores: Dict[int, float], limit: int) -> Tuple[List[int], int]:
+        """在 limit 个 token 内按分数选句（只在 scores 的候选里选），返回 (原文顺序的句子下标, token 数)"""
+        order = sorted(scores, key=lambda i: (-scores[i], i))
+        keep, used = [], 0
+        for i in order:
+            n = self.count(sentences[i])
+            if used + n > limit:
+                continue
+            keep.append(i)
+            used += n
+        return sorted(keep), used
+
+
+    @staticmethod
+    def _join(text: str, spans: List[Tuple[int, int]], keep: List[int]) -> str:
+        """相邻句保留原文中的分隔（换行 / 空白），不相邻处用 “…” 连接"""
+        parts, prev = [], None
+        for i in keep:
+            if prev is not None:
+                parts.append(text[spans[prev][1]:spans[i][0]] if i == prev + 1 else " … ")
+            parts.append(text[spans[i][0]:spans[i][1]].strip())
+            prev = i
+        return "".join(parts)
+
+
+    def _pack_group(self,
+                    query_terms: set,
+                    docs: Sequence[Document],
+                    scores: Optional[Sequence[float]],
+                    children: Optional[Sequence[List[Document]]],
+                    budget: int,
+                    seen: set,
+                    report: dict) -> Tuple[List[Document], int]:
+        """返回 (裁剪后的块, 块内正文 token 数)；预算检查时块头按 _head_bound 预留"""
+        order = range(len(docs))
+        if scores is not None:
+            order = sorted(order, key=lambda i: (-scores[i], i))
+
+        out, used, heads = [], 0, 0
+        for i in order:
+            doc   = docs[i]
+            text  = doc.page_content
+            spans = sentence_spans(text)
+            sentences = [text[a:b].strip() for a, b in spans]
+            report["tokens_in"] += sum(self.count(s) for s in sentences)
+
+            fresh, local = [], set()
+            for j, s in enumerate(sentences):
+                key = _norm(s)
+                if key not in seen and key not in local:
+                    fresh.append(j)
+                    local.add(key)
+            report["dup_sentences"] += len(sentences) - len(fresh)
+            if not fresh:
+                report["dup_blocks"] += 1
+                continue
+
+            hits = " ".join(_norm(c.page_content) for c in children[i]) if children is not None else ""
+            sent_scores = {}
+            for j in fresh:
+                s = sentences[j]
+                overlap = len(_terms(s) & query_terms) / len(query_terms) if query_terms else 0.0
+                sent_scores[j] = overlap + (1.0 if hits and _norm(s) in hits else 0.0)
+
+            head  = self._head_bound(doc, len(docs))
+            limit = min(self.per_block, budget - used - heads - head)
+            if limit < self.min_block:
+                report["skipped_blocks"] += 1
+                continue
+            keep, n = self._select(sentences, sent_scores, limit)
+            trimmed = len(keep) < len(sentences)
+            if keep:
+                content = self._join(text, spans, keep)
+            else:                                            # 单句（如无标点的表格）就超限：按 token 硬截断
+                keep    = [max(sent_scores, key=lambda j: (sent_scores[j], -j))]
+                content = self.truncate(sentences[keep[0]], limit - 2)
+                n       = self.count(content)
+                trimmed = True
+            report["trimmed_blocks"] += trimmed
+
+            seen.update(_norm(sentences[k]) for k in keep)
+            out.append(type(doc)(page_content=content, metadata=dict(doc.metadata)))
+            used  += n
+            heads += head
+        return out, used
+
+
+    def pack(self,
+             query: str,
+             top_text_parents: List[Document],
+             top_media_parents: List[Document],
+             text_scores: Optional[Sequence[float]] = None,
+             media_scores: Optional[Sequence[float]] = None,
+             matched_children: Optional[Sequence[List[Document]]] = None,
+             budget: Optional[int] = None) -> Tuple[List[Document], List[Document]]:
+        """
+        matched_children 与 top_text_parents 对齐（见 Hybrid_Retriever.hybrid_retrieve_parents(with_children=True)）；
+        返回的块按打包顺序（重排分数，未给分数时为重排顺序）排列，进入 prompt 时由 _assemble_prompt
+        按 context_order 重排、重新编号；tokens_used 按最终编号的块头计算
+        """
+        budget = self.budget if budget is None else budget
+        report = {"budget": budget, "tokens_in": 0, "dup_sentences": 0, "dup_blocks": 0,
+                  "trimmed_blocks": 0, "skipped_blocks": 0,
+                  "blocks_in": len(top_text_parents) + len(top_media_parents)}
+        q_terms, seen = _terms(query), set()
+
+        with stage("context_pack", budget=budget, blocks_in=report["blocks_in"]) as st:
+            media, media_used = self._pack_group(q_terms, top_media_parents, media_scores, None,
+                                                 int(budget * self.media_share), seen, report)
+            media_used += self._head_tokens(media)
+            text, text_used   = self._pack_group(q_terms, top_text_parents, text_scores, matched_children,
+                                                 budget - media_used, seen, report)
+            text_used  += self._head_tokens(text)
+            report.update(tokens_used=text_used + media_used,
+                          text_tokens=text_used, media_tokens=media_used,
+                          blocks_out=len(text) + len(media),
+                          budget_use=(text_used + media_used) / budget if budget else 0.0)
+            st.set(**{k: v for k, v in report.items() if k not in {"budget", "blocks_in"}})
+        self.last_report = report
+        return text, media
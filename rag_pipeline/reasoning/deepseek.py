@@ -1,7 +1,10 @@
 import os
-from openai import OpenAI
+import time
+import itertools
 from typing import Iterator, Tuple
 from .utils import build_retrieval_prompt
+from .client import Think_Tagger
+from ..monitoring.hooks import record, stage
 
 
 
@@ -10,10 +13,23 @@ def DeepSeek(query: str,
              top_media_parents: str,
              model: str = "deepseek-reasoner", # R1, "deepseek-chat" v3,
              max_tokens: int = 64 * 1024,
-             temperature: float = 0.7):
+             temperature: float = 0.7,
+             hedger=None,
+             packer=None,
+             compressor=None,
+             text_scores=None,
+             media_scores=None,
+             matched_children=None):
+    """
+    hedger（rag_pipeline.remote.Hedger）非空时，慢于分位数延迟的请求会补发一个副本，先返回者胜出
+    packer（Context_Packer）非空时检索上下文先按 token 预算去重 / 裁剪；
+    text_scores / media_scores / matched_children（与父块对齐）给出时 packer 按分数分配预算、优先保留命中子块
+    compressor（Context_Compressor）非空时文本父块先做抽取式压缩
+    """
 
     # build llm input
-    prompt_input = build_retrieval_prompt(query, top_text_parents, top_media_parents)
+    prompt_input = build_retrieval_prompt(query, top_text_parents, top_media_parents, packer, compressor,
+                                          text_scores, media_scores, matched_children)
     
     # llm reasoning
     print("------------llm reasoning--------------")
@@ -21,17 +37,22 @@ def DeepSeek(query: str,
     if not deepseek_key:
         raise RuntimeError("请先确保 DEEPSEEK_API_KEY 已正确设置并激活了 mmrag 环境")
 
+    from openai import OpenAI
     client = OpenAI(api_key=deepseek_key, base_url="https://api.deepseek.com")
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant"},
-            {"role": "user", "content": prompt_input},
-        ],
-        max_tokens  = max_tokens,     
-        temperature = temperature,
-        stream=False
-    )
+    def _once():
+        return client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant"},
+                {"role": "user", "content": prompt_input},
+            ],
+            max_tokens  = max_tokens,     
+            temperature = temperature,
+            stream=False
+        )
+
+    with stage("generation", model=model, stream=False):
+        response = hedger.call(_once) if hedger is not None else _once()
     
     return response
 
@@ -39,75 +60,120 @@ def DeepSeek(query: str,
 def DeepSeek_Stream(query: str,
                     top_text_parents: str,
                     top_media_parents: str,
-                    model: str = "deepseek-reasoner", # R1, "deepseek-chat" v3,    
+                    model: str = None, # 默认 "deepseek-reasoner"（R1），"deepseek-chat" 为 v3；传 client 时默认用 client.model
                     max_tokens: int = 64 * 1024,
-                    temperature: float = 0.7) -> Tuple[Iterator[str], "callable"]:
+                    temperature: float = 0.7,
+                    hedger=None,
+                    client=None,
+                    packer=None,
+                    compressor=None,
+                    response_cache=None,
+                    text_scores=None,
+                    media_scores=None,
+                    matched_children=None) -> Tuple[Iterator[str], "callable"]:
 
     """
     返回 (token_iterator, done)：
           token_iterator — 逐 token 字符串，可直接 for 循环 / yield 给前端
           done()         — 调用后得到完整回复文本（已自动累计）
+    hedger（rag_pipeline.remote.Hedger）非空时对“建立流 + 收到首个 chunk”做对冲：
+    首包慢于分位数延迟则补发一个副本，先收到首包的流胜出，落败的流被关闭
+    client（DeepSeek_Client）非空时改走其长驻连接池，不再新建 OpenAI 客户端：model 透传（为空时用 client.model）；
+    hedger / packer / compressor / response_cache 以 client 的配置为准，另传与之不同的对象会报错
+    packer（Context_Packer）非空时检索上下文先按 token 预算去重 / 裁剪；
+    text_scores / media_scores / matched_children（与父块对齐）给出时 packer 按分数分配预算、优先保留命中子块
+    compressor（Context_Compressor）非空时文本父块先做抽取式压缩
+    response_cache（ResponseCache）非空时请求体完全相同的调用直接回放缓存的流（键与 DeepSeek_Client 一致，可共用一个缓存）
     """
+    context = {"text_scores": text_scores, "media_scores": media_scores, "matched_children": matched_children}
+    if client is not None:
+        conflicts = [name for name, value in (("hedger", hedger), ("packer", packer), ("compressor", compressor),
+                                              ("response_cache", response_cache))
+                     if value is not None and value is not getattr(client, name)]
+        if conflicts:
+            raise ValueError(f"传入 client 时 {', '.join(conflicts)} 由 client 决定，"
+                             f"请在创建 DeepSeek_Client 时配置（或不要另行传入）")
+        return client(query, top_text_parents, top_media_parents,
+                      max_tokens=max_tokens, temperature=temperature, model=model, **context)
+    model = model or "deepseek-reasoner"
   
     # build llm input
-    prompt_input = build_retrieval_prompt(query, top_text_parents, top_media_parents)
+    prompt_input = build_retrieval_prompt(query, top_text_parents, top_media_parents, packer, compressor,
+                                          **context)
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user",   "content": prompt_input},
+    ]
+
+    tagger = Think_Tagger()
+    key    = None
+    if response_cache is not None:
+        key    = response_cache.key({"model": model, "messages": messages,
+                                     "max_tokens": max_tokens, "temperature": temperature})
+        cached = response_cache.get(key)
+        if cached is not None:
+            def _replay() -> Iterator[str]:
+                for reasoning, content in cached:
+                    yield from tagger.feed(reasoning, content)
+            return _replay(), tagger.done
 
     deepseek_key = os.getenv("DEEPSEEK_API_KEY")
     if not deepseek_key:
         raise RuntimeError("DEEPSEEK_API_KEY 未设置")
 
+    from openai import OpenAI
     client = OpenAI(api_key=deepseek_key, base_url="https://api.deepseek.com")
 
     # -------------------------------------------
-    stream_resp = client.chat.completions.create(
-        model       = model,
-        messages    = [
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user",   "content": prompt_input},
-        ],
-        max_tokens  = max_tokens,
-        temperature = temperature,
-        stream      = True,
-    )
+    t_start = time.perf_counter()
+    def _open_stream():
+        return client.chat.completions.create(
+            model       = model,
+            messages    = messages,
+            max_tokens  = max_tokens,
+            temperature = temperature,
+            stream      = True,
+        )
+
+    if hedger is None:
+        stream_resp = _open_stream()
+    else:
+        def _first_chunk():
+            resp = _open_stream()
+            it = iter(resp)
+            return resp, list(itertools.islice(it, 1)), it
+
+        _, head, rest = hedger.call(_first_chunk, discard=lambda r: r[0].close())
+        stream_resp = itertools.chain(head, rest)
 
     # ------------------
-    reasoning_parts, answer_parts = [], []
     def _iter_tokens() -> Iterator[str]:
         """
         1) 推理阶段先输出 <think>…</think> 包裹的思考 token
         2) 后续正文直接输出
         """
-        thinking_started = False         # 是否已输出 <think>
-        thinking_ended   = False         # 是否已输出 </think>
+        first_token = True               # 首 token 延迟（从发起请求算起）
+        deltas = []
 
         for chunk in stream_resp:
             delta = chunk.choices[0].delta
-
-            # ---------- 思考阶段 ----------
-            if getattr(delta, "reasoning_content", None):
-                if not thinking_started:
-                    thinking_started = True
-                    yield "<think>"                     # 开始标签
-                tok = delta.reasoning_content
-                reasoning_parts.append(tok)
-                yield tok
-                continue
-
-            # ---------- 正文阶段 ----------
-            if getattr(delta, "content", None):
-                if thinking_started and not thinking_ended:
-                    thinking_ended = True
-                    yield "</think>"                    # 结束标签
-                tok = delta.content
-                answer_parts.append(tok)
-                yield tok
-
-    
-    def _done() -> Tuple[str, str]:
-        return "".join(reasoning_parts), "".join(answer_parts)
+            reasoning = getattr(delta, "reasoning_content", None)
+            content   = getattr(delta, "content", None)
+            if first_token and (reasoning or content):
+                first_token = False
+                record("first_token", time.perf_counter() - t_start, model=model)
+            if reasoning or content:
+                deltas.append((reasoning, content))
+            yield from tagger.feed(reasoning, content)
+
+        if key is not None:              # 只缓存完整结束的流
+            response_cache.put(key, deltas)
+        reasoning, answer = tagger.done()
+        record("generation", time.perf_counter() - t_start, model=model, stream=True,
+               reasoning_chars=len(reasoning), answer_chars=len(answer))
 
     
-    return _iter_tokens(), _done
+    return _iter_tokens(), tagger.done
 
 
 
@@ -0,0 +1,50 @@
+from __future__ import annotations
+import json
+import hashlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from ..cache import Tiered_Cache
+
+Delta = Tuple[Optional[str], Optional[str]]           # (reasoning_content, content)
+
+
+
+class ResponseCache(Tiered_Cache):
+    """
+    推理回复的精确匹配缓存（LRU + SQLite，见 Tiered_Cache）
+    --------------------------------------------------------------
+    • 键 = 完整请求体（模型 + messages + 采样参数）的哈希：prompt 完全相同才命中
+    • 值 = 流式返回的增量序列 [(reasoning, content), ...]，命中时按原顺序回放，
+      <think> 标记与 done() 的结果与真实调用一致
+    • 只缓存完整结束的流；中途取消 / 出错的回复不会写入
+    • 注意：temperature > 0 时命中即意味着相同问题总得到同一份回答
+    DeepSeek_Client(response_cache=...) 与 DeepSeek_Stream(response_cache=...) 都会查询它
+    """
+
+    TABLE       = "responses"
+    COLUMN      = "deltas"
+    COLUMN_TYPE = "TEXT"
+
+    def __init__(self,
+                 path: "str | Path | None" = None,
+                 capacity: int = 2_000,
+                 ttl: Optional[float] = 24 * 3600):
+        super().__init__(path, capacity, ttl)
+
+
+    @staticmethod
+    def key(payload: dict) -> str:
+        body = {k: v for k, v in payload.items() if k != "stream"}
+        raw  = json.dumps(body, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+    def _normalize(self, deltas) -> List[Delta]:
+        return [tuple(d) for d in deltas]
+
+    def _encode(self, deltas: List[Delta]) -> str:
+        return json.dumps(deltas, ensure_ascii=False)
+
+    def _decode(self, raw: str) -> List[Delta]:
+        return [tuple(d) for d in json.loads(raw)]
@@ -1,14 +1,25 @@
+from __future__ import annotations
 import textwrap
-from typing import List
-from langchain.docstore.document import Document
+from typing import TYPE_CHECKING, List, Optional, Sequence
 
+from ..monitoring.hooks import stage
 
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+    from .context_packer import Context_Packer
+    from .compression import Context_Compressor
 
-def block_fmt(doc: Document, idx: int) -> str:
+
+
+def block_header(doc: Document, idx: int) -> str:
     tp  = doc.metadata["type"]
     pg  = doc.metadata["page_idx"]
     b   = doc.metadata["book_idx"]
-    head = f"[{idx:02d}] ({tp.upper()} | book={b}, page={pg})"
+    return f"[{idx:02d}] ({tp.upper()} | book={b}, page={pg})"
+
+
+def block_fmt(doc: Document, idx: int) -> str:
+    head = block_header(doc, idx)
     body = doc.page_content.strip()
     return f"{head}\n{body}"
 
@@ -16,38 +27,74 @@ def block_fmt(doc: Document, idx: int) -> str:
 def build_retrieval_prompt(
     query: str,
     top_text_parents: List[Document],
-    top_media_parents: List[Document]
+    top_media_parents: List[Document],
+    packer: Context_Packer | None = None,
+    compressor: Context_Compressor | None = None,
+    text_scores: Optional[Sequence[float]] = None,
+    media_scores: Optional[Sequence[float]] = None,
+    matched_children: Optional[Sequence[List[Document]]] = None
 ) -> str:
     """
     根据检索出的文本、图表和公式父块，生成最终发给 LLM 的 Prompt 字符串。
+    compressor 非空时先对文本父块做抽取式压缩（只保留与 query 最相关的句子及其公式）；
+    packer 非空时再按其 token 预算去重 / 裁剪上下文，并上报 prompt 的实际 token 数与预算使用率：
+    给出 text_scores / media_scores（与父块对齐的重排分数）时按分数分配预算，
+    给出 matched_children（与 top_text_parents 对齐的命中子块）时块内优先保留命中子块所在的句子
     """
+    if compressor is not None:
+        top_text_parents = compressor.compress(query, top_text_parents)      # 逐块压缩，与分数 / 子块仍对齐
+    if packer is not None:
+        top_text_parents, top_media_parents = packer.pack(query, top_text_parents, top_media_parents,
+                                                          text_scores=text_scores,
+                                                          media_scores=media_scores,
+                                                          matched_children=matched_children)
+    with stage("prompt_build", n_text=len(top_text_parents), n_media=len(top_media_parents)) as st:
+        prompt = _assemble_prompt(query, top_text_parents, top_media_parents)
+        st.set(prompt_chars=len(prompt))
+        if packer is not None:
+            st.set(prompt_tokens=packer.count(prompt, cache=False),
+                   context_tokens=packer.last_report["tokens_used"],
+                   budget_use=packer.last_report["budget_use"])
+    return prompt
+
+
+# 固定不变的说明放在最前面：不同请求的 prompt 共享同一前缀，可命中服务端的前缀缓存
+RAG_INSTRUCTION = textwrap.dedent("""
+    ## Instruction
+    你是专业的技术写作助手，请仔细阅读 **Retrieved Context**，并基于这些检索到的信息回答文末的 **Query**。
+    - 如果问题中的某些点你非常确信可以回答，但是未在检索结果出现，可以尝试采用你掌握的知识进行补充;
+    - 回答过程中请充分结合检索到的公式进行专业的说明;
+    - 回答用简体中文，结构清晰，必要时分条列出。
+""").strip()
+
+
+def context_order(doc: Document) -> tuple:
+    """上下文块的确定性顺序（书 → 页 → 类型），与重排顺序无关：同一组块总是拼出同一段文本"""
+    m = doc.metadata
+    return (m.get("book_idx", -1), m.get("page_idx", -1), m.get("type", ""))
+
+
+def _assemble_prompt(
+    query: str,
+    top_text_parents: List[Document],
+    top_media_parents: List[Document]
+) -> str:
+    # 布局：固定说明 → 按确定顺序排列的上下文 → query（唯一每次都变的部分放最后）
     # A) 文本父块
     text_section = "\n\n".join(
-        block_fmt(d, i + 1) 
-        for i, d in enumerate(top_text_parents)
+        block_fmt(d, i + 1)
+        for i, d in enumerate(sorted(top_text_parents, key=context_order))
     )
     # B) 图表父块
     media_section = "\n\n".join(
-        block_fmt(d, i + 1) 
-        for i, d in enumerate(top_media_parents)
+        block_fmt(d, i + 1)
+        for i, d in enumerate(sorted(top_media_parents, key=context_order))
     )
 
-    # 组装最终 prompt
-    prompt = textwrap.dedent(f"""
-        ## Query
-        {query}
-
-        ## Retrieved Context - TEXT (Top {len(top_text_parents)})
-        {text_section}
-
-        ## Retrieved Context - IMAGE/TABLE (Top {len(top_media_parents)})
-        {media_section}
-
-        ## Instruction
-        你是专业的技术写作助手，请仔细阅读 **Retrieved Context**，并基于这些检索到的信息回答 **Query**。
-        - 如果问题中的某些点你非常确信可以回答，但是未在检索结果出现，可以尝试采用你掌握的知识进行补充;
-        - 回答过程中请充分结合检索到的公式进行专业的说明;
-        - 回答用简体中文，结构清晰，必要时分条列出。
-    """).strip()
-
-    return prompt
+    # 组装最终 prompt（各段已是多行文本，直接拼接，不再经 dedent）
+    return "\n\n".join([
+        RAG_INSTRUCTION,
+        f"## Retrieved Context - TEXT ({len(top_text_parents)} blocks)\n{text_section}",
+        f"## Retrieved Context - IMAGE/TABLE ({len(top_media_parents)} blocks)\n{media_section}",
+        f"## Query\n{query}",
+    ])
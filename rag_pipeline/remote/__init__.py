@@ -0,0 +1,17 @@
+"""
+懒加载：访问某个名字时才导入对应子模块（及其 httpx / Pillow 依赖），
+`import` 本包本身不产生任何副作用。
+"""
+from ..lazy import lazy_exports
+
+_LAZY_ATTRS = {
+    "DashScope_AsyncClient": ".async_client",
+    "AIMD_Limiter":          ".async_client",
+    "RemoteCallError":       ".async_client",
+    "to_openai_messages":    ".async_client",
+    "Hedger":                ".hedging",
+    "Image_Cache":           ".image_cache",
+}
+__all__ = list(_LAZY_ATTRS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _LAZY_ATTRS)
@@ -0,0 +1,329 @@
+from __future__ import annotations
+import os
+import time
+import random
+import base64
+import asyncio
+import logging
+import mimetypes
+import threading
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+DASHSCOPE_COMPAT_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+RETRYABLE_STATUS     = {408, 409, 429, 500, 502, 503, 504}
+
+
+
+class RemoteCallError(RuntimeError):
+    """远程调用最终失败（重试耗尽 / 超过截止时间 / 不可重试的状态码 / 回复无法解析）"""
+
+    def __init__(self, message: str, status: Optional[int] = None, attempts: int = 0):
+        super().__init__(message)
+        self.status   = status
+        self.attempts = attempts
+
+
+
+class AIMD_Limiter():
+    """
+    AIMD 自适应并发上限
+    --------------------------------------------------------------
+    • 成功一次 limit += 1 / limit（约每个“窗口”加 1）
+    • 收到 429 或单次延迟超过 latency_target 时 limit *= backoff，
+      同一冷却期（cooldown 秒）内只收缩一次，避免一串 429 把并发压到底
+    • limit 夹在 [min_limit, max_limit]；acquire() 在 in_flight >= limit 时等待
+    同一时刻只在一个事件循环内使用（DashScope_AsyncClient 的后台循环）；
+    后台循环重建后 Condition 随之重建，旧循环上未归还的名额一并作废
+    """
+
+    def __init__(self,
+                 initial: int = 4,
+                 min_limit: int = 1,
+                 max_limit: int = 32,
+                 backoff: float = 0.5,
+                 latency_target: Optional[float] = None,
+                 cooldown: float = 1.0):
+        self.limit          = float(initial)
+        self.min_limit      = min_limit
+        self.max_limit      = max_limit
+        self.backoff        = backoff
+        self.latency_target = latency_target
+        self.cooldown       = cooldown
+        self.in_flight      = 0
+        self.decreases      = 0
+        self._last_decrease = float("-inf")
+        self._cond          = None
+        self._cond_loop     = None
+
+
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._cond_loop is not loop:   # Condition 绑定在创建它的事件循环上
+            self._cond, self._cond_loop = asyncio.Condition(), loop
+            self.in_flight = 0
+        return self._cond
+
+
+    async def acquire(self):
+        cond = self._condition()
+        async with cond:
+            while self.in_flight >= int(self.limit):
+                await cond.wait()
+            self.in_flight += 1
+
+
+    async def release(self, ok: bool, latency: float, throttled: bool = False):
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            slow = self.latency_target is not None and latency > self.latency_target
+            if throttled or slow:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif ok:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            cond.notify_all()
+
+
+
+def _image_url(path: str) -> str:
+    if path.startswith(("http://", "https://", "data:")):
+        return path
+    if path.startswith("file://"):
+        path = path[len("file://"):]
+    mime = mimetypes.guess_type(path)[0] or "image/png"
+    with open(path, "rb") as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode('ascii')}"
+
+
+def to_openai_messages(messages: List[dict]) -> List[dict]:
+    """
+    DashScope MultiModalConversation 格式 -> OpenAI 兼容格式
+        {"text": ...}  -> {"type": "text", "text": ...}
+        {"image": p}   -> {"type": "image_url", "image_url": {"url": ...}}（本地图片转 data URL）
+    content 已是字符串的消息原样保留
+    """
+    out = []
+    for m in messages:
+        content = m["content"]
+        if isinstance(content, str):
+            out.append(m)
+            continue
+        parts = []
+        for p in content:
+            if "image" in p:
+                parts.append({"type": "image_url", "image_url": {"url": _image_url(p["image"])}})
+            elif "text" in p:
+                parts.append({"type": "text", "text": p["text"]})
+            else:
+                parts.append(p)
+        out.append({"role": m["role"], "content": parts})
+    return out
+
+
+
+class DashScope_AsyncClient():
+    """
+    共享的异步远程调用客户端（DashScope OpenAI 兼容接口）
+    --------------------------------------------------------------
+    • 单个 httpx.AsyncClient 复用连接（keep-alive）
+    • 所有请求经 AIMD_Limiter 控制并发：429 / 高延迟时收缩，成功时缓慢放大
+    • 可重试错误（429 / 5xx / 超时 / 连接错误）做有界重试，指数退避 + full jitter，
+      优先遵守 Retry-After；每次调用有总截止时间 deadline_s
+    • 最终失败抛 RemoteCallError，而不是返回 0 分
+    • 同步调用方（线程池 / 现有同步 API）用 chat_sync / gather_sync，
+      协程在客户端自己的后台事件循环中执行，多个线程共享同一并发上限
+    • hedger（Hedger）非空时每次尝试（单个 HTTP 请求）经其对冲：慢于分位数延迟时再发一个副本，
+      先到者胜出；重试与退避在对冲之外，limiter 的排队时间也不计入对冲的延迟样本
+    base_url 可指向本地桩服务（benchmarks/stubs.py 的 Fake_OpenAI_Server）
+    """
+
+    def __init__(self,
+                 model: str = "qwen2.5-vl-7b-instruct",
+                 api_key: Optional[str] = None,
+                 base_url: str = DASHSCOPE_COMPAT_URL,
+                 limiter: Optional[AIMD_Limiter] = None,
+                 max_retries: int = 4,
+                 deadline_s: float = 60.0,
+                 attempt_timeout_s: float = 30.0,
+                 backoff_base_s: float = 0.5,
+                 backoff_max_s: float = 8.0,
+                 max_connections: int = 64,
+                 hedger=None):
+        self.model             = model
+        self.base_url          = base_url.rstrip("/")
+        self.limiter           = limiter or AIMD_Limiter()
+        self.max_retries       = max_retries
+        self.deadline_s        = deadline_s
+        self.attempt_timeout_s = attempt_timeout_s
+        self.backoff_base_s    = backoff_base_s
+        self.backoff_max_s     = backoff_max_s
+        self.max_connections   = max_connections
+        self.hedger            = hedger
+
+        self._api_key = api_key
+        self._http    = None
+        self._loop    = None
+        self._thread  = None
+        self._lock    = threading.Lock()
+        self.counters = {"calls": 0, "attempts": 0, "retries": 0, "throttled": 0, "failures": 0}
+
+
+    @property
+    def api_key(self) -> str:
+        if self._api_key is None:
+            from dotenv import load_dotenv
+            load_dotenv()
+            key = os.getenv("DASHSCOPE_API_KEY")
+            if not key:
+                raise RuntimeError("请先确保 DASHSCOPE_API_KEY 已正确设置并激活了 mmrag 环境")
+            self._api_key = key
+        return self._api_key
+
+
+    def _client(self):
+        if self._http is None:
+            import httpx
+
+            self._http = httpx.AsyncClient(
+                base_url = self.base_url,
+                headers  = {"Authorization": f"Bearer {self.api_key}"},
+                limits   = httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections),
+                timeout  = self.attempt_timeout_s,
+            )
+        return self._http
+
+
+    def _delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** (attempt - 1)))
+
+
+    async def chat(self,
+                   messages: List[dict],
+                   model: Optional[str] = None,
+                   deadline_s: Optional[float] = None,
+                   **params) -> str:
+        """单次对话补全，返回回复文本；失败抛 RemoteCallError"""
+        import httpx
+
+        http     = self._client()
+        deadline = time.monotonic() + (deadline_s or self.deadline_s)
+        payload  = {"model": model or self.model, "messages": to_openai_messages(messages), **params}
+        self.counters["calls"] += 1
+
+        attempt, status, last = 0, None, "no attempt"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.counters["failures"] += 1
+                raise RemoteCallError(f"超过截止时间（{attempt} 次尝试）: {last}", status, attempt)
+
+            attempt += 1
+            self.counters["attempts"] += 1
+            retry_after, ok, throttled = None, False, False
+            await self.limiter.acquire()                     # 排队时间不计入对冲的延迟样本
+            t0 = time.monotonic()
+            try:
+                resp   = await self._post(http, payload, min(remaining, self.attempt_timeout_s))
+                status = resp.status_code
+                if status == 200:
+                    ok = True
+                else:
+                    throttled   = status == 429
+                    retry_after = resp.headers.get("Retry-After")
+                    last        = f"HTTP {status}: {resp.text[:200]}"
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                status, last = None, f"{type(e).__name__}: {e}"
+            finally:
+                await self.limiter.release(ok, time.monotonic() - t0, throttled)
+
+            if ok:
+                try:
+                    return resp.json()["choices"][0]["message"]["content"]
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    self.counters["failures"] += 1
+                    raise RemoteCallError(f"无法解析回复: {e}", status, attempt) from e
+
+            self.counters["throttled"] += throttled
+            if status is not None and status not in RETRYABLE_STATUS:
+                self.counters["failures"] += 1
+                raise RemoteCallError(last, status, attempt)
+            if attempt > self.max_retries:
+                self.counters["failures"] += 1
+                raise RemoteCallError(f"重试 {self.max_retries} 次后仍失败: {last}", status, attempt)
+
+            self.counters["retries"] += 1
+            delay = min(self._delay(attempt, retry_after), deadline - time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+    async def _post(self, http, payload: dict, timeout: float):
+        """单次尝试：hedger 非空时只对冲这一次 HTTP 请求，不含重试与退避"""
+        def send():
+            return asyncio.wait_for(http.post("/chat/completions", json=payload), timeout=timeout)
+
+        if self.hedger is None:
+            return await send()
+        return await self.hedger.acall(send)
+
+
+    # ------------------------------------------------------------------
+    # 同步桥接：协程提交到后台事件循环
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or not self._thread.is_alive():
+                self._loop   = asyncio.new_event_loop()
+                self._http   = None                          # 连接池绑定在事件循环上
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                name="remote-client", daemon=True)
+                self._thread.start()
+        return self._loop
+
+
+    def chat_sync(self, messages: List[dict], **kwargs) -> str:
+        self.api_key                                          # 未配置 key 时在调用方线程直接抛出
+        return asyncio.run_coroutine_threadsafe(self.chat(messages, **kwargs), self._ensure_loop()).result()
+
+
+    def gather_sync(self, message_lists: List[List[dict]], **kwargs) -> List[Union[str, Exception]]:
+        """并发执行多次调用（并发度由 limiter 决定），结果与输入等长，失败项为异常对象"""
+        self.api_key
+
+        async def _all():
+            return await asyncio.gather(*(self.chat(m, **kwargs) for m in message_lists),
+                                        return_exceptions=True)
+
+        return asyncio.run_coroutine_threadsafe(_all(), self._ensure_loop()).result()
+
+
+    def stats(self) -> Dict[str, float]:
+        return {**self.counters,
+                "limit":     round(self.limiter.limit, 2),
+                "in_flight": self.limiter.in_flight,
+                "decreases": self.limiter.decreases,
+                "hedging":   self.hedger.stats() if self.hedger is not None else {}}
+
+
+    def close(self):
+        with self._lock:
+            loop, thread, http = self._loop, self._thread, self._http
+            self._loop = self._thread = self._http = None
+        if loop is None:
+            return
+        if http is not None:
+            asyncio.run_coroutine_threadsafe(http.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -0,0 +1,167 @@
+from __future__ import annotations
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+
+class Hedger():
+    """
+    请求对冲（hedged requests），压低远程调用的长尾延迟
+    --------------------------------------------------------------
+    • 主请求发出后等待 delay：delay 取最近 window 次成功调用延迟的 percentile 分位数，
+      样本不足 min_samples 时用 initial_delay_s
+    • 到时仍未返回则再发一个相同的副本，先成功者胜出，另一个被取消：
+        - acall（协程）：落败的 task 直接 cancel，底层 HTTP 请求随之中断
+        - call（同步）：尚未开始的落败任务被取消；已在执行的同步 SDK 调用无法中断，
+          其结果丢弃，并交给 discard 回调释放资源（如关闭流式响应）
+    • 额外负载上限：累计对冲数 <= max_extra * 调用数 + burst，超出时不对冲（记 denied）
+    • 只对慢请求对冲，不对失败重试（重试由 DashScope_AsyncClient 负责）；
+      主请求在 delay 内失败时直接抛出
+    stats() 返回 调用数 / 对冲率 / 副本胜出数 / 当前 delay
+    """
+
+    def __init__(self,
+                 percentile: float = 95.0,
+                 initial_delay_s: float = 1.0,
+                 min_delay_s: float = 0.02,
+                 max_extra: float = 0.1,
+                 burst: int = 5,
+                 window: int = 256,
+                 min_samples: int = 20,
+                 max_workers: int = 64):
+        self.percentile      = percentile
+        self.initial_delay_s = initial_delay_s
+        self.min_delay_s     = min_delay_s
+        self.max_extra       = max_extra
+        self.burst           = burst
+        self.min_samples     = min_samples
+        self.max_workers     = max_workers
+
+        self._lat  = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._pool = None
+        self.counters = {"calls": 0, "hedged": 0, "hedge_wins": 0, "denied": 0}
+
+
+    def delay(self) -> float:
+        with self._lock:
+            samples = sorted(self._lat)
+        if len(samples) < self.min_samples:
+            return self.initial_delay_s
+        k = min(len(samples) - 1, int(round(self.percentile / 100 * (len(samples) - 1))))
+        return max(self.min_delay_s, samples[k])
+
+
+    def _observe(self, seconds: float):
+        with self._lock:
+            self._lat.append(seconds)
+
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+
+    def _allow_hedge(self) -> bool:
+        with self._lock:
+            c = self.counters
+            if c["hedged"] < self.max_extra * c["calls"] + self.burst:
+                c["hedged"] += 1
+                return True
+            c["denied"] += 1
+            return False
+
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="hedge")
+            return self._pool
+
+
+    # ------------------------------------------------------------------
+    def call(self, fn: Callable[..., Any], *args, discard: Optional[Callable[[Any], None]] = None, **kwargs):
+        """同步对冲调用：返回 fn(*args, **kwargs) 最先成功的结果"""
+        self._count("calls")
+        pool = self._executor()
+
+        def timed():
+            t0 = time.monotonic()
+            out = fn(*args, **kwargs)
+            self._observe(time.monotonic() - t0)
+            return out
+
+        primary = pool.submit(timed)
+        done, _ = wait([primary], timeout=self.delay())
+        if done or not self._allow_hedge():
+            return primary.result()
+
+        pending = {primary: "primary", pool.submit(timed): "backup"}
+        errors  = []
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for fut in done:
+                who = pending.pop(fut)
+                if fut.exception() is not None:
+                    errors.append(fut.exception())
+                    continue
+                if who == "backup":
+                    self._count("hedge_wins")
+                for loser in pending:
+                    if not loser.cancel() and discard is not None:
+                        loser.add_done_callback(
+                            lambda f: f.exception() is None and discard(f.result()))
+                return fut.result()
+        raise errors[0]
+
+
+    async def acall(self, factory: Callable[[], Awaitable[Any]]):
+        """异步对冲调用：factory() 每次返回一个新的协程"""
+        self._count("calls")
+        loop = asyncio.get_running_loop()
+
+        async def timed():
+            t0 = loop.time()
+            out = await factory()
+            self._observe(loop.time() - t0)
+            return out
+
+        tasks = {asyncio.ensure_future(timed()): "primary"}
+        try:
+            done, _ = await asyncio.wait(list(tasks), timeout=self.delay())
+            if done or not self._allow_hedge():
+                return await next(iter(tasks))
+
+            tasks[asyncio.ensure_future(timed())] = "backup"
+            errors = []
+            while tasks:
+                done, _ = await asyncio.wait(list(tasks), return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    who = tasks.pop(t)
+                    if t.exception() is not None:
+                        errors.append(t.exception())
+                        continue
+                    if who == "backup":
+                        self._count("hedge_wins")
+                    return t.result()
+            raise errors[0]
+        finally:
+            for t in tasks:
+                t.cancel()
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+        calls = max(c["calls"], 1)
+        return {
+            **c,
+            "hedge_rate": c["hedged"] / calls,
+            "win_rate":   c["hedge_wins"] / max(c["hedged"], 1),
+            "delay_s":    round(self.delay(), 4),
+        }
@@ -0,0 +1,132 @@
+from __future__ import annotations
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+
+class Image_Cache():
+    """
+    内容寻址的图片预处理缓存（VL 重排 / 图片描述 / 图文改写共用）
+    --------------------------------------------------------------
+    • 原图按内容哈希 + 处理参数定位缩略图：<root>/<hash[:2]>/<hash>.<ext>
+      同一张图无论来自哪个 img_path、哪个调用点，都只缩放 / 重编码一次
+    • 最长边缩到 max_side（不放大），以 JPEG / WEBP 的 quality 重新编码；
+      JPEG 不支持透明通道时先铺白底转 RGB
+    • 重编码后反而更大的图直接返回原路径（同样记入缓存，不再重复尝试）
+    • (路径, mtime, size) -> 缩略图 的内存映射避免每次查询都重读原图计算哈希
+    • 线程安全；写入走临时文件 + os.replace，多进程并发写同一缩略图也不会读到半个文件
+    stats() 返回 命中 / 生成次数、原始字节数与实际发送字节数、节省字节数
+    """
+
+    def __init__(self,
+                 root: "str | Path",
+                 max_side: int = 1024,
+                 fmt: str = "JPEG",
+                 quality: int = 85):
+        fmt = fmt.upper()
+        if fmt not in {"JPEG", "WEBP"}:
+            raise ValueError(f"不支持的缩略图格式: {fmt}（可选 'JPEG' / 'WEBP'）")
+        self.root     = Path(root)
+        self.max_side = max_side
+        self.fmt      = fmt
+        self.quality  = quality
+        self.ext      = ".jpg" if fmt == "JPEG" else ".webp"
+
+        self._memo: Dict[Tuple[str, int, int], Tuple[str, int, int]] = {}
+        self._lock = threading.Lock()
+        self.counters = {"lookups": 0, "hits": 0, "encoded": 0, "kept_original": 0,
+                         "bytes_original": 0, "bytes_served": 0}
+
+
+    def _key(self, data: bytes) -> str:
+        h = hashlib.blake2b(data, digest_size=16)
+        h.update(f"|{self.max_side}|{self.fmt}|{self.quality}".encode())
+        return h.hexdigest()
+
+
+    def _encode(self, src: str, dst: Path):
+        from PIL import Image
+
+        with Image.open(src) as im:
+            im.thumbnail((self.max_side, self.max_side))        # 保持长宽比，不放大
+            if self.fmt == "JPEG" and im.mode not in {"RGB", "L"}:
+                rgba = im.convert("RGBA")
+                bg = Image.new("RGB", rgba.size, (255, 255, 255))
+                bg.paste(rgba, mask=rgba.split()[-1])
+                im = bg
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=dst.parent, suffix=self.ext)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    im.save(f, format=self.fmt, quality=self.quality)
+                os.replace(tmp, dst)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+
+
+    def _resolve(self, path: str) -> Tuple[str, int, int, bool]:
+        """返回 (发送路径, 原始字节数, 发送字节数, 是否命中缓存)"""
+        st = os.stat(path)
+        memo_key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            hit = self._memo.get(memo_key)
+        if hit is not None:
+            return (*hit, True)
+
+        with open(path, "rb") as f:
+            data = f.read()
+        key    = self._key(data)
+        dst    = self.root / key[:2] / (key + self.ext)
+        marker = dst.with_suffix(".orig")                      # 重编码更大时的标记
+        cached = dst.exists() or marker.exists()
+        if not cached:
+            self._encode(path, dst)
+            if dst.stat().st_size >= len(data):
+                os.replace(dst, marker)
+            with self._lock:
+                self.counters["encoded"] += 1
+
+        if marker.exists():
+            out = (path, len(data), len(data))
+            with self._lock:
+                self.counters["kept_original"] += not cached
+        else:
+            out = (str(dst), len(data), dst.stat().st_size)
+        with self._lock:
+            self._memo[memo_key] = out
+        return (*out, cached)
+
+
+    def get(self, path: str) -> str:
+        """返回应当发送给模型的图片路径；原图不存在 / 无法解码时原样返回 path"""
+        try:
+            served, n_orig, n_served, hit = self._resolve(path)
+        except Exception as e:
+            logger.warning("图片预处理失败，发送原图 %s: %s", path, e)
+            return path
+        with self._lock:
+            c = self.counters
+            c["lookups"]        += 1
+            c["hits"]           += hit
+            c["bytes_original"] += n_orig
+            c["bytes_served"]   += n_served
+        return served
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+        return {
+            **c,
+            "hit_rate":    c["hits"] / c["lookups"] if c["lookups"] else 0.0,
+            "bytes_saved": c["bytes_original"] - c["bytes_served"],
+        }
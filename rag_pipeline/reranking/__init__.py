@@ -1,3 +1,18 @@
-from .cross_enconder import *
-from .qwen_vl import *
-from .utils import *
\ No newline at end of file
+"""
+懒加载：访问某个名字时才导入对应子模块（及其 torch / sentence_transformers / langchain / dashscope 等重依赖），
+`import` 本包本身不产生任何副作用。
+"""
+from ..lazy import lazy_exports
+
+_LAZY_ATTRS = {
+    "CrossEncoder_Reranker": ".cross_enconder",
+    "Qwenvl_Reranker":       ".qwen_vl",
+    "Cascade_Reranker":      ".cascade",
+    "Anytime_Reranker":      ".anytime",
+    "CE_InputPipeline":      ".ce_inputs",
+    "ScoreCache":            ".score_cache",
+    "classify_block":        ".utils",
+}
+__all__ = list(_LAZY_ATTRS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _LAZY_ATTRS)
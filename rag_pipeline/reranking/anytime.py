@@ -0,0 +1,164 @@
+from __future__ import annotations
+import time
+import logging
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+
+from .utils import Top_K_Heap, classify_block, topk_snapshot
+from ..monitoring.hooks import stage
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+logger = logging.getLogger(__name__)
+
+
+class Anytime_Reranker():
+    """
+    带截止时间的渐进式重排（包装任意提供 _score_block 的重排器）
+    --------------------------------------------------------------
+    • 按检索排名依次提交打分（workers 个并发），文本 / 多媒体各维护一个 top-k 堆
+    • deadline_s 到期时立即返回当前最好的结果：已打分的 top-k 在前，
+      空位按检索顺序用尚未打分的候选补齐，打分失败的候选排在最后
+    • iter_rerank_parents / iter_rerank_chunks 是生成器：top-k 每次变化都产出一个
+      (top_text, top_media, progress) 快照，调用方可边等边展示 / 提前截断
+    • 到期后未开始的打分任务被取消，已在进行中的远程调用在后台结束，结果丢弃
+    """
+
+    def __init__(self, reranker, deadline_s: float = 3.0, workers: int = 6):
+        self.reranker   = reranker
+        self.deadline_s = deadline_s
+        self.workers    = workers
+
+
+    def _iter(
+        self,
+        query: str,
+        text_blocks: List[Document],
+        media_blocks: List[Document],
+        n_text: int,
+        n_media: int,
+        deadline_s: Optional[float],
+        ranks: List[int],
+    ) -> Iterator[Tuple[List[Document], List[Document], dict]]:
+        blocks   = text_blocks + media_blocks
+        n        = len(text_blocks)
+        text_idx, media_idx = list(range(n)), list(range(n, len(blocks)))
+        heaps    = {"text": Top_K_Heap(n_text), "media": Top_K_Heap(n_media)}
+        status   = ["pending"] * len(blocks)
+        deadline = time.monotonic() + (self.deadline_s if deadline_s is None else deadline_s)
+
+        def snap(done: bool, timed_out: bool):
+            progress = {"scored":    sum(s == "scored" for s in status),
+                        "failed":    sum(s == "failed" for s in status),
+                        "total":     len(blocks),
+                        "done":      done,
+                        "timed_out": timed_out}
+            return (topk_snapshot(blocks, text_idx,  heaps["text"],  status),
+                    topk_snapshot(blocks, media_idx, heaps["media"], status),
+                    progress)
+
+        # 只需要对能进入 top-k 的分组打分，按检索排名（ranks：在原始候选列表中的位置）提交
+        order = (text_idx if n_text > 0 else []) + (media_idx if n_media > 0 else [])
+        order.sort(key=lambda i: ranks[i])
+        ex = ThreadPoolExecutor(max_workers=self.workers)
+        futures = {ex.submit(self.reranker._score_block, query, blocks[i]): i for i in order}
+
+        timed_out = False
+        try:
+            for fut in as_completed(futures, timeout=max(deadline - time.monotonic(), 0)):
+                i = futures[fut]
+                try:
+                    score = fut.result()
+                except Exception as e:
+                    logger.warning("评分失败: %s", e)
+                    score = None
+                if score is None:
+                    status[i] = "failed"
+                    continue
+                status[i] = "scored"
+                if heaps["text" if i < n else "media"].push(score, ranks[i], i):
+                    yield snap(done=False, timed_out=False)
+        except FuturesTimeout:
+            timed_out = True
+        finally:
+            ex.shutdown(wait=False, cancel_futures=True)
+
+        yield snap(done=True, timed_out=timed_out)
+
+
+    def _run(self, query, split, n_text, n_media, deadline_s):
+        text_blocks, media_blocks, ranks = split
+        with stage("rerank_anytime", n_candidates=len(text_blocks) + len(media_blocks)) as st:
+            for top_text, top_media, progress in self._iter(query, text_blocks, media_blocks,
+                                                            n_text, n_media, deadline_s, ranks):
+                pass
+            st.set(**{k: v for k, v in progress.items() if k != "done"})
+        if progress["timed_out"]:
+            logger.info(
+                f"[anytime] 截止时间到，已打分 {progress['scored']}/{progress['total']}，"
+                f"其余按检索顺序补齐"
+            )
+        return top_text, top_media
+
+
+    @staticmethod
+    def _split(blocks, is_text, is_media):
+        """返回 (text_blocks, media_blocks, ranks)，ranks 为各块在原始列表中的位置"""
+        text_idx  = [i for i, b in enumerate(blocks) if is_text(b)]
+        media_idx = [i for i, b in enumerate(blocks) if is_media(b)]
+        return ([blocks[i] for i in text_idx], [blocks[i] for i in media_idx], text_idx + media_idx)
+
+
+    def _split_parents(self, parents):
+        return self._split(parents,
+                           lambda p: p.metadata.get("type") in {"parent", "text"},
+                           lambda p: p.metadata.get("type") in {"image", "table"})
+
+
+    def _split_chunks(self, chunks):
+        return self._split(chunks,
+                           lambda c: classify_block(c) == "text",
+                           lambda c: classify_block(c) == "media")
+
+
+    def iter_rerank_parents(self, query: str, parents: List[Document], n_text: int, n_media: int,
+                            deadline_s: Optional[float] = None):
+        text_blocks, media_blocks, ranks = self._split_parents(parents)
+        return self._iter(query, text_blocks, media_blocks, n_text, n_media, deadline_s, ranks)
+
+
+    def iter_rerank_chunks(self, query: str, chunks: List[Document], n_text: int, n_media: int,
+                           deadline_s: Optional[float] = None):
+        text_blocks, media_blocks, ranks = self._split_chunks(chunks)
+        return self._iter(query, text_blocks, media_blocks, n_text, n_media, deadline_s, ranks)
+
+
+    def rerank_parents(
+        self,
+        query: str,
+        parents: List[Document],
+        n_text: int,
+        n_media: int,
+        batch: int = 5,
+        deadline_s: Optional[float] = None,
+    ) -> Tuple[List[Document], List[Document]]:
+        """batch 仅为兼容其它重排器的调用方式保留；并发数由 workers 决定"""
+        return self._run(query, self._split_parents(parents), n_text, n_media, deadline_s)
+
+
+    def rerank_chunks(
+        self,
+        query: str,
+        chunks: List[Document],
+        n_text: int,
+        n_media: int,
+        batch: int = 5,
+        deadline_s: Optional[float] = None,
+    ) -> Tuple[List[Document], List[Document]]:
+        return self._run(query, self._split_chunks(chunks), n_text, n_media, deadline_s)
+
+
+    @property
+    def score_cache(self):
+        return getattr(self.reranker, "score_cache", None)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+import time
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from .utils import classify_block
+from ..monitoring.hooks import stage
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+logger = logging.getLogger(__name__)
+
+
+class Cascade_Reranker():
+    """
+    两级级联重排
+    --------------------------------------------------------------
+    • 第一级：廉价重排器（通常是本地 CrossEncoder_Reranker）对全部候选打分，
+      文本 / 多媒体各保留前 m_text / m_media 个；first=None 时直接按检索顺序截断
+    • 第二级：昂贵重排器（通常是 Qwenvl_Reranker）只对幸存者打分，返回最终 (top_text, top_media)
+    • 接口与单个重排器一致（rerank_chunks / rerank_parents），可直接替换
+    • 传入 matched_children 且第一级支持子块模式时，第一级只对命中的子块打分
+    • 每次调用的分级耗时与打分数记在 last_report，累计值见 stats()，
+      同时以 rerank_cascade 阶段事件上报
+    """
+
+    def __init__(self, first, second, m_text: int = 20, m_media: int = 10):
+        self.first   = first
+        self.second  = second
+        self.m_text  = m_text
+        self.m_media = m_media
+
+        self.last_report: Dict[str, dict] = {}
+        self._totals = {"queries": 0, "first_scored": 0, "second_scored": 0,
+                        "first_s": 0.0, "second_s": 0.0}
+        self._lock = threading.Lock()
+
+
+    def _first_stage(self, api, query, text_blocks, media_blocks, matched_children, batch):
+        if self.first is None:                          # 无第一级：检索顺序即融合排序
+            return text_blocks[:self.m_text], media_blocks[:self.m_media]
+
+        blocks = text_blocks + media_blocks
+        if matched_children is not None and hasattr(self.first, "rerank_parents_by_children"):
+            return self.first.rerank_parents_by_children(query, blocks, matched_children,
+                                                         self.m_text, self.m_media)
+        return getattr(self.first, api)(query, blocks, self.m_text, self.m_media, batch=batch)
+
+
+    def _cascade(self,
+                 api: str,
+                 query: str,
+                 text_blocks: List[Document],
+                 media_blocks: List[Document],
+                 n_text: int,
+                 n_media: int,
+                 batch: int,
+                 matched_children: Optional[List[List[Document]]] = None,
+                 ) -> Tuple[List[Document], List[Document]]:
+        n_in = len(text_blocks) + len(media_blocks)
+        with stage("rerank_cascade", n_candidates=n_in) as st:
+            t0 = time.perf_counter()
+            surv_text, surv_media = self._first_stage(api, query, text_blocks, media_blocks,
+                                                      matched_children, batch)
+            t1 = time.perf_counter()
+            top_text, top_media = getattr(self.second, api)(query, surv_text + surv_media,
+                                                            n_text, n_media, batch=batch)
+            t2 = time.perf_counter()
+
+            n_first  = 0 if self.first is None else n_in
+            n_second = len(surv_text) + len(surv_media)
+            self.last_report = {
+                "first":  {"scored": n_first,  "seconds": t1 - t0},
+                "second": {"scored": n_second, "seconds": t2 - t1},
+            }
+            st.set(first_scored=n_first, second_scored=n_second,
+                   first_ms=(t1 - t0) * 1000, second_ms=(t2 - t1) * 1000)
+
+        with self._lock:
+            self._totals["queries"]       += 1
+            self._totals["first_scored"]  += n_first
+            self._totals["second_scored"] += n_second
+            self._totals["first_s"]       += t1 - t0
+            self._totals["second_s"]      += t2 - t1
+
+        logger.info(
+            f"[cascade] 第一级 {n_first} 个候选 {(t1 - t0) * 1000:.0f}ms → "
+            f"第二级 {n_second} 个候选 {(t2 - t1) * 1000:.0f}ms "
+            f"(共 {n_in} 个，省去 {n_in - n_second} 次昂贵打分)"
+        )
+        return top_text, top_media
+
+
+    def rerank_chunks(
+        self,
+        query: str,
+        chunks: List[Document],
+        n_text: int,
+        n_media: int,
+        batch: int = 5,
+    ) -> Tuple[List[Document], List[Document]]:
+        text_chunks  = [c for c in chunks if classify_block(c) == "text"]
+        media_chunks = [c for c in chunks if classify_block(c) == "media"]
+        return self._cascade("rerank_chunks", query, text_chunks, media_chunks, n_text, n_media, batch)
+
+
+    def rerank_parents(
+        self,
+        query: str,
+        parents: List[Document],
+        n_text: int,
+        n_media: int,
+        batch: int = 5,
+        matched_children: Optional[List[List[Document]]] = None,
+    ) -> Tuple[List[Document], List[Document]]:
+        """matched_children 与 parents 对齐（见 Hybrid_Retriever.hybrid_retrieve_parents(with_children=True)）"""
+        text_idx  = [i for i, p in enumerate(parents) if p.metadata.get("type") in {"parent", "text"}]
+        media_idx = [i for i, p in enumerate(parents) if p.metadata.get("type") in {"image", "table"}]
+        kids = None
+        if matched_children is not None:
+            kids = [matched_children[i] for i in text_idx + media_idx]
+        return self._cascade("rerank_parents", query,
+                             [parents[i] for i in text_idx],
+                             [parents[i] for i in media_idx],
+                             n_text, n_media, batch, kids)
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            t = dict(self._totals)
+        q = max(t["queries"], 1)
+        return {
+            **t,
+            "first_scored_per_query":  t["first_scored"] / q,
+            "second_scored_per_query": t["second_scored"] / q,
+            "first_ms_per_query":      t["first_s"] * 1000 / q,
+            "second_ms_per_query":     t["second_s"] * 1000 / q,
+        }
+
+
+    @property
+    def score_cache(self):
+        # 供 RAG_Server /stats 报告第二级（付费远程）的缓存命中率
+        return getattr(self.second, "score_cache", None)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "int8", "onnx")
+
+
+
+class Torch_Backend():
+    """
+    原生 sentence-transformers 模型前向（fp32，device 由 CrossEncoder 决定）
+    __call__(batch) 接收 tokenizer.pad 的结果，返回未经激活的 logits（torch.Tensor, CPU）
+    """
+    return_tensors = "pt"
+
+    def __init__(self, model, num_threads: Optional[int] = None):
+        import torch
+
+        if num_threads:
+            torch.set_num_threads(num_threads)          # 进程级设置，影响同进程其它 torch 推理
+        self.model = model
+
+
+    def __call__(self, batch: Dict):
+        import torch
+
+        device = next(self.model.parameters()).device
+        batch  = {k: v.to(device) for k, v in batch.items()}
+        with torch.inference_mode():
+            return self.model(**batch).logits.float().cpu()
+
+
+
+class Int8_Backend(Torch_Backend):
+    """
+    torch 动态 int8 量化：nn.Linear 权重离线量化为 int8，激活在运行时量化
+    仅支持 CPU；模型原地替换，不额外保留 fp32 副本
+    """
+
+    def __init__(self, model, num_threads: Optional[int] = None):
+        import torch
+
+        model = torch.quantization.quantize_dynamic(model.cpu().eval(),
+                                                    {torch.nn.Linear},
+                                                    dtype=torch.qint8,
+                                                    inplace=True)
+        super().__init__(model, num_threads)
+
+
+
+class ORT_Backend():
+    """
+    ONNX Runtime CPU 推理
+    --------------------------------------------------------------
+    • 首次使用时把模型导出到 <model_dir>/onnx/model.onnx（只输出 logits），之后直接复用
+    • intra_op_num_threads 控制单次前向使用的线程数；inter_op 固定为 1
+    • 只把会话声明过的输入（input_ids / attention_mask / token_type_ids）送入
+    """
+    return_tensors = "np"
+
+    def __init__(self,
+                 model,
+                 model_dir: str,
+                 num_threads: Optional[int] = None,
+                 onnx_path: Optional[str] = None,
+                 opset: int = 17):
+        import onnxruntime as ort
+
+        path = Path(onnx_path) if onnx_path else Path(model_dir) / "onnx" / "model.onnx"
+        if not path.exists():
+            self.export(model, path, opset)
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.inter_op_num_threads = 1
+        if num_threads:
+            opts.intra_op_num_threads = num_threads
+        self.session     = ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+
+    @staticmethod
+    def export(model, path: Path, opset: int = 17):
+        import torch
+
+        class _LogitsOnly(torch.nn.Module):
+            def __init__(self, m):
+                super().__init__()
+                self.m = m
+
+            def forward(self, input_ids, attention_mask, token_type_ids=None):
+                kw = {"input_ids": input_ids, "attention_mask": attention_mask}
+                if token_type_ids is not None:
+                    kw["token_type_ids"] = token_type_ids
+                return self.m(**kw).logits
+
+        model = model.cpu().eval()
+        names = ["input_ids", "attention_mask"]
+        dummy = [torch.ones(1, 8, dtype=torch.long), torch.ones(1, 8, dtype=torch.long)]
+        if getattr(model.config, "type_vocab_size", 0) > 1:
+            names.append("token_type_ids")
+            dummy.append(torch.zeros(1, 8, dtype=torch.long))
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        torch.onnx.export(
+            _LogitsOnly(model), tuple(dummy), str(path),
+            input_names   = names,
+            output_names  = ["logits"],
+            dynamic_axes  = {**{n: {0: "batch", 1: "seq"} for n in names}, "logits": {0: "batch"}},
+            opset_version = opset,
+        )
+        logger.info("已导出 ONNX 模型: %s", path)
+
+
+    def __call__(self, batch: Dict):
+        import numpy as np
+        import torch
+
+        feeds = {k: np.asarray(v, dtype=np.int64) for k, v in batch.items() if k in self.input_names}
+        logits = self.session.run(["logits"], feeds)[0]
+        return torch.from_numpy(np.asarray(logits, dtype=np.float32))
+
+
+
+def make_backend(name: str, model, model_dir: str, num_threads: Optional[int] = None, **kwargs):
+    if name == "torch":
+        return Torch_Backend(model, num_threads)
+    if name == "int8":
+        return Int8_Backend(model, num_threads)
+    if name == "onnx":
+        return ORT_Backend(model, model_dir, num_threads, **kwargs)
+    raise ValueError(f"未知的推理后端: {name}（可选 {', '.join(BACKENDS)}）")
+
+
+
+def rank_parity(reference, candidate) -> Dict[str, float]:
+    """两组分数的排序一致性：Spearman rho / Kendall tau，以及最大绝对误差"""
+    import numpy as np
+    from scipy.stats import kendalltau, spearmanr
+
+    a = np.asarray(reference, dtype=np.float64)
+    b = np.asarray(candidate, dtype=np.float64)
+    return {
+        "n":           int(len(a)),
+        "spearman":    float(spearmanr(a, b)[0]),
+        "kendall":     float(kendalltau(a, b)[0]),
+        "max_abs_err": float(np.abs(a - b).max()) if len(a) else 0.0,
+    }
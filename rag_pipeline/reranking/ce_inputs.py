@@ -0,0 +1,73 @@
+from __future__ import annotations
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+
+
+class CE_InputPipeline():
+    """
+    Cross-Encoder 输入流水线（按 token 而非字符截断）
+    --------------------------------------------------------------
+    • query 每次只分词一次；context 分词结果按文本做 LRU 缓存，重复候选不再分词
+    • 截断以 token 为单位：context 预算 = max_len - len(query) - 特殊 token 数
+    • 特征按 token 长度排序后分桶，同一批内长度接近，padding 最少
+    • 无 length_tokens 的长文本（如 page 级父块）先按 budget * chars_per_token
+      粗切再分词，避免对整页做无用分词；已带 length_tokens 的 chunk 本身有界，直接分词
+    """
+
+    def __init__(self,
+                 tokenizer,
+                 max_len: int = 512,
+                 cache_size: int = 8192,
+                 chars_per_token: int = 6):
+        self.tokenizer       = tokenizer
+        self.max_len         = max_len
+        self.chars_per_token = chars_per_token
+        self.n_special       = tokenizer.num_special_tokens_to_add(pair=True)
+        self._ctx_ids        = lru_cache(maxsize=cache_size)(self._tokenize)
+
+
+    def _tokenize(self, text: str) -> tuple:
+        return tuple(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+    def encode_query(self, query: str) -> List[int]:
+        q_ids = self.tokenizer(query, add_special_tokens=False)["input_ids"]
+        return q_ids[: self.max_len // 2]                 # 超长 query 最多占一半窗口
+
+
+    def context_budget(self, q_ids: List[int]) -> int:
+        return max(1, self.max_len - len(q_ids) - self.n_special)
+
+
+    def context_ids(self, block: Document, budget: int) -> tuple:
+        text = block.page_content
+        if block.metadata.get("length_tokens") is None:
+            text = text[: budget * self.chars_per_token]
+        return self._ctx_ids(text)[:budget]
+
+
+    def build(self, query: str, blocks: List[Document]) -> List[Dict[str, list]]:
+        """返回与 blocks 等长的特征列表（input_ids / attention_mask / token_type_ids）"""
+        q_ids  = self.encode_query(query)
+        budget = self.context_budget(q_ids)
+        return [
+            self.tokenizer.prepare_for_model(q_ids, list(self.context_ids(b, budget)),
+                                             add_special_tokens=True,
+                                             truncation=False)
+            for b in blocks
+        ]
+
+
+    @staticmethod
+    def buckets(features: List[Dict[str, list]], batch_size: int) -> List[List[int]]:
+        """按 token 长度排序后切批，返回每批的下标列表"""
+        order = sorted(range(len(features)), key=lambda i: len(features[i]["input_ids"]))
+        return [order[i: i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+    def collate(self, features: List[Dict[str, list]], return_tensors: str = "pt"):
+        return self.tokenizer.pad(features, padding=True, return_tensors=return_tensors)
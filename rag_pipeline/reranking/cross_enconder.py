@@ -1,12 +1,17 @@
-import os, pathlib, torch
-from typing import List, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from __future__ import annotations
+import os, pathlib, logging
+from typing import TYPE_CHECKING, List, Tuple
 
-from tqdm import tqdm
-from sentence_transformers.cross_encoder import CrossEncoder
-from langchain.docstore.document import Document
+from .utils import classify_block, pool_scores   # 需保证现有 utils 中存在
+from .ce_inputs import CE_InputPipeline
+from .ce_backends import make_backend, rank_parity
+from ..monitoring.hooks import stage
 
-from .utils import classify_block   # 需保证现有 utils 中存在
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+    from .score_cache import ScoreCache
+
+logger = logging.getLogger(__name__)
 
 
 class CrossEncoder_Reranker():
@@ -16,6 +21,11 @@ class CrossEncoder_Reranker():
     • 支持把 **本地模型目录** 作为参数传入，兼容 e5 / MiniLM / Qwen3-Reranker 等。
     • 自动判断模型输出是否已在 0-1 区间；若不是则套 Sigmoid。
     • 提供平坦 chunks 与分层 parents 两种重排 API。
+    • 所有候选一次性分词（按 token 截断）、按 token 长度分桶后批量前向，不再逐条 predict。
+    • 子块模式：只对检索命中的子块打分，再按父块 max / mean 聚合，省去整页父块的前向。
+    • 推理后端可选 torch(fp32) / int8(动态量化) / onnx(ONNX Runtime)，后两者仅 CPU；
+      parity_check() 以 fp32 分数为基准报告 Spearman / Kendall 排序一致性。
+    • 可挂 ScoreCache（内存 LRU + SQLite），重复的 (query, 块) 不再前向。
     """
 
     def __init__(
@@ -25,22 +35,38 @@ class CrossEncoder_Reranker():
         max_len: int = 512,
         prob_already: bool | None = None,
         trust_remote_code: bool = True,
+        batch_size: int = 32,
+        backend: str = "torch",
+        num_threads: int | None = None,
+        score_cache: ScoreCache | None = None,
     ):
         """
         Parameters
         ----------
         model_dir        : 本地模型文件夹路径（CrossEncoder / SBERT 结构）
         device           : "cuda" | "cpu" | None(自动)
-        max_len          : 每对 (query, context) 的截断长度
+        max_len          : 每对 (query, context) 的截断长度（token 数）
         prob_already     : 显式告诉模型输出是否已在 0~1；若 None 自动判断
         trust_remote_code: 对 Qwen3 等含自定义 pooling 的模型需保持 True
+        batch_size       : 每次 predict 的 (query, context) 对数
+        backend          : "torch" | "int8" | "onnx"；int8 / onnx 强制在 CPU 上运行
+        num_threads      : CPU 推理的 intra-op 线程数；None 保持库默认
+        score_cache      : 可选的 ScoreCache，重复 (query, 块) 直接复用分数
         """
         self.model_dir = str(pathlib.Path(model_dir).expanduser())
         if not pathlib.Path(self.model_dir).exists():
             raise FileNotFoundError(f"模型目录不存在: {self.model_dir}")
 
-        self.device   = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        self.max_len  = max_len
+        import torch
+        from sentence_transformers.cross_encoder import CrossEncoder
+
+        if backend != "torch":
+            device = "cpu"
+        self.device      = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.max_len     = max_len
+        self.batch_size  = batch_size
+        self.backend     = backend
+        self.num_threads = num_threads
 
         self.ce = CrossEncoder(
             self.model_dir,
@@ -49,26 +75,135 @@ class CrossEncoder_Reranker():
             max_length=max_len
         )
 
+        # 与 CrossEncoder.predict 相同的输出激活（不同 sentence-transformers 版本属性名不同）
+        self._activation = (getattr(self.ce, "activation_fn", None)
+                            or getattr(self.ce, "default_activation_function", None)
+                            or torch.nn.Identity())
+        self.inputs = CE_InputPipeline(self.ce.tokenizer, max_len=max_len)
+        self._model = make_backend(backend, self.ce.model, self.model_dir, num_threads)
+
+        # 缓存键中的模型标识：同一模型不同后端 / 截断长度的分数不可混用
+        self.score_cache = score_cache
+        self.cache_model = f"ce:{pathlib.Path(self.model_dir).name}:{backend}:{max_len}"
+
         if prob_already is None:
             # Qwen3-Reranker 系列官方说明输出 range [0,1]
             prob_already = "qwen" in self.model_dir.lower()
         self.prob_already = prob_already
 
 
+    # 模型前向：一批已分词特征 -> 分数
+    def _forward(self, batch):
+        import torch
+
+        logits = self._model(batch)
+        with torch.inference_mode():
+            logits = self._activation(logits)
+        out = logits.float().cpu().numpy()
+        return out[:, 0] if out.ndim == 2 and out.shape[1] == 1 else out.reshape(-1)
+
+
+    # 批量评分
+    def _score_blocks(self, query: str, blocks: List[Document]) -> List[float]:
+        """
+        返回与 blocks 等长的分数列表；配置了 score_cache 时只对未命中的块做前向，
+        并把成功的分数写回缓存
+        """
+        if self.score_cache is None:
+            return self._infer_blocks(query, blocks)[0]
+
+        keys   = [self.score_cache.key(self.cache_model, query, b) for b in blocks]
+        cached = self.score_cache.get_many(keys)
+        todo   = [i for i, k in enumerate(keys) if k not in cached]
+
+        scores = [cached.get(k, 0.0) for k in keys]
+        if todo:
+            fresh, ok = self._infer_blocks(query, [blocks[i] for i in todo])
+            for i, sc in zip(todo, fresh):
+                scores[i] = sc
+            self.score_cache.put_many((keys[i], sc) for i, sc, good in zip(todo, fresh, ok) if good)
+        return scores
+
+
+    def _infer_blocks(self, query: str, blocks: List[Document]) -> Tuple[List[float], List[bool]]:
+        """
+        一次性分词全部 (query, context) 对（按 token 截断），按 token 长度分桶后分批前向，
+        分数按下标回填；返回 (scores, ok)，前向失败的批次记 0 分且 ok=False
+        """
+        import numpy as np
+
+        features = self.inputs.build(query, blocks)
+        scores = [0.0] * len(features)
+        ok     = [False] * len(features)
+
+        for idx in self.inputs.buckets(features, self.batch_size):
+            try:
+                out = np.asarray(
+                    self._forward(self.inputs.collate([features[i] for i in idx],
+                                                      return_tensors=self._model.return_tensors)),
+                    dtype=np.float64,
+                )
+                if not self.prob_already:
+                    out = 1.0 / (1.0 + np.exp(-out))
+            except Exception as e:
+                logger.warning("Cross-Encoder 评分失败: %s", e)
+                continue
+            for i, sc in zip(idx, out):
+                scores[i] = float(sc)
+                ok[i]     = True
+        return scores, ok
+
+
     # 单块评分
     def _score_block(self, query: str, block: Document) -> float:
         """对单个 Document 计算相关性分数"""
-        ctx = block.page_content[:4096]               # 粗截断
-        pair = (query, ctx[: self.max_len])
-
-        try:
-            score = self.ce.predict([pair])[0]        # float
-            if not self.prob_already:
-                score = torch.sigmoid(torch.tensor(score)).item()
-            return float(score)
-        except Exception as e:
-            print("Cross-Encoder 评分失败:", e)
-            return 0.0
+        return self._score_blocks(query, [block])[0]
+
+
+    def parity_check(self, query: str, blocks: List[Document], reference: List[float] | None = None) -> dict:
+        """
+        当前后端与 fp32 torch 后端的分数一致性
+        reference 为空时在 CPU 上临时加载一份 fp32 模型计算基准分数
+        返回 {"n", "spearman", "kendall", "max_abs_err"}
+        """
+        if reference is None:
+            ref = CrossEncoder_Reranker(self.model_dir,
+                                        device       = "cpu",
+                                        max_len      = self.max_len,
+                                        prob_already = self.prob_already,
+                                        batch_size   = self.batch_size,
+                                        num_threads  = self.num_threads)
+            reference = ref._score_blocks(query, blocks)
+            del ref
+        report = rank_parity(reference, self._score_blocks(query, blocks))
+        logger.info(
+            f"[{pathlib.Path(self.model_dir).name}] backend={self.backend} vs fp32: "
+            f"spearman={report['spearman']:.4f} kendall={report['kendall']:.4f} "
+            f"max_abs_err={report['max_abs_err']:.4f} (n={report['n']})"
+        )
+        return report
+
+
+    def _rerank_split(
+        self,
+        query: str,
+        text_blocks: List[Document],
+        media_blocks: List[Document],
+        n_text: int,
+        n_media: int,
+    ) -> Tuple[List[Document], List[Document]]:
+        blocks = text_blocks + media_blocks
+        with stage("rerank", reranker=pathlib.Path(self.model_dir).name,
+                   n_candidates=len(blocks)):
+            scores = self._score_blocks(query, blocks)
+
+            n = len(text_blocks)
+            text_rank  = sorted(range(n), key=lambda i: scores[i], reverse=True)
+            media_rank = sorted(range(n, len(blocks)), key=lambda i: scores[i], reverse=True)
+
+            top_text  = [blocks[i] for i in text_rank[:n_text]]
+            top_media = [blocks[i] for i in media_rank[:n_media]]
+        return top_text, top_media
 
     
     # 平坦 chunks 重排
@@ -80,29 +215,13 @@ class CrossEncoder_Reranker():
         n_media: int,
         batch: int = 8,
     ) -> Tuple[List[Document], List[Document]]:
+        """batch 仅为兼容 Qwenvl_Reranker 的调用方式保留；推理批大小由 batch_size 决定"""
         text_chunks  = [c for c in chunks if classify_block(c) == "text"]
         media_chunks = [c for c in chunks if classify_block(c) == "media"]
 
-        def score_and_pack(b):
-            return (self._score_block(query, b), b)
-
-        scored_text, scored_media = [], []
-        with ThreadPoolExecutor(max_workers=batch) as ex:
-            futures = {ex.submit(score_and_pack, b): b for b in text_chunks + media_chunks}
-            for fut in tqdm(as_completed(futures), total=len(futures), desc="CE Scoring"):
-                score, blk = fut.result()
-                if blk in text_chunks:
-                    scored_text.append((score, blk))
-                else:
-                    scored_media.append((score, blk))
-
-        scored_text.sort(key=lambda x: x[0], reverse=True)
-        scored_media.sort(key=lambda x: x[0], reverse=True)
+        top_text, top_media = self._rerank_split(query, text_chunks, media_chunks, n_text, n_media)
 
-        top_text  = [blk for _, blk in scored_text[:n_text]]
-        top_media = [blk for _, blk in scored_media[:n_media]]
-
-        print(
+        logger.info(
             f"[{pathlib.Path(self.model_dir).name}] 选出 "
             f"{len(top_text)} 文本 + {len(top_media)} 多媒体"
         )
@@ -118,28 +237,67 @@ class CrossEncoder_Reranker():
         n_media: int,
         batch: int = 8,
     ) -> Tuple[List[Document], List[Document]]:
+        """batch 仅为兼容 Qwenvl_Reranker 的调用方式保留；推理批大小由 batch_size 决定"""
         text_blocks  = [p for p in parents if p.metadata.get("type") in {"parent", "text"}]
         media_blocks = [p for p in parents if p.metadata.get("type") in {"image", "table"}]
 
-        def score_and_pack(b):
-            return (self._score_block(query, b), b)
-
-        scored_text, scored_media = [], []
-        with ThreadPoolExecutor(max_workers=batch) as ex:
-            futures = {
-                ex.submit(score_and_pack, b): ("text" if b in text_blocks else "media")
-                for b in text_blocks + media_blocks
-            }
-            for fut in tqdm(as_completed(futures), total=len(futures), desc="CE Scoring"):
-                typ = futures[fut]
-                score, blk = fut.result()
-                (scored_text if typ == "text" else scored_media).append((score, blk))
-
-        scored_text.sort(key=lambda x: x[0], reverse=True)
-        scored_media.sort(key=lambda x: x[0], reverse=True)
-
-        top_text  = [blk for _, blk in scored_text[:n_text]]
-        top_media = [blk for _, blk in scored_media[:n_media]]
+        return self._rerank_split(query, text_blocks, media_blocks, n_text, n_media)
+
+
+    # 子块打分 -> 父块聚合
+    def score_parents_by_children(
+        self,
+        query: str,
+        parents: List[Document],
+        matched_children: List[List[Document]],
+        pool: str = "max",
+    ) -> List[float]:
+        """
+        matched_children[i] 为 parents[i] 在检索阶段命中的子块
+        （Hybrid_Retriever.hybrid_retrieve_parents(query, with_children=True) 的第二个返回值）。
+        所有子块一次性批量打分后按父块聚合；没有命中子块的父块（如图表）退回对父块本身打分。
+        """
+        if len(parents) != len(matched_children):
+            raise ValueError("parents 与 matched_children 长度不一致")
+
+        blocks, owner = [], []
+        for i, (p, kids) in enumerate(zip(parents, matched_children)):
+            for b in (kids or [p]):
+                blocks.append(b)
+                owner.append(i)
+
+        scores = self._score_blocks(query, blocks)
+        per_parent = [[] for _ in parents]
+        for i, sc in zip(owner, scores):
+            per_parent[i].append(sc)
+        return [pool_scores(s, pool) for s in per_parent]
+
+
+    # 分层 parents 重排（子块模式）
+    def rerank_parents_by_children(
+        self,
+        query: str,
+        parents: List[Document],
+        matched_children: List[List[Document]],
+        n_text: int,
+        n_media: int,
+        pool: str = "max",
+        batch: int = 8,
+    ) -> Tuple[List[Document], List[Document]]:
+        """与 rerank_parents 返回相同的 (top_text, top_media)，但只对命中的子块做前向"""
+        n_pairs = sum(len(kids) or 1 for kids in matched_children)
+        with stage("rerank", reranker=pathlib.Path(self.model_dir).name,
+                   n_candidates=len(parents), n_pairs=n_pairs, pool=pool):
+            scores = self.score_parents_by_children(query, parents, matched_children, pool)
+
+            types = [p.metadata.get("type") for p in parents]
+            text_rank  = sorted((i for i, t in enumerate(types) if t in {"parent", "text"}),
+                                key=lambda i: scores[i], reverse=True)
+            media_rank = sorted((i for i, t in enumerate(types) if t in {"image", "table"}),
+                                key=lambda i: scores[i], reverse=True)
+
+            top_text  = [parents[i] for i in text_rank[:n_text]]
+            top_media = [parents[i] for i in media_rank[:n_media]]
         return top_text, top_media
 
 
@@ -1,44 +1,159 @@
+from __future__ import annotations
 import os
-import tiktoken
-from dotenv import load_dotenv
-from tqdm import tqdm
-from typing import List, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-from dashscope import MultiModalConversation
-from langchain.docstore.document import Document
+import re
+import json
+import logging
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
 from .utils import classify_block  # 假设 classify_block 已在 utils 中定义
+from ..monitoring.hooks import stage
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+    from .score_cache import ScoreCache
+    from ..remote.async_client import DashScope_AsyncClient
+    from ..remote.hedging import Hedger
+    from ..remote.image_cache import Image_Cache
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = {"role": "system", "content": [{"text": "You are a helpful assistant for relevance scoring."}]}
 
 
 class Qwenvl_Reranker():
     """
     使用 Qwen-VL 系列模型做多模态的相关性重排。
-    
-    初始化时会加载环境变量、检查 API Key，并准备 tokenizer 编码器。然后可调用
+
+    首次调用时才加载环境变量、检查 API Key 并准备 tokenizer 编码器。可调用
     rerank_chunks() 或 rerank_parents() 来对平坦 chunks 或分层 parents 进行重排。
+    传入 score_cache 时，重复的 (query, 块) 直接复用已付费的远程打分结果。
+
+    mode="pointwise"：每个候选一次远程调用（原行为）
+    mode="listwise" ：每次调用打包 group_size 个候选（其中图片不超过 max_images 张），
+                      要求模型返回 {"编号": 分数} 的 JSON；缺失 / 解析失败的候选逐条补打分
+    call_fn(messages) -> str 可替换远程调用（如本地桩服务），默认走 DashScope
+    client 为 DashScope_AsyncClient 时，全部候选一次性并发提交，并发度由其 AIMD 上限自适应，
+    batch 参数不再生效（此时把 Hedger 交给 client，而不是本类）
+    hedger 非空时逐条调用（_call）经其对冲，慢请求自动补发副本
+    image_cache 非空时发送缩略图而不是原图（与图片描述、图文改写共用同一份缓存）
+    limiter 为上下文管理器（如 threading.BoundedSemaphore / Concurrency_Gate）时，每次远程调用
+    先进入它再交给 hedger：多个 query 并发重排时共享同一个全局并发上限，
+    对冲副本沿用主请求的名额（额外负载由 Hedger.max_extra 限制），排队等待不会被当成慢请求触发对冲
+
+    打分失败的候选不再记 0 分：分数为 None，排在所有成功候选之后，并在日志 / rerank 阶段事件中报告
     """
-    
-    def __init__(self, model_name: str = "qwen2.5-vl-7b-instruct"):
-        # 加载 .env 并读取 DASHSCOPE_API_KEY
-        load_dotenv()
-        self.ENC = tiktoken.get_encoding("o200k_base")
-        self.qwen_key = os.getenv("DASHSCOPE_API_KEY")
-        if not self.qwen_key:
-            raise RuntimeError("请先确保 DASHSCOPE_API_KEY 已正确设置并激活了 mmrag 环境")
 
+    def __init__(self,
+                 model_name: str = "qwen2.5-vl-7b-instruct",
+                 score_cache: ScoreCache | None = None,
+                 mode: str = "pointwise",
+                 group_size: int = 8,
+                 max_images: int = 2,
+                 group_chars: int = 1000,
+                 call_fn: Optional[Callable[[list], str]] = None,
+                 client: DashScope_AsyncClient | None = None,
+                 hedger: Hedger | None = None,
+                 image_cache: Image_Cache | None = None,
+                 limiter=None):
+        if mode not in {"pointwise", "listwise"}:
+            raise ValueError(f"未知的打分模式: {mode}（可选 'pointwise' / 'listwise'）")
         self.llm = model_name
+        self._qwen_key = None
+        self._enc      = None
+        self.score_cache = score_cache
+        self.cache_model = f"qwenvl:{model_name}"
+        self.mode        = mode
+        self.group_size  = group_size
+        self.max_images  = max_images
+        self.group_chars = group_chars                # listwise 下每个候选的截断长度
+        self.call_fn     = call_fn
+        self.client      = client
+        self.hedger      = hedger
+        self.image_cache = image_cache
+        self.limiter     = limiter
+
+
+    @property
+    def qwen_key(self) -> str:
+        # 加载 .env 并读取 DASHSCOPE_API_KEY
+        if self._qwen_key is None:
+            from dotenv import load_dotenv
+            load_dotenv()
+            key = os.getenv("DASHSCOPE_API_KEY")
+            if not key:
+                raise RuntimeError("请先确保 DASHSCOPE_API_KEY 已正确设置并激活了 mmrag 环境")
+            self._qwen_key = key
+        return self._qwen_key
+
+
+    @property
+    def ENC(self):
+        if self._enc is None:
+            import tiktoken
+            self._enc = tiktoken.get_encoding("o200k_base")
+        return self._enc
+
+
+    def _check_key(self):
+        # 未配置 key 时直接抛出，而不是记 0 分；注入 call_fn / client 时由其自行处理
+        if self.call_fn is None and self.client is None:
+            self.qwen_key
+
+
+    # 远程调用：messages -> 回复文本；先占并发名额再对冲，排队时间不计入对冲的延迟样本
+    def _call(self, messages: list) -> str:
+        if self.limiter is not None:
+            with self.limiter:
+                return self._call_once(messages)
+        return self._call_once(messages)
 
-    
-    # 单块评分：给一个 chunk/块 返回 0~1 浮点分数
-    def _score_block(self, query: str, block: Document) -> float:
+
+    def _call_once(self, messages: list) -> str:
+        if self.hedger is not None:
+            return self.hedger.call(self._request, messages)
+        return self._request(messages)
+
+
+    def _request(self, messages: list) -> str:
+        if self.call_fn is not None:
+            return self.call_fn(messages)
+        if self.client is not None:
+            return self.client.chat_sync(messages, model=self.llm)
+
+        from dashscope import MultiModalConversation
+
+        resp = MultiModalConversation.call(
+            api_key=self.qwen_key,
+            model=self.llm,
+            messages=messages,
+            vl_high_resolution_images=False
+        )
+        return resp["output"]["choices"][0]["message"].content[0]["text"]
+
+
+    # 单块评分：给一个 chunk/块 返回 0~1 浮点分数；失败返回 None
+    def _score_block(self, query: str, block: Document) -> Optional[float]:
+        return self._score_many(query, [block], batch=1)[0]
+
+
+    @staticmethod
+    def _parse_score(reply: str) -> float:
+        score = float(reply.strip())
+        if not 0.0 <= score <= 1.0:
+            raise ValueError(f"分数越界: {score}")
+        return score
+
+
+    def _pointwise_messages(self, query: str, block: Document) -> list:
         t = block.metadata.get("type", "text")
         txt = block.page_content[:2000]  # 截断到 2000 字符，保证单块 token < 4k
-        
+
         if t in {"image", "table"}:
             img_path = block.metadata.get("img_path")
             user_content = []
             if img_path and os.path.exists(img_path) and t == "image":
-                user_content.append({"image": img_path})
+                user_content.append({"image": self._image(img_path)})
             user_content.append({
                 "text": (
                     f"Query: {query}\n\n"
@@ -55,31 +170,164 @@ class Qwenvl_Reranker():
                     "请给出其与 Query 的相关性分数，0~1 间小数。仅回复分数字面值。"
                 )
             }]
-        
-        messages = [
-            {
-                "role": "system",
-                "content": [{"text": "You are a helpful assistant for relevance scoring."}]
-            },
-            {
-                "role": "user",
-                "content": user_content
-            }
-        ]
-        
-        try:
-            resp = MultiModalConversation.call(
-                api_key=self.qwen_key,
-                model=self.llm,
-                messages=messages,
-                vl_high_resolution_images=False
-            )
-            score_txt = resp["output"]["choices"][0]["message"].content[0]["text"]
-            return float(score_txt.strip())
-        except Exception as e:
-            print("评分失败:", e)
-            return 0.0
-    
+
+        return [SYSTEM_PROMPT, {"role": "user", "content": user_content}]
+
+
+    # ------------------------------------------------------------------
+    # listwise：一次请求给一组候选打分
+    def _make_groups(self, blocks: List[Document]) -> List[List[int]]:
+        """按 group_size 切组，且每组附带的图片数不超过 max_images"""
+        groups, cur, n_img = [], [], 0
+        for i, b in enumerate(blocks):
+            is_img = self._attach_image(b) is not None
+            if cur and (len(cur) >= self.group_size or (is_img and n_img >= self.max_images)):
+                groups.append(cur)
+                cur, n_img = [], 0
+            cur.append(i)
+            n_img += is_img
+        if cur:
+            groups.append(cur)
+        return groups
+
+
+    @staticmethod
+    def _attach_image(block: Document) -> Optional[str]:
+        img_path = block.metadata.get("img_path")
+        if block.metadata.get("type") == "image" and img_path and os.path.exists(img_path):
+            return img_path
+        return None
+
+
+    def _image(self, img_path: str) -> str:
+        return self.image_cache.get(img_path) if self.image_cache is not None else img_path
+
+
+    def _listwise_messages(self, query: str, blocks: List[Document]) -> list:
+        content = [{"text": f"Query: {query}\n\n以下是 {len(blocks)} 个候选上下文：\n"}]
+        for no, b in enumerate(blocks, 1):
+            t = b.metadata.get("type", "text")
+            img_path = self._attach_image(b)
+            if img_path:
+                content.append({"image": self._image(img_path)})
+            content.append({"text": f"[{no}] ({t})\n{b.page_content[:self.group_chars]}\n"})
+        content.append({"text": (
+            "\n请分别给出每个候选与 Query 的相关性分数（0~1 间小数）。"
+            "仅回复一个 JSON 对象，键为候选编号，值为分数，例如 {\"1\": 0.82, \"2\": 0.10}。"
+        )})
+        return [SYSTEM_PROMPT, {"role": "user", "content": content}]
+
+
+    @staticmethod
+    def parse_score_vector(text: str, n: int) -> Dict[int, float]:
+        """
+        解析 listwise 回复，返回 {候选下标(0 起): 分数}
+        优先解析 JSON 对象 / 数组，其次逐项匹配 "编号: 分数"（兼容被截断的 JSON）；越界编号与非法分数丢弃
+        """
+        found = {}
+        m = re.search(r"\{.*\}|\[.*\]", text, re.S)
+        if m:
+            try:
+                obj = json.loads(m.group(0))
+                items = obj.items() if isinstance(obj, dict) else enumerate(obj, 1)
+                for k, v in items:
+                    found[int(str(k).strip("[] "))] = float(v)
+            except (ValueError, TypeError):
+                found = {}
+        if not found:
+            for k, v in re.findall(r'[\["]?(\d+)[\]"]?\s*[:：=]\s*([01](?:\.\d+)?)', text):
+                found[int(k)] = float(v)
+        return {k - 1: v for k, v in found.items() if 1 <= k <= n and 0.0 <= v <= 1.0}
+
+
+    # 批量远程调用：返回与 message_lists 等长的回复文本或异常对象
+    def _run_calls(self, message_lists: List[list], batch: int, desc: str) -> list:
+        if not message_lists:
+            return []
+        if self.call_fn is None and self.client is not None:
+            return self.client.gather_sync(message_lists, model=self.llm)
+
+        from tqdm import tqdm
+
+        def one(messages):
+            try:
+                return self._call(messages)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=batch) as ex:
+            return list(tqdm(ex.map(one, message_lists), total=len(message_lists), desc=desc))
+
+
+    # 全部候选打分：返回与 blocks 等长的分数，失败项为 None
+    def _score_many(self, query: str, blocks: List[Document], batch: int) -> List[Optional[float]]:
+        scores = [None] * len(blocks)
+        keys = None
+        if self.score_cache is not None:
+            keys = [self.score_cache.key(self.cache_model, query, b) for b in blocks]
+            cached = self.score_cache.get_many(keys)
+            for i, k in enumerate(keys):
+                scores[i] = cached.get(k)
+
+        todo = [i for i, s in enumerate(scores) if s is None]
+        if todo:
+            self._check_key()
+        fresh = []
+
+        if self.mode == "listwise" and todo:
+            groups  = [[todo[j] for j in g] for g in self._make_groups([blocks[i] for i in todo])]
+            replies = self._run_calls([self._listwise_messages(query, [blocks[i] for i in g]) for g in groups],
+                                      batch, desc="Qwen Listwise")
+            for g, reply in zip(groups, replies):
+                if isinstance(reply, Exception):
+                    logger.warning("listwise 评分失败，改为逐条评分: %s", reply)
+                    continue
+                got = self.parse_score_vector(reply, len(g))
+                for j, i in enumerate(g):
+                    if j in got:
+                        scores[i] = got[j]
+                        fresh.append(i)
+
+            # 回复中缺失的候选逐条补打分
+            todo = [i for i in todo if scores[i] is None]
+            if todo:
+                logger.info(f"listwise 回复缺失 {len(todo)} 个候选，逐条补打分")
+
+        replies = self._run_calls([self._pointwise_messages(query, blocks[i]) for i in todo],
+                                  batch, desc="Qwen Scoring")
+        for i, reply in zip(todo, replies):
+            try:
+                if isinstance(reply, Exception):
+                    raise reply
+                scores[i] = self._parse_score(reply)
+                fresh.append(i)
+            except Exception as e:
+                logger.warning("评分失败: %s", e)
+
+        if keys is not None and fresh:
+            self.score_cache.put_many((keys[i], scores[i]) for i in fresh)
+        return scores
+
+
+    def _rank_split(self, query, text_blocks, media_blocks, n_text, n_media, batch):
+        blocks = text_blocks + media_blocks
+        with stage("rerank", reranker=self.llm, mode=self.mode, n_candidates=len(blocks)) as st:
+            scores = self._score_many(query, blocks, batch)
+            n_failed = sum(s is None for s in scores)
+            st.set(n_failed=n_failed)
+            if n_failed:
+                logger.warning(f"{n_failed}/{len(blocks)} 个候选打分失败，排在成功候选之后")
+
+            # 失败项（None）排在最后，彼此保持检索顺序
+            rank_key   = lambda i: (scores[i] is not None, scores[i] or 0.0)
+            n = len(text_blocks)
+            text_rank  = sorted(range(n), key=rank_key, reverse=True)
+            media_rank = sorted(range(n, len(blocks)), key=rank_key, reverse=True)
+
+            top_text  = [blocks[i] for i in text_rank[:n_text]]
+            top_media = [blocks[i] for i in media_rank[:n_media]]
+        return top_text, top_media
+
 
     # 对“平坦 chunks”做重排：文本 / 媒体分别打分、排序、各取前 n
     def rerank_chunks(
@@ -98,29 +346,9 @@ class Qwenvl_Reranker():
         text_chunks = [c for c in chunks if classify_block(c) == "text"]
         media_chunks = [c for c in chunks if classify_block(c) == "media"]
 
-        def score_and_pack(b):
-            return (self._score_block(query, b), b)
+        top_text, top_media = self._rank_split(query, text_chunks, media_chunks, n_text, n_media, batch)
 
-        scored_text, scored_media = [], []
-        with ThreadPoolExecutor(max_workers=batch) as ex:
-            futures = {
-                ex.submit(score_and_pack, blk): blk
-                for blk in text_chunks + media_chunks
-            }
-            for fut in tqdm(as_completed(futures), total=len(futures), desc="Qwen Scoring"):
-                score, blk = fut.result()
-                if blk in text_chunks:
-                    scored_text.append((score, blk))
-                else:
-                    scored_media.append((score, blk))
-
-        scored_text.sort(key=lambda x: x[0], reverse=True)
-        scored_media.sort(key=lambda x: x[0], reverse=True)
-
-        top_text = [blk for _, blk in scored_text[:n_text]]
-        top_media = [blk for _, blk in scored_media[:n_media]]
-
-        print(
+        logger.info(
             f"最终选出 {len(top_text)} 段文本 + {len(top_media)} 个多媒体块 "
             f"(文本/多媒体请求阈值 = {n_text}/{n_media})"
         )
@@ -144,26 +372,4 @@ class Qwenvl_Reranker():
         text_blocks = [p for p in parents if p.metadata.get("type") in {"parent", "text"}]
         media_blocks = [p for p in parents if p.metadata.get("type") in {"image", "table"}]
 
-        def score_and_pack(b):
-            return (self._score_block(query, b), b)
-
-        scored_text, scored_media = [], []
-        with ThreadPoolExecutor(max_workers=batch) as ex:
-            futures = {
-                ex.submit(score_and_pack, blk): ("text" if blk in text_blocks else "media")
-                for blk in text_blocks + media_blocks
-            }
-            for fut in tqdm(as_completed(futures), total=len(futures), desc="Qwen Scoring"):
-                typ = futures[fut]
-                score, blk = fut.result()
-                if typ == "text":
-                    scored_text.append((score, blk))
-                else:
-                    scored_media.append((score, blk))
-
-        scored_text.sort(key=lambda x: x[0], reverse=True)
-        scored_media.sort(key=lambda x: x[0], reverse=True)
-
-        top_text = [blk for _, blk in scored_text[:n_text]]
-        top_media = [blk for _, blk in scored_media[:n_media]]
-        return top_text, top_media
+        return self._rank_split(query, text_blocks, media_blocks, n_text, n_media, batch)
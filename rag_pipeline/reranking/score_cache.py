@@ -0,0 +1,56 @@
+from __future__ import annotations
+import re
+import hashlib
+import unicodedata
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from ..cache import Tiered_Cache
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+
+
+def normalize_query(query: str) -> str:
+    """NFKC + 小写 + 折叠空白：大小写、全角半角、多余空格不同的 query 命中同一缓存项"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query)).strip().lower()
+
+
+def block_hash(block: Document) -> str:
+    """块内容哈希（正文 + img_path），与 chunk_id 等易变元数据无关"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(block.page_content.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(str(block.metadata.get("img_path") or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+
+class ScoreCache(Tiered_Cache):
+    """
+    两级重排分数缓存（LRU + SQLite，见 Tiered_Cache）
+    --------------------------------------------------------------
+    • 键 = (模型标识, 归一化 query, 块内容哈希)
+    • 值 = 分数（float）；只缓存成功的打分，失败记 0 分的结果不会写入
+    """
+
+    TABLE       = "scores"
+    COLUMN      = "score"
+    COLUMN_TYPE = "REAL"
+
+    def __init__(self,
+                 path: "str | Path | None" = None,
+                 capacity: int = 100_000,
+                 ttl: Optional[float] = 7 * 24 * 3600):
+        super().__init__(path, capacity, ttl)
+
+
+    @staticmethod
+    def key(model: str, query: str, block: Document) -> str:
+        raw = f"{model}\x00{normalize_query(query)}\x00{block_hash(block)}"
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+    def _normalize(self, score) -> float:
+        return float(score)
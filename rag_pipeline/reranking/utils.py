@@ -1,4 +1,9 @@
-from langchain.docstore.document import Document
+from __future__ import annotations
+import heapq
+from typing import TYPE_CHECKING, List, Sequence
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
 
 
 def classify_block(block: Document) -> str:
@@ -8,3 +13,52 @@ def classify_block(block: Document) -> str:
     """
     t = block.metadata.get("type", "text")
     return "media" if t in {"image", "table"} else "text"
+
+
+def pool_scores(scores: List[float], pool: str = "max") -> float:
+    """把同一父块下若干子块的分数聚合为父块分数：'max' | 'mean'"""
+    if not scores:
+        return 0.0
+    if pool == "max":
+        return max(scores)
+    if pool == "mean":
+        return sum(scores) / len(scores)
+    raise ValueError(f"未知的 pool 方式: {pool}（可选 'max' / 'mean'）")
+
+
+
+class Top_K_Heap():
+    """固定容量的最小堆，保存 (score, -rank, idx)；分数相同时检索排名靠前者优先"""
+
+    def __init__(self, k: int):
+        self.k    = k
+        self.heap = []
+
+    def push(self, score: float, rank: int, idx: int) -> bool:
+        """返回该候选是否进入了 top-k"""
+        if self.k <= 0:
+            return False
+        item = (score, -rank, idx)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+            return True
+        if item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+            return True
+        return False
+
+    def ranked(self) -> List[int]:
+        return [idx for _, _, idx in sorted(self.heap, reverse=True)]
+
+
+def topk_snapshot(blocks: Sequence[Document], idx_group: List[int], heap: Top_K_Heap,
+                  status: List[str]) -> List[Document]:
+    """
+    渐进式重排的当前结果：已打分的 top-k 在前，空位按 idx_group 的顺序（检索排名）
+    用尚未打分（status 为 "pending"）的候选补齐，打分失败（"failed"）的排在最后
+    """
+    chosen = heap.ranked()
+    taken  = set(chosen)
+    fill   = [i for i in idx_group if i not in taken and status[i] == "pending"]
+    failed = [i for i in idx_group if i not in taken and status[i] == "failed"]
+    return [blocks[i] for i in (chosen + fill + failed)[:heap.k]]
@@ -1,4 +1,23 @@
-from .dense_retrieval import *
-from .sparse_retrieval import *
-from .hybrid_retrieval import *
-from .utils import *
\ No newline at end of file
+"""
+懒加载：访问某个名字时才导入对应子模块（及其 torch / langchain / faiss 等重依赖），
+`import` 本包本身不产生任何副作用。
+"""
+from ..lazy import lazy_exports
+
+_LAZY_ATTRS = {
+    "Dense_Retriever":       ".dense_retrieval",
+    "Sparse_Retriever_bm25": ".sparse_retrieval",
+    "Hybrid_Retriever":      ".hybrid_retrieval",
+    "BM25_Matrix":           ".bm25_matrix",
+    "term_hash":             ".bm25_matrix",
+    "Shared_DocStore":       ".shared_state",
+    "export_shared_state":   ".shared_state",
+    "load_serialized_docs":  ".utils",
+    "load_embeddings":       ".utils",
+    "update_faiss_index":    ".index_update",
+    "preview_docs_by_type":  ".utils",
+    "qwen_configs":          ".configs",
+}
+__all__ = list(_LAZY_ATTRS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _LAZY_ATTRS)
@@ -0,0 +1,112 @@
+import json
+import hashlib
+import numpy as np
+from pathlib import Path
+from collections import Counter
+from typing import List
+
+
+
+def term_hash(term: str) -> int:
+    """64 位稳定哈希（跨进程一致，不受 PYTHONHASHSEED 影响）"""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+
+class BM25_Matrix():
+    """
+    与 rank_bm25.BM25Okapi 打分结果一致的 BM25，全部状态为扁平 numpy 数组：
+        term_hashes : 排序后的词项哈希（searchsorted 查词，替代 python dict）
+        indptr      : 每个词项在 postings 中的起止位置（CSC）
+        doc_ids     : 倒排文档下标
+        weights     : 预先算好的 idf * tf*(k1+1) / (tf + k1*(1-b+b*dl/avgdl))
+    save() 后可用 load(mmap=True) 以只读 mmap 方式加载，
+    多个 fork 出来的 worker 共享同一份物理页，引用计数不会弄脏页面。
+    接口与 BM25Okapi 保持一致：get_scores(query_tokens) -> np.ndarray
+    """
+
+    def __init__(self, term_hashes, indptr, doc_ids, weights, n_docs: int):
+        self.term_hashes = term_hashes
+        self.indptr      = indptr
+        self.doc_ids     = doc_ids
+        self.weights     = weights
+        self.n_docs      = int(n_docs)
+
+
+    @classmethod
+    def from_corpus(cls,
+                    corpus_tokens: List[List[str]],
+                    k1: float = 1.5,
+                    b: float = 0.75,
+                    epsilon: float = 0.25) -> "BM25_Matrix":
+        n_docs = len(corpus_tokens)
+        doc_len = np.array([len(toks) for toks in corpus_tokens], dtype=np.float64)
+        avgdl   = doc_len.sum() / max(n_docs, 1)
+
+        postings = {}                                  # term -> [(doc, tf), ...]
+        for d, toks in enumerate(corpus_tokens):
+            for term, tf in Counter(toks).items():
+                postings.setdefault(term, []).append((d, tf))
+
+        # idf 与 BM25Okapi 相同：负 idf 用 epsilon * 平均 idf 代替
+        terms = list(postings)
+        df    = np.array([len(postings[t]) for t in terms], dtype=np.float64)
+        idf   = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            idf[idf < 0] = epsilon * idf.mean()
+
+        hashes = np.array([term_hash(t) for t in terms], dtype=np.int64)
+        order  = np.argsort(hashes, kind="stable")
+
+        indptr  = np.zeros(len(terms) + 1, dtype=np.int64)
+        doc_ids, weights = [], []
+        for pos, ti in enumerate(order):
+            plist = postings[terms[ti]]
+            ds  = np.fromiter((d for d, _ in plist), dtype=np.int64, count=len(plist))
+            tfs = np.fromiter((tf for _, tf in plist), dtype=np.float64, count=len(plist))
+            w   = idf[ti] * tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * doc_len[ds] / avgdl))
+            doc_ids.append(ds.astype(np.int32))
+            weights.append(w.astype(np.float32))
+            indptr[pos + 1] = indptr[pos] + len(plist)
+
+        return cls(
+            term_hashes = hashes[order],
+            indptr      = indptr,
+            doc_ids     = np.concatenate(doc_ids) if doc_ids else np.zeros(0, np.int32),
+            weights     = np.concatenate(weights) if weights else np.zeros(0, np.float32),
+            n_docs      = n_docs,
+        )
+
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        scores = np.zeros(self.n_docs, dtype=np.float64)
+        if not len(self.term_hashes):
+            return scores
+        for term in query_tokens:                      # 与 BM25Okapi 一致：重复词重复计分
+            h   = term_hash(term)
+            pos = int(np.searchsorted(self.term_hashes, h))
+            if pos >= len(self.term_hashes) or self.term_hashes[pos] != h:
+                continue
+            lo, hi = self.indptr[pos], self.indptr[pos + 1]
+            scores[self.doc_ids[lo:hi]] += self.weights[lo:hi]
+        return scores
+
+
+    def save(self, out_dir: "str | Path"):
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for name in ("term_hashes", "indptr", "doc_ids", "weights"):
+            np.save(out_dir / f"{name}.npy", getattr(self, name))
+        with open(out_dir / "bm25.json", "w", encoding="utf-8") as f:
+            json.dump({"n_docs": self.n_docs}, f)
+
+
+    @classmethod
+    def load(cls, in_dir: "str | Path", mmap: bool = True) -> "BM25_Matrix":
+        in_dir = Path(in_dir)
+        mode   = "r" if mmap else None
+        arrays = {name: np.load(in_dir / f"{name}.npy", mmap_mode=mode)
+                  for name in ("term_hashes", "indptr", "doc_ids", "weights")}
+        with open(in_dir / "bm25.json", encoding="utf-8") as f:
+            n_docs = json.load(f)["n_docs"]
+        return cls(n_docs=n_docs, **arrays)
@@ -0,0 +1,15 @@
+"""
+检索配置：demo.py / serve.py / batch_qa.py 共用同一份，避免几个入口各自漂移
+需要改动时在入口处覆盖个别键：{**qwen_configs, "DEVICE": "cpu"}
+"""
+
+qwen_configs = {
+    "DENSE_MODEL": "./models/Qwen3-Embedding-0.6B",
+    "INDEX_PATH" : "./indexes/qwen/mm_hier_index",
+    "DENSE_PICK" : 200,         # 稠密召回数
+    "BATCH"      : 6,           # 嵌入模型batch大小 显存大约占用为21g
+    "BM25_PICK"  : 200,         # 稀疏召回数
+    "TOP_PARENT" : 200,
+    "k_child"    : 200,
+    "k_parent"   : 20,
+}
@@ -1,11 +1,15 @@
-import torch
+from __future__ import annotations
+import logging
 from pathlib import Path
-from typing import List, Tuple
-from rank_bm25 import BM25Okapi
+from typing import TYPE_CHECKING, List, Tuple
 from collections import Counter, defaultdict
-from langchain.docstore.document import Document
-from langchain.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+
+from ..monitoring.hooks import stage
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+logger = logging.getLogger(__name__)
 
 
 
@@ -27,6 +31,10 @@ class Dense_Retriever():
 
         self.configs = configs
 
+        import torch
+        from langchain.vectorstores import FAISS
+        from langchain_huggingface import HuggingFaceEmbeddings
+
         # 初始化 Embeddings
         embeddings = HuggingFaceEmbeddings(
             model_name=configs["DENSE_MODEL"],           # 例：Flex-RAG/models/Qwen3-Embedding-8B
@@ -49,11 +57,19 @@ class Dense_Retriever():
             vectordb = FAISS.from_documents(self.children, embeddings)
             vectordb.save_local(str(index_dir))
 
+        self.embeddings      = embeddings
         self.vectordb        = vectordb
         self.dense_retriever = vectordb.as_retriever(
             search_kwargs={"k": configs["DENSE_PICK"]}
         )
 
+    # ---------------------------------------------------------------------
+    def _search(self, query: str, k: int) -> List[Document]:
+        with stage("embedding", n_queries=1):
+            vec = self.embeddings.embed_query(query)
+        with stage("faiss_search", n_queries=1, k=k):
+            return self.vectordb.similarity_search_by_vector(vec, k=k)
+
     # ---------------------------------------------------------------------
     def dense_retrieve_chunks(self, query: str, k: int | None = None) -> List[Document]:
         """
@@ -62,10 +78,10 @@ class Dense_Retriever():
         - 默认 top-k = configs['CHUNK_PICK'] (若有)；否则复用 DENSE_PICK
         """
         k = k or self.configs.get("CHUNK_PICK", self.configs["DENSE_PICK"])
-        chunk_hits = self.vectordb.similarity_search(query, k=k)
+        chunk_hits = self._search(query, k)
         
         stats = Counter(d.metadata["type"] for d in chunk_hits)
-        print(
+        logger.info(
             f"稠密检索到 {len(chunk_hits)} 个 chunk："
             f"{stats.get('text',0)} 段文本，"
             f"{stats.get('image',0)} 张图像，"
@@ -76,13 +92,14 @@ class Dense_Retriever():
     # ---------------------------------------------------------------------
     def dense_retrieve_parents(self, query: str) -> List[Document]:
         """稠密检索 → 子块 → 映射父块 → 去重后返回"""
-        dense_child_hits = self.dense_retriever.get_relevant_documents(query)
-        parent_ids       = {ch.metadata["parent_id"] for ch in dense_child_hits}
-        parent_hits      = [self.parents[i] for i in parent_ids]
+        dense_child_hits = self._search(query, self.configs["DENSE_PICK"])
+        with stage("parent_mapping", leg="dense"):
+            parent_ids       = dict.fromkeys(ch.metadata["parent_id"] for ch in dense_child_hits)
+            parent_hits      = [self.parents[i] for i in parent_ids]
 
         # 结果统计（可选）
         stats = Counter(p.metadata["type"] for p in parent_hits)
-        print(
+        logger.info(
             f"稠密检索到 {len(dense_child_hits)} 个子块，映射到 {len(parent_hits)} 个父块，"
             f"包含 {stats.get('parent',0)+stats.get('text',0)} 段文本，"
             f"{stats.get('image',0)} 张图像，"
@@ -111,7 +128,7 @@ class Dense_Retriever():
                     top_equations.append(eq)
                     seen.add(id(eq))
 
-        print(f"\n关联到同页公式 {len(top_equations)} 条")
+        logger.info(f"关联到同页公式 {len(top_equations)} 条")
         self.preview_equations(top_equations)
         return top_equations
 
@@ -1,12 +1,19 @@
-import torch
+from __future__ import annotations
+import logging
+import numpy as np
 from pathlib import Path
-from typing import List, Tuple
-from rank_bm25 import BM25Okapi
+from typing import TYPE_CHECKING, List, Optional, Tuple
 from collections import Counter, defaultdict
-from langchain.docstore.document import Document
-from langchain.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 
+from .bm25_matrix import BM25_Matrix
+from .shared_state import Shared_DocStore
+from .utils import load_embeddings
+from ..monitoring.hooks import stage
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+logger = logging.getLogger(__name__)
 
 
 class Hybrid_Retriever():
@@ -19,9 +26,14 @@ class Hybrid_Retriever():
 
     def __init__(
         self,
-        chunks: "List[Document] | Tuple[List[Document], List[Document]]",
+        chunks: "List[Document] | Tuple[List[Document], List[Document]] | None",
         configs: dict
     ):
+        """
+        configs 可选 SHARED_STATE：export_shared_state 导出的目录。
+        给定时 children/parents、BM25 与 FAISS 全部从 mmap 只读加载（chunks 可传 None），
+        供 pre-fork 多 worker 共享同一份物理内存。
+        """
         # 解析输入
         if isinstance(chunks, tuple):
             self.children, self.parents = chunks      
@@ -32,15 +44,15 @@ class Hybrid_Retriever():
         self.configs = configs
 
         # 初始化嵌入模型
-        embeddings = HuggingFaceEmbeddings(
-            model_name=configs["DENSE_MODEL"],
-            model_kwargs={
-                "device": "cuda" if torch.cuda.is_available() else "cpu",
-                "local_files_only": True,
-                "trust_remote_code": True        
-            },
-            encode_kwargs={"batch_size": configs["BATCH"]}
-        )
+        embeddings = load_embeddings(configs)
+        self.embeddings = embeddings
+
+        if configs.get("SHARED_STATE"):
+            self._load_shared_state(Path(configs["SHARED_STATE"]))
+            return
+
+        from rank_bm25 import BM25Okapi
+        from langchain.vectorstores import FAISS
 
         # 构建 FAISS 索引
         index_dir = Path(configs["INDEX_PATH"])
@@ -56,12 +68,76 @@ class Hybrid_Retriever():
         self.dense_retriever = vectordb.as_retriever(
             search_kwargs={"k": configs["DENSE_PICK"]}
         )
+        self.faiss_index     = vectordb.index
+        self._faiss_row_doc  = lambda i: vectordb.docstore.search(vectordb.index_to_docstore_id[i])
 
         # 构建 BM25 语料
         corpus_tokens = [c.page_content.split() for c in self.children]
         self.bm25 = BM25Okapi(corpus_tokens)
 
 
+    def _load_shared_state(self, root: Path):
+        """从 export_shared_state 导出的目录以只读 mmap 方式加载全部检索状态"""
+        import faiss
+
+        self.children = Shared_DocStore(root / "children")
+        self.parents  = Shared_DocStore(root / "parents")
+        self.bm25     = BM25_Matrix.load(root / "bm25", mmap=True)
+
+        try:
+            self.faiss_index = faiss.read_index(str(root / "faiss.index"), faiss.IO_FLAG_MMAP)
+        except RuntimeError:                      # 部分索引类型不支持 mmap，fork 后仍走 COW 共享
+            self.faiss_index = faiss.read_index(str(root / "faiss.index"))
+        rows = np.load(root / "faiss_rows.npy", mmap_mode="r")
+
+        self.vectordb        = None
+        self._faiss_row_doc  = lambda i: self.children[int(rows[i])]
+        self.dense_retriever = _Faiss_Dense_Retriever(self)
+
+
+    def _faiss_hits(self, vecs: np.ndarray, k: int) -> List[List[Document]]:
+        """一次 FAISS batch search，返回每个向量对应的 child 列表"""
+        with stage("faiss_search", n_queries=len(vecs), k=k):
+            _, idx = self.faiss_index.search(vecs, k)
+            return [[self._faiss_row_doc(i) for i in row if i != -1] for row in idx]
+
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        query 嵌入的唯一入口（检索与语义缓存共用，同一 query 得到同一向量）
+        HuggingFaceEmbeddings 未配置 query prompt 时 embed_query(q) 即 embed_documents([q])[0]，
+        这里批量调用 embed_documents，一次 forward 嵌入所有 query
+        """
+        with stage("embedding", n_queries=len(queries)):
+            return np.asarray(self.embeddings.embed_documents(list(queries)), dtype="float32")
+
+
+    def dense_search(self, queries: List[str], k: int | None = None,
+                     vecs: Optional[List[Optional[np.ndarray]]] = None) -> List[List[Document]]:
+        """
+        所有 query 一次过嵌入模型 + 一次 FAISS batch search
+        vecs[i] 非空时直接使用（如语义缓存未命中时已算好的 query 向量），只嵌入其余 query
+        """
+        vecs = [None if v is None else np.asarray(v, dtype="float32").reshape(-1)
+                for v in (vecs or [None] * len(queries))]
+        missing = [i for i, v in enumerate(vecs) if v is None]
+        if missing:
+            for i, v in zip(missing, self.embed_queries([queries[i] for i in missing])):
+                vecs[i] = v
+        return self._faiss_hits(np.stack(vecs), k or self.configs["DENSE_PICK"])
+
+
+    def dense_retrieve_parents(self, query: str) -> Tuple[List[Document], List[Document]]:
+        """
+        只走稠密一路：return (child_hits, parent_hits)，父块按首次命中的子块顺序排列
+        （供流水线编排在 BM25 仍在计算时先开始重排）
+        """
+        child_hits = self.dense_search([query])[0]
+        with stage("parent_mapping", leg="dense"):
+            parent_ids = dict.fromkeys(c.metadata["parent_id"] for c in child_hits)
+        return child_hits, [self.parents[i] for i in parent_ids]
+
+
     def bm25_retrieve_parents(self, query: str) -> Tuple[List[Document], List[Document]]:
         """
         return (child_hits, parent_hits)
@@ -69,11 +145,19 @@ class Hybrid_Retriever():
             parent_hits: Document of the top_parent parent chunks (after deduplication)
         """
         # child score
-        scores = self.bm25.get_scores(query.split())
-        top_idx = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:self.configs["BM25_PICK"]]
+        with stage("bm25_scoring"):
+            scores = self.bm25.get_scores(query.split())
+            top_idx = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:self.configs["BM25_PICK"]]
         child_hits = [self.children[i] for i in top_idx]
 
         # mapped to parents
+        with stage("parent_mapping", leg="sparse"):
+            parent_ids = self._unique_parent_ids(child_hits)
+        parent_hits = [self.parents[i] for i in parent_ids]
+        return child_hits, parent_hits
+
+
+    def _unique_parent_ids(self, child_hits: List[Document]) -> List[int]:
         parent_ids = []
         seen = set()
         for ch in child_hits:
@@ -83,33 +167,60 @@ class Hybrid_Retriever():
                 seen.add(pid)
             if len(parent_ids) >= self.configs["TOP_PARENT"]:
                 break
-        parent_hits = [self.parents[i] for i in parent_ids]
-        return child_hits, parent_hits
+        return parent_ids
 
 
     def bm25_retrieve_text_parents(self, query: str):
 
-        scores = self.bm25.get_scores(query.split())
-        idx_sorted = sorted(range(len(scores)),
-                            key=lambda i: scores[i], reverse=True)
+        with stage("bm25_scoring"):
+            scores = self.bm25.get_scores(query.split())
+            idx_sorted = sorted(range(len(scores)),
+                                key=lambda i: scores[i], reverse=True)
 
         # filterring
-        child_hits, parent_ids = [], []
-        for i in idx_sorted:
-            if len(child_hits) >= self.configs["k_child"]:
-                break
-            pid = self.children[i].metadata["parent_id"]
-            if self.parents[pid].metadata["type"] != "parent":
-                continue                           # skip media child chunks
-            child_hits.append(self.children[i])
-            parent_ids.append(pid)
-            if len(set(parent_ids)) >= self.configs["k_parent"]:   # early stop
-                break
+        with stage("parent_mapping", leg="sparse") as st:
+            child_hits, parent_ids = [], []
+            for i in idx_sorted:
+                if len(child_hits) >= self.configs["k_child"]:
+                    break
+                pid = self.children[i].metadata["parent_id"]
+                if self.parents[pid].metadata["type"] != "parent":
+                    continue                           # skip media child chunks
+                child_hits.append(self.children[i])
+                parent_ids.append(pid)
+                if len(set(parent_ids)) >= self.configs["k_parent"]:   # early stop
+                    break
 
-        parent_hits = [self.parents[i] for i in set(parent_ids)]
+            parent_hits = [self.parents[i] for i in dict.fromkeys(parent_ids)]   # 保持 BM25 排名顺序
+            st.set(n_children=len(child_hits), n_parents=len(parent_hits))
         return child_hits, parent_hits
 
 
+    @staticmethod
+    def merge_key(doc: Document) -> tuple:
+        return (doc.metadata["book_idx"],
+                doc.metadata["page_idx"],
+                doc.metadata["type"])
+
+
+    def group_children(self, child_hits: List[Document]) -> dict:
+        """
+        把命中的子块按其父块的 merge_key 分组（按 chunk_id 去重，保持命中顺序），
+        用于只对子块打分、再聚合回父块的重排模式
+        """
+        groups, seen, key_of = defaultdict(list), set(), {}
+        for ch in child_hits:
+            cid = ch.metadata.get("chunk_id")
+            if cid in seen:
+                continue
+            seen.add(cid)
+            pid = ch.metadata["parent_id"]
+            if pid not in key_of:
+                key_of[pid] = self.merge_key(self.parents[pid])
+            groups[key_of[pid]].append(ch)
+        return groups
+
+
     def merge_chunks(
         self,
         dense_hits: List[Document],
@@ -119,16 +230,15 @@ class Hybrid_Retriever():
         把稠密 + 稀疏父块合并，按 (book_idx,page_idx,type) 去重，
         保留顺序：先 dense，再 sparse 中新增的。
         """
-        merged = []
-        seen   = set()                                      # 去重键集合
-        for ch in dense_hits + sparse_hits:
-            key = (ch.metadata["book_idx"],
-                   ch.metadata["page_idx"],
-                   ch.metadata["type"])
-            if key not in seen:
-                merged.append(ch)
-                seen.add(key)
-        return merged
+        with stage("fusion", n_dense=len(dense_hits), n_sparse=len(sparse_hits)):
+            merged = []
+            seen   = set()                                      # 去重键集合
+            for ch in dense_hits + sparse_hits:
+                key = self.merge_key(ch)
+                if key not in seen:
+                    merged.append(ch)
+                    seen.add(key)
+            return merged
 
     
     def hybrid_retrieve_chunks(self, query: str) -> List[Document]:
@@ -139,9 +249,9 @@ class Hybrid_Retriever():
             - 返回合并后的 chunk 列表
         """
         # 1) 稠密召回 -------------------------------------------
-        dense_hits    = self.dense_retriever.get_relevant_documents(query)
+        dense_hits    = self.dense_search([query])[0]
         dense_counter = Counter(d.metadata["type"] for d in dense_hits)
-        print(
+        logger.info(
             f"稠密检索到 {len(dense_hits)} 个块，"
             f"包含 {dense_counter.get('text',0)} 段文本，"
             f"{dense_counter.get('image',0)} 张图像，"
@@ -150,14 +260,15 @@ class Hybrid_Retriever():
         )
 
         # 2) 稀疏召回（BM25） ------------------------------------
-        scores = self.bm25.get_scores(query.split())
-        k_sparse = self.configs.get("BM25_PICK", 40)
-        top_idx  = sorted(range(len(scores)),
-                          key=lambda i: scores[i],
-                          reverse=True)[:k_sparse]
+        with stage("bm25_scoring"):
+            scores = self.bm25.get_scores(query.split())
+            k_sparse = self.configs.get("BM25_PICK", 40)
+            top_idx  = sorted(range(len(scores)),
+                              key=lambda i: scores[i],
+                              reverse=True)[:k_sparse]
         sparse_hits    = [self.children[i] for i in top_idx]
         sparse_counter = Counter(d.metadata["type"] for d in sparse_hits)
-        print(
+        logger.info(
             f"稀疏检索到 {len(sparse_hits)} 个块，"
             f"包含 {sparse_counter.get('text',0)} 段文本，"
             f"{sparse_counter.get('image',0)} 张图像，"
@@ -168,7 +279,7 @@ class Hybrid_Retriever():
         # 3) 合并去重（保序：先 dense，再 sparse 新增） ------------
         results = self.merge_chunks(dense_hits, sparse_hits)
         type_counter = Counter(ch.metadata["type"] for ch in results)
-        print(
+        logger.info(
             f"合并后共 {len(results)} 个唯一块，"
             f"{type_counter.get('text', 0)} 段文本，"
             f"{type_counter.get('image', 0)} 张图像，"
@@ -179,13 +290,38 @@ class Hybrid_Retriever():
         return results
 
     
-    def hybrid_retrieve_parents(self, query: str):
+    def hybrid_retrieve_parents(self, query: str, with_children: bool = False):
+        """
+        with_children=True 时返回 (parents, matched_children)，
+        matched_children[i] 为 parents[i] 在稠密 + 稀疏检索中命中的子块列表
+        """
         # dense retrival
-        dense_child_hits = self.dense_retriever.get_relevant_documents(query)
-        dense_parent_ids = {c.metadata["parent_id"] for c in dense_child_hits}
-        dense_parents    = [self.parents[i] for i in dense_parent_ids]
+        dense_child_hits = self.dense_search([query])[0]
+        return self._merge_dense_sparse_parents(query, dense_child_hits, with_children)
+
+
+    def hybrid_retrieve_parents_batch(self, queries: List[str], with_children: bool = False,
+                                      vecs: Optional[List[Optional[np.ndarray]]] = None) -> list:
+        """
+        批量版 hybrid_retrieve_parents：
+            - 所有 query 一次性过嵌入模型（一次 forward；vecs 中已有向量的 query 不再嵌入）
+            - FAISS 一次 batch search
+            - BM25 / 父块映射 / 合并 仍逐条进行
+        返回与 queries 等长的 parents 列表（with_children 时为 (parents, matched_children) 列表）
+        """
+        if not queries:
+            return []
+        hits = self.dense_search(queries, vecs=vecs)
+        return [self._merge_dense_sparse_parents(q, h, with_children) for q, h in zip(queries, hits)]
+
+
+    def _merge_dense_sparse_parents(self, query: str, dense_child_hits: List[Document],
+                                    with_children: bool = False):
+        with stage("parent_mapping", leg="dense"):
+            dense_parent_ids = dict.fromkeys(c.metadata["parent_id"] for c in dense_child_hits)   # 按首次命中保序
+            dense_parents    = [self.parents[i] for i in dense_parent_ids]
         dense_counter    = Counter(d.metadata["type"] for d in dense_parents)
-        print(
+        logger.info(
             f"稠密检索到 {len(dense_child_hits)} 个子块，映射到 {len(dense_parents)} 个父块，"
             f"包含 {dense_counter.get('parent',0)+dense_counter.get('text',0)} 段文本，"
             f"{dense_counter.get('image',0)} 张图像，"
@@ -196,7 +332,7 @@ class Hybrid_Retriever():
         # sparse retrival
         sparse_child_hits, sparse_parents = self.bm25_retrieve_text_parents(query)
         sparse_counter = Counter(d.metadata["type"] for d in sparse_parents)
-        print(
+        logger.info(
             f"稀疏检索到 {len(sparse_child_hits)} 个子块，映射到 {len(sparse_parents)} 个父块，"
             f"包含 {sparse_counter.get('parent',0)+sparse_counter.get('text',0)} 段文本，"
             f"{sparse_counter.get('image',0)} 张图像，"
@@ -206,14 +342,17 @@ class Hybrid_Retriever():
 
         results = self.merge_chunks(dense_parents, sparse_parents)
         type_counter = Counter(ch.metadata["type"] for ch in results)
-        print(
+        logger.info(
             f"合并后共 {len(results)} 个唯一 parents，"
             f"{sparse_counter.get('parent',0)+sparse_counter.get('text',0)} 段文本，"
             f"{type_counter.get('image', 0)} 张图像，"
             f"{type_counter.get('table', 0)} 个表格，"
             # f"{type_counter.get('equation', 0)} 条公式"
         )
-        
+
+        if with_children:
+            groups = self.group_children(dense_child_hits + sparse_child_hits)
+            return results, [groups.get(self.merge_key(p), []) for p in results]
         return results
         
 
@@ -239,7 +378,7 @@ class Hybrid_Retriever():
                     top_equations.append(eq)
                     seen_eq_ids.add(id(eq))
 
-        print(f"\n关联到同页公式 {len(top_equations)} 条")
+        logger.info(f"关联到同页公式 {len(top_equations)} 条")
         self.preview_equations(top_equations)
 
         return top_equations
@@ -251,3 +390,12 @@ class Hybrid_Retriever():
             print(f"{i}. (equation, p{d.metadata['page_idx']})  {latex}")
 
 
+
+class _Faiss_Dense_Retriever():
+    """SHARED_STATE 模式下替代 vectordb.as_retriever()，接口保持 get_relevant_documents"""
+
+    def __init__(self, hret: Hybrid_Retriever):
+        self.hret = hret
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        return self.hret.dense_search([query])[0]
@@ -0,0 +1,70 @@
+from __future__ import annotations
+import json
+import numpy as np
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Tuple
+
+from .utils import load_embeddings
+from ..monitoring.hooks import stage
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+
+def _child_key(doc: Document) -> Tuple:
+    return (doc.metadata.get("book_idx"), doc.metadata.get("page_idx"), doc.page_content)
+
+
+def update_faiss_index(children: List[Document], configs: dict, delta, embeddings=None):
+    """
+    增量入库后重建 configs["INDEX_PATH"] 处的 FAISS 索引（需在 Hybrid_Retriever 加载之前调用）
+    --------------------------------------------------------------
+    • 旧索引中不属于 delta["drop_books"] 的子块按 (book_idx, page_idx, 文本) 复用原向量；
+      其余子块（新增 / 更新书的）才过嵌入模型
+    • children 为对合并后的 docs 重新切块得到的全部子块，parent_id / chunk_id 等 metadata 以它为准
+    • 旧索引不存在时退化为全量 FAISS.from_documents
+    delta 为 parse_pdfs(manifest=...) 写出的 .delta.json 路径或已读入的 dict；
+    返回 (vectordb, {"reused": 复用向量的子块数, "embedded": 新嵌入的子块数})
+    """
+    from langchain.vectorstores import FAISS
+
+    if not isinstance(delta, dict):
+        with open(delta, encoding="utf-8") as f:
+            delta = json.load(f)
+    embeddings = embeddings or load_embeddings(configs)
+    index_dir  = Path(configs["INDEX_PATH"])
+
+    if not index_dir.exists():
+        vectordb = FAISS.from_documents(children, embeddings)
+        vectordb.save_local(str(index_dir))
+        return vectordb, {"reused": 0, "embedded": len(children)}
+
+    drop = set(delta["drop_books"])
+    with stage("index_reuse", n_children=len(children)) as st:
+        old  = FAISS.load_local(str(index_dir), embeddings, allow_dangerous_deserialization=True)
+        vecs = old.index.reconstruct_n(0, old.index.ntotal)
+        rows = {}
+        for row, doc_id in old.index_to_docstore_id.items():
+            doc = old.docstore.search(doc_id)
+            if doc.metadata.get("book_idx") not in drop:
+                rows.setdefault(_child_key(doc), row)
+
+        out     = np.empty((len(children), vecs.shape[1]), dtype="float32")
+        missing = []
+        for i, ch in enumerate(children):
+            row = rows.get(_child_key(ch))
+            if row is None:
+                missing.append(i)
+            else:
+                out[i] = vecs[row]
+        st.set(reused=len(children) - len(missing), embedded=len(missing))
+
+    with stage("embedding", n_queries=len(missing)):
+        if missing:
+            out[missing] = np.asarray(embeddings.embed_documents([children[i].page_content for i in missing]),
+                                      dtype="float32")
+
+    vectordb = FAISS.from_embeddings([(ch.page_content, v.tolist()) for ch, v in zip(children, out)],
+                                     embeddings, metadatas=[ch.metadata for ch in children])
+    vectordb.save_local(str(index_dir))
+    return vectordb, {"reused": len(children) - len(missing), "embedded": len(missing)}
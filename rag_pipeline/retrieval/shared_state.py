@@ -0,0 +1,116 @@
+from __future__ import annotations
+import json
+import mmap
+import numpy as np
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, List, Sequence
+
+from .bm25_matrix import BM25_Matrix
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+
+
+class Shared_DocStore(Sequence):
+    """
+    只读、mmap 支撑的 Document 序列
+    -------------------------------------------------
+    • page_content / metadata 分别以 UTF-8 / JSON 串接存放在两个 .bin 文件中，
+      偏移量存在 .npy 中；__getitem__ 时才临时构造 Document。
+    • 进程内不常驻数百万个 python 对象，fork 后的 worker 读取时不会因为
+      引用计数写入而触发 copy-on-write，物理页在所有 worker 间共享。
+    • 行为上等价于 List[Document]，可直接作为 children / parents 传给检索器。
+    """
+
+    def __init__(self, root: "str | Path"):
+        root = Path(root)
+        self.root = root
+        self._text_off = np.load(root / "text_offsets.npy", mmap_mode="r")
+        self._meta_off = np.load(root / "meta_offsets.npy", mmap_mode="r")
+        self._text     = self._map(root / "text.bin")
+        self._meta     = self._map(root / "meta.bin")
+
+        from langchain.docstore.document import Document
+        self._doc_cls  = Document
+
+
+    @staticmethod
+    def _map(path: Path):
+        with open(path, "rb") as f:
+            if path.stat().st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+    @staticmethod
+    def build(docs: List[Document], root: "str | Path") -> "Shared_DocStore":
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        text_off = np.zeros(len(docs) + 1, dtype=np.int64)
+        meta_off = np.zeros(len(docs) + 1, dtype=np.int64)
+        with open(root / "text.bin", "wb") as ft, open(root / "meta.bin", "wb") as fm:
+            for i, d in enumerate(docs):
+                t = d.page_content.encode("utf-8")
+                m = json.dumps(d.metadata, ensure_ascii=False).encode("utf-8")
+                ft.write(t)
+                fm.write(m)
+                text_off[i + 1] = text_off[i] + len(t)
+                meta_off[i + 1] = meta_off[i] + len(m)
+        np.save(root / "text_offsets.npy", text_off)
+        np.save(root / "meta_offsets.npy", meta_off)
+        return Shared_DocStore(root)
+
+
+    def __len__(self) -> int:
+        return len(self._text_off) - 1
+
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        t0, t1 = int(self._text_off[i]), int(self._text_off[i + 1])
+        m0, m1 = int(self._meta_off[i]), int(self._meta_off[i + 1])
+        return self._doc_cls(page_content=self._text[t0:t1].decode("utf-8"),
+                             metadata=json.loads(self._meta[m0:m1]))
+
+
+    def __iter__(self) -> Iterator[Document]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+
+def export_shared_state(children: List[Document],
+                        parents: List[Document],
+                        vectordb,
+                        out_dir: "str | Path"):
+    """
+    把一个已构建好的 Hybrid_Retriever 状态导出为可 mmap 的目录：
+        out_dir/children/   Shared_DocStore
+        out_dir/parents/    Shared_DocStore
+        out_dir/bm25/       BM25_Matrix
+        out_dir/faiss.index 原始 FAISS 索引
+        out_dir/faiss_rows.npy   FAISS 行号 -> children 下标
+    """
+    import faiss
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    Shared_DocStore.build(children, out_dir / "children")
+    Shared_DocStore.build(parents,  out_dir / "parents")
+    BM25_Matrix.from_corpus([c.page_content.split() for c in children]).save(out_dir / "bm25")
+
+    # FAISS 行号 -> chunk_id（分层切分时 chunk_id 即 children 下标）
+    rows = np.array([
+        vectordb.docstore.search(vectordb.index_to_docstore_id[i]).metadata["chunk_id"]
+        for i in range(vectordb.index.ntotal)
+    ], dtype=np.int64)
+    np.save(out_dir / "faiss_rows.npy", rows)
+    faiss.write_index(vectordb.index, str(out_dir / "faiss.index"))
+    print(f"✅ Exported shared retrieval state to {out_dir}")
@@ -1,8 +1,15 @@
+from __future__ import annotations
+import logging
 from pathlib import Path
-from typing import List, Tuple
+from typing import TYPE_CHECKING, List, Tuple
 from collections import Counter, defaultdict
-from rank_bm25 import BM25Okapi
-from langchain.docstore.document import Document
+
+from ..monitoring.hooks import stage
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+logger = logging.getLogger(__name__)
 
 
 
@@ -36,50 +43,60 @@ class Sparse_Retriever_bm25():
 
         self.configs = configs
 
+        from rank_bm25 import BM25Okapi
+
         # 构建 BM25 索引
         corpus_tokens = [c.page_content.split() for c in self.children]
         self.bm25 = BM25Okapi(corpus_tokens)
 
     
+    # ------------------------------------------------------------------
+    def _scores(self, query: str):
+        with stage("bm25_scoring"):
+            return self.bm25.get_scores(query.split())
+
+
     # ------------------------------------------------------------------
     def bm25_retrieve_parents(self, query: str) -> Tuple[List[Document], List[Document]]:
         """不区分内容类型的 BM25 → top-k child → parent 映射"""
-        scores   = self.bm25.get_scores(query.split())
+        scores   = self._scores(query)
         bm25_k   = self.configs["BM25_PICK"]
         top_idx  = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:bm25_k]
         child_hits = [self.children[i] for i in top_idx]
 
         # 映射到 parent
-        parent_ids, seen = [], set()
-        for ch in child_hits:
-            pid = ch.metadata["parent_id"]
-            if pid not in seen:
-                parent_ids.append(pid)
-                seen.add(pid)
-            if len(parent_ids) >= self.configs["TOP_PARENT"]:
-                break
-        parent_hits = [self.parents[i] for i in parent_ids]
+        with stage("parent_mapping", leg="sparse"):
+            parent_ids, seen = [], set()
+            for ch in child_hits:
+                pid = ch.metadata["parent_id"]
+                if pid not in seen:
+                    parent_ids.append(pid)
+                    seen.add(pid)
+                if len(parent_ids) >= self.configs["TOP_PARENT"]:
+                    break
+            parent_hits = [self.parents[i] for i in parent_ids]
         return child_hits, parent_hits
 
     
     def bm25_retrieve_text_parents(self, query: str) -> Tuple[List[Document], List[Document]]:
         """仅保留文本类 parent（排除图像 / 表格 parent）"""
-        scores     = self.bm25.get_scores(query.split())
+        scores     = self._scores(query)
         idx_sorted = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
 
-        child_hits, parent_ids = [], []
-        for i in idx_sorted:
-            if len(child_hits) >= self.configs["k_child"]:
-                break
-            pid = self.children[i].metadata["parent_id"]
-            if self.parents[pid].metadata["type"] != "parent":       # 只要文本 parent
-                continue
-            child_hits.append(self.children[i])
-            parent_ids.append(pid)
-            if len(set(parent_ids)) >= self.configs["k_parent"]:
-                break
-
-        parent_hits = [self.parents[i] for i in set(parent_ids)]
+        with stage("parent_mapping", leg="sparse"):
+            child_hits, parent_ids = [], []
+            for i in idx_sorted:
+                if len(child_hits) >= self.configs["k_child"]:
+                    break
+                pid = self.children[i].metadata["parent_id"]
+                if self.parents[pid].metadata["type"] != "parent":       # 只要文本 parent
+                    continue
+                child_hits.append(self.children[i])
+                parent_ids.append(pid)
+                if len(set(parent_ids)) >= self.configs["k_parent"]:
+                    break
+
+            parent_hits = [self.parents[i] for i in dict.fromkeys(parent_ids)]
         return child_hits, parent_hits
 
 
@@ -91,12 +108,12 @@ class Sparse_Retriever_bm25():
             - k 默认为 configs['CHUNK_PICK'] 或 BM25_PICK
         """
         k = k or self.configs.get("CHUNK_PICK", self.configs["BM25_PICK"])
-        scores   = self.bm25.get_scores(query.split())
+        scores   = self._scores(query)
         top_idx  = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
         chunk_hits = [self.children[i] for i in top_idx]
 
         cnt = Counter(ch.metadata["type"] for ch in chunk_hits)
-        print(
+        logger.info(
             f"BM25 检索到 {len(chunk_hits)} 个 chunk："
             f"{cnt.get('text',0)} 段文本，"
             f"{cnt.get('image',0)} 张图像，"
@@ -110,7 +127,7 @@ class Sparse_Retriever_bm25():
         child_hits, parent_hits = self.bm25_retrieve_text_parents(query)
 
         cnt = Counter(p.metadata["type"] for p in parent_hits)
-        print(
+        logger.info(
             f"BM25 检索到 {len(child_hits)} 个子块，映射到 {len(parent_hits)} 个父块，"
             f"{cnt.get('parent',0)+cnt.get('text',0)} 段文本，"
             f"{cnt.get('image',0)} 张图像，"
@@ -138,7 +155,7 @@ class Sparse_Retriever_bm25():
                     top_equations.append(eq)
                     seen.add(id(eq))
 
-        print(f"\n关联到同页公式 {len(top_equations)} 条")
+        logger.info(f"关联到同页公式 {len(top_equations)} 条")
         self.preview_equations(top_equations)
         return top_equations
 
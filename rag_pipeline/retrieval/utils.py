@@ -3,15 +3,31 @@ Merge every *.json file under /data/huali_data/  (each is a list of instances)
 into one big JSON list and save to /data/huali_mm/huali_corpus.json
 """
 import json
-from tqdm import tqdm
 from pathlib import Path
 from itertools import islice
 from collections import Counter, defaultdict
-from langchain.docstore.document import Document
 
 
 
+def load_embeddings(configs: dict):
+    """按 configs（DENSE_MODEL / BATCH / DEVICE）加载嵌入模型，检索器与离线建索引共用"""
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name=configs["DENSE_MODEL"],
+        model_kwargs={
+            "device": configs.get("DEVICE") or ("cuda" if torch.cuda.is_available() else "cpu"),
+            "local_files_only": True,
+            "trust_remote_code": True
+        },
+        encode_kwargs={"batch_size": configs["BATCH"]}
+    )
+
+
 def load_serialized_docs(path: Path):
+    from langchain.docstore.document import Document
+
     with open(path, encoding="utf-8") as f:
         raw_items = json.load(f)         # list[dict]
 
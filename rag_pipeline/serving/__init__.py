@@ -0,0 +1,24 @@
+"""
+懒加载：访问某个名字时才导入对应子模块（及其 faiss / langchain 依赖），
+`import` 本包本身不产生任何副作用。
+"""
+from ..lazy import lazy_exports
+
+_LAZY_ATTRS = {
+    "MicroBatcher":         ".batcher",
+    "LatencyStats":         ".stats",
+    "process_memory":       ".stats",
+    "RAG_Server":           ".server",
+    "media_brief":          ".server",
+    "prefork_serve":        ".prefork",
+    "report_worker_memory": ".prefork",
+    "Semantic_Cache":       ".semantic_cache",
+    "corpus_version":       ".semantic_cache",
+    "Pipelined_RAG":        ".pipeline",
+    "Stability_Rule":       ".pipeline",
+    "Batch_Runner":         ".batch_runner",
+    "Concurrency_Gate":     ".batch_runner",
+}
+__all__ = list(_LAZY_ATTRS)
+
+__getattr__, __dir__ = lazy_exports(__name__, _LAZY_ATTRS)
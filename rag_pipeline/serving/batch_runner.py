@@ -0,0 +1,263 @@
+from __future__ import annotations
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, Tuple
+
+from .server import media_brief
+from ..monitoring.hooks import stage
+
+logger = logging.getLogger(__name__)
+
+
+
+class Concurrency_Gate():
+    """
+    带计量的全局并发上限（上下文管理器，可作为 Qwenvl_Reranker 的 limiter）
+    记录 in-flight 峰值与累计占用时间，utilization(wall) = 占用时间 / (wall × limit)
+    """
+
+    def __init__(self, limit: int):
+        self.limit  = limit
+        self._sem   = threading.BoundedSemaphore(limit)
+        self._lock  = threading.Lock()
+        self._local = threading.local()
+        self.in_flight = 0
+        self.peak      = 0
+        self.calls     = 0
+        self.busy_s    = 0.0
+
+    def __enter__(self):
+        self._sem.acquire()
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        self._local.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        dt = time.perf_counter() - self._local.t0
+        with self._lock:
+            self.in_flight -= 1
+            self.calls     += 1
+            self.busy_s    += dt
+        self._sem.release()
+        return False
+
+    def utilization(self, wall: float) -> float:
+        return self.busy_s / (wall * self.limit) if wall > 0 else 0.0
+
+    def stats(self, wall: float) -> dict:
+        with self._lock:
+            return {"limit": self.limit, "calls": self.calls, "peak_in_flight": self.peak,
+                    "busy_s": self.busy_s, "utilization": self.utilization(wall)}
+
+
+
+def read_queries(path: "str | Path") -> Iterator[Tuple[str, str]]:
+    """逐行读取 JSONL：{"id": ..., "query": ...}；缺少 id 时用行号（从 0 开始）"""
+    with open(path, encoding="utf-8") as f:
+        for no, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            yield str(obj.get("id", no)), obj["query"]
+
+
+def finished_ids(path: "str | Path") -> set:
+    """
+    断点续跑：返回输出文件中已成功完成的 id（带 error 字段的记录会重跑）
+    上次被中断时写了一半的末行会被截掉，保证后续追加的每行都是完整 JSON
+    """
+    path = Path(path)
+    if not path.exists():
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    done = set()
+    for line in data.decode("utf-8").splitlines():
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue
+        if "error" not in rec:
+            done.add(str(rec["id"]))
+    return done
+
+
+
+class _Meter():
+    """某阶段的累计忙碌时间；utilization = 忙碌时间 / (wall × 并发槽数)"""
+
+    def __init__(self, slots: int):
+        self.slots  = slots
+        self.busy_s = 0.0
+        self.items  = 0
+        self._lock  = threading.Lock()
+
+    def add(self, seconds: float, items: int = 1):
+        with self._lock:
+            self.busy_s += seconds
+            self.items  += items
+
+    def stats(self, wall: float) -> dict:
+        return {"slots": self.slots, "items": self.items, "busy_s": self.busy_s,
+                "utilization": self.busy_s / (wall * self.slots) if wall > 0 else 0.0}
+
+
+
+class Batch_Runner():
+    """
+    吞吐优先的离线批量问答（夜间评测用）
+    --------------------------------------------------------------
+    • 检索：每 retrieve_batch 个 query 调一次 hybrid_retrieve_parents_batch，
+      嵌入模型一次 forward、FAISS 一次 batch search（BM25 / 父块合并仍逐条进行）
+    • 重排：rerank_queries 个 query 同时重排；远程打分的全局并发上限由 reranker 的 limiter
+      （Concurrency_Gate）统一控制，与同时在重排的 query 数无关
+    • 生成：最多 llm_limit 个推理流同时进行，每个流在自己的线程里读完
+    • 检索最多领先写出 max_pending 个 query，避免检索结果在内存中无限堆积
+    • 结果逐条追加写入 JSONL（每行 flush），重启后跳过已完成的 id；失败的 query 写入带 error 的记录，下次重跑
+    run() 返回 QPS、各阶段忙碌时间与利用率（gate 非空时附带远程打分的并发利用率）
+    """
+
+    def __init__(self,
+                 retriever,
+                 reranker,
+                 reason_fn: Callable,
+                 top_text: int = 20,
+                 top_media: int = 5,
+                 rerank_batch: int = 8,
+                 retrieve_batch: int = 32,
+                 rerank_queries: int = 4,
+                 llm_limit: int = 4,
+                 max_pending: int = 256,
+                 gate: Concurrency_Gate | None = None):
+        self.retriever      = retriever
+        self.reranker       = reranker
+        self.reason_fn      = reason_fn
+        self.top_text       = top_text
+        self.top_media      = top_media
+        self.rerank_batch   = rerank_batch
+        self.retrieve_batch = retrieve_batch
+        self.rerank_queries = rerank_queries
+        self.llm_limit      = llm_limit
+        self.max_pending    = max(max_pending, retrieve_batch)
+        self.gate           = gate
+
+        self._write_lock = threading.Lock()
+        self._meters: Dict[str, _Meter] = {}
+        self._counts = {"ok": 0, "errors": 0}
+
+
+    def _write(self, f, rec: dict):
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self._write_lock:
+            f.write(line)
+            f.flush()
+            self._counts["errors" if "error" in rec else "ok"] += 1
+
+
+    def _generate(self, f, window, rec: dict, top_text, top_media):
+        try:
+            t0 = time.perf_counter()
+            token_iter, done = self.reason_fn(rec["query"], top_text, top_media)
+            for _ in token_iter:
+                pass
+            reasoning, answer = done()
+            dt = time.perf_counter() - t0
+            self._meters["generate"].add(dt)
+            rec.update(answer=answer, reasoning=reasoning, generate_ms=dt * 1000)
+        except Exception as e:
+            logger.warning(f"[batch] {rec['id']} 生成失败: {e!r}")
+            rec["error"] = repr(e)
+        finally:
+            self._write(f, rec)
+            window.release()
+
+
+    def _rerank(self, f, window, llm_ex, rec: dict, parents):
+        try:
+            t0 = time.perf_counter()
+            top_text, top_media = self.reranker.rerank_parents(
+                query   = rec["query"],
+                parents = parents,
+                n_text  = self.top_text,
+                n_media = self.top_media,
+                batch   = self.rerank_batch,
+            )
+            dt = time.perf_counter() - t0
+            self._meters["rerank"].add(dt)
+        except Exception as e:
+            logger.warning(f"[batch] {rec['id']} 重排失败: {e!r}")
+            rec["error"] = repr(e)
+            self._write(f, rec)
+            window.release()
+            return
+        rec.update(rerank_ms=dt * 1000, media=[media_brief(d) for d in top_media])
+        llm_ex.submit(self._generate, f, window, rec, top_text, top_media)
+
+
+    def run(self, in_path: "str | Path", out_path: "str | Path", limit: int | None = None) -> dict:
+        done  = finished_ids(out_path)
+        todo  = [(qid, q) for qid, q in read_queries(in_path) if qid not in done]
+        todo  = todo[:limit] if limit is not None else todo
+        logger.info(f"[batch] 共 {len(todo) + len(done)} 条，已完成 {len(done)}，本次运行 {len(todo)}")
+
+        self._meters = {"retrieve": _Meter(1),
+                        "rerank":   _Meter(self.rerank_queries),
+                        "generate": _Meter(self.llm_limit)}
+        self._counts = {"ok": 0, "errors": 0}
+        window = threading.BoundedSemaphore(self.max_pending)
+        Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+
+        t0 = time.perf_counter()
+        with open(out_path, "a", encoding="utf-8") as f, \
+             ThreadPoolExecutor(max_workers=self.llm_limit) as llm_ex, \
+             ThreadPoolExecutor(max_workers=self.rerank_queries) as rerank_ex:
+            for start in range(0, len(todo), self.retrieve_batch):
+                batch = todo[start:start + self.retrieve_batch]
+                for _ in batch:
+                    window.acquire()
+                t1 = time.perf_counter()
+                try:
+                    with stage("batch_retrieve", n_queries=len(batch)):
+                        results = self.retriever.hybrid_retrieve_parents_batch([q for _, q in batch])
+                except Exception as e:
+                    logger.warning(f"[batch] 检索失败（{len(batch)} 条）: {e!r}")
+                    for qid, q in batch:
+                        self._write(f, {"id": qid, "query": q, "error": repr(e)})
+                        window.release()
+                    continue
+                dt = time.perf_counter() - t1
+                self._meters["retrieve"].add(dt, len(batch))
+
+                for (qid, q), parents in zip(batch, results):
+                    rec = {"id": qid, "query": q, "retrieve_ms": dt * 1000 / len(batch)}
+                    rerank_ex.submit(self._rerank, f, window, llm_ex, rec, parents)
+                logger.info(f"[batch] 已检索 {start + len(batch)}/{len(todo)}，已写出 {sum(self._counts.values())}")
+
+            # 先等所有重排结束（它们会继续向 llm_ex 提交生成任务），再等生成
+            rerank_ex.shutdown(wait=True)
+            llm_ex.shutdown(wait=True)
+        wall = time.perf_counter() - t0
+
+        report = {
+            "queries":  len(todo),
+            "skipped":  len(done),
+            **self._counts,
+            "wall_s":   wall,
+            "qps":      self._counts["ok"] / wall if wall > 0 else 0.0,
+            "stages":   {name: m.stats(wall) for name, m in self._meters.items()},
+        }
+        if self.gate is not None:
+            report["rerank_calls"] = self.gate.stats(wall)
+        if hasattr(self.reason_fn, "stats"):
+            report["reasoning"] = self.reason_fn.stats()
+        return report
@@ -0,0 +1,98 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+
+
+class MicroBatcher():
+    """
+    动态 micro-batching：
+    - 并发请求调用 submit(item) 拿到 Future
+    - 后台线程把请求攒成一批，满足任一条件即触发：
+        1) 批大小达到 max_batch_size
+        2) 第一条请求已等待 max_wait_ms
+    - batch_fn(List[item]) -> List[result]，结果按下标回填各自的 Future
+    """
+
+    def __init__(self,
+                 batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 16,
+                 max_wait_ms: float = 10.0):
+        self.batch_fn       = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait       = max_wait_ms / 1000
+        self._queue         = queue.Queue()
+        self._closed        = False
+
+        # 批次统计
+        self.n_batches = 0
+        self.n_items   = 0
+
+        self._worker = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+
+    def submit(self, item: Any) -> Future:
+        if self._closed:
+            raise RuntimeError("MicroBatcher 已关闭")
+        fut = Future()
+        self._queue.put((item, fut))
+        return fut
+
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch    = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                nxt = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if nxt is None:                 # close() 信号：处理完当前批后退出
+                self._queue.put(None)
+                break
+            batch.append(nxt)
+        return batch
+
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"batch_fn 返回 {len(results)} 条结果，期望 {len(items)} 条")
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            self.n_batches += 1
+            self.n_items   += len(items)
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
+
+
+    def stats(self) -> dict:
+        return {
+            "batches":        self.n_batches,
+            "avg_batch_size": self.n_items / self.n_batches if self.n_batches else 0.0,
+            "queue_depth":    self._queue.qsize(),
+        }
@@ -0,0 +1,217 @@
+from __future__ import annotations
+import time
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .server import media_brief
+from ..reranking.utils import Top_K_Heap, topk_snapshot
+from ..monitoring.hooks import record, stage
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+logger = logging.getLogger(__name__)
+
+
+
+@dataclass
+class Stability_Rule():
+    """
+    何时认为 top-k 已经“稳定”、可以开始生成（满足任一即可）：
+    • 全部候选都已打分（等价于串行流水线）
+    • 两路召回都已返回、已打分比例 >= min_fraction，且最近 patience 次打分结果都没有改变 top-k 成员
+    • 自开始打分起超过 deadline_s（None 表示不设截止时间）
+    min_fraction=1.0 即退化为“等全部打完再生成”
+    """
+    min_fraction: float = 0.6
+    patience:     int   = 6
+    deadline_s:   Optional[float] = None
+
+    def stable(self, legs_done: bool, scored: int, total: int, since_change: int, elapsed: float) -> bool:
+        if legs_done and scored >= total:
+            return True
+        if self.deadline_s is not None and elapsed >= self.deadline_s:
+            return True
+        return (legs_done and total > 0
+                and scored >= self.min_fraction * total
+                and since_change >= self.patience)
+
+
+
+class Pipelined_RAG():
+    """
+    重叠执行的检索 → 重排 → 生成流水线（以首 token 延迟为目标）
+    --------------------------------------------------------------
+    • 稠密一路（retriever.dense_retrieve_parents）与 BM25 一路（bm25_retrieve_text_parents）并发执行；
+      稠密父块一返回就开始逐块打分（reranker._score_block，workers 个并发），
+      BM25 返回后只补打新出现的父块（按 merge_key 去重，顺序与 merge_chunks 一致）
+    • 文本 / 图表各维护一个 top-k 堆（同 Anytime_Reranker），rule（Stability_Rule）判定稳定后
+      立即开始生成，未开始的打分任务取消，进行中的远程调用在后台结束、结果丢弃
+    • 生成期间在后台预热图表缩略图（image_cache），回答结束后 rewrite_fn 改写图文时
+      缩略图已就绪；改写需要完整回答，不与生成重叠
+    • run(query) 逐个产出与 RAG_Server 相同格式的事件：
+          {"event": "media", "data": [...]} / {"event": "token", "data": "..."} /
+          {"event": "rewrite", "data": {...}}（仅 rewrite_fn 非空且有图表时） /
+          {"event": "done", "ttft_ms": ..., "latency_ms": ..., "rerank": {...}}
+    各阶段时刻见 last_report；首 token 延迟同时以 pipeline_ttft 事件上报
+    """
+
+    def __init__(self,
+                 retriever,
+                 reranker,
+                 reason_fn: Callable,
+                 top_text: int = 20,
+                 top_media: int = 5,
+                 rule: Optional[Stability_Rule] = None,
+                 workers: int = 6,
+                 rewrite_fn: Optional[Callable] = None,
+                 image_cache=None):
+        self.retriever   = retriever
+        self.reranker    = reranker
+        self.reason_fn   = reason_fn                 # 例：DeepSeek_Stream / DeepSeek_Client 实例
+        self.top_text    = top_text
+        self.top_media   = top_media
+        self.rule        = rule or Stability_Rule()
+        self.workers     = workers
+        self.rewrite_fn  = rewrite_fn                # 例：functools.partial(rewrite_with_mllm, image_cache=...)
+        self.image_cache = image_cache
+        self.last_report: dict = {}
+
+
+    @staticmethod
+    def _kind(doc: Document) -> Optional[str]:
+        typ = doc.metadata.get("type")
+        if typ in {"parent", "text"}:
+            return "text"
+        if typ in {"image", "table"}:
+            return "media"
+        return None
+
+
+    def select(self, query: str, t0: Optional[float] = None):
+        """
+        只跑“召回 + 重排”部分，返回 (top_text, top_media, progress)；
+        progress 含已打分 / 候选数、是否提前结束以及各阶段相对 t0 的时刻（秒）
+        """
+        t0 = time.perf_counter() if t0 is None else t0
+        r  = self.retriever
+        heaps  = {"text": Top_K_Heap(self.top_text), "media": Top_K_Heap(self.top_media)}
+        blocks, kinds, status, seen = [], [], [], set()
+        report = {}
+
+        legs  = ThreadPoolExecutor(max_workers=2)
+        pool  = ThreadPoolExecutor(max_workers=self.workers)
+        dense = legs.submit(r.dense_retrieve_parents, query)
+        sparse = legs.submit(r.bm25_retrieve_text_parents, query)
+        pending = {dense: "dense", sparse: "sparse"}
+        scoring = {}
+        since_change, t_score = 0, None
+
+        def admit(docs: List[Document]):
+            for doc in docs:
+                kind, key = self._kind(doc), r.merge_key(doc)
+                if kind is None or key in seen or heaps[kind].k <= 0:
+                    continue
+                seen.add(key)
+                i = len(blocks)
+                blocks.append(doc)
+                kinds.append(kind)
+                status.append("pending")
+                fut = pool.submit(self.reranker._score_block, query, doc)
+                scoring[fut] = i
+                pending[fut] = "score"
+
+        try:
+            with stage("pipeline_select") as st:
+                while pending:
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        what = pending.pop(fut)
+                        if what == "dense":
+                            report["dense_s"] = time.perf_counter() - t0
+                            admit(fut.result()[1])
+                            t_score = t_score or time.perf_counter()
+                        elif what == "sparse":
+                            report["sparse_s"] = time.perf_counter() - t0
+                            admit(fut.result()[1])
+                            t_score = t_score or time.perf_counter()
+                        else:
+                            i = scoring.pop(fut)
+                            try:
+                                score = fut.result()
+                            except Exception as e:
+                                logger.warning("评分失败: %s", e)
+                                score = None
+                            if score is None:
+                                status[i] = "failed"
+                                since_change += 1
+                                continue
+                            status[i] = "scored"
+                            changed = heaps[kinds[i]].push(score, i, i)
+                            since_change = 0 if changed else since_change + 1
+
+                    finished = sum(s != "pending" for s in status)
+                    legs_done = dense.done() and sparse.done()
+                    elapsed = time.perf_counter() - t_score if t_score else 0.0
+                    if self.rule.stable(legs_done, finished, len(blocks), since_change, elapsed):
+                        break
+
+                report.update(
+                    stable_s = time.perf_counter() - t0,
+                    scored   = sum(s == "scored" for s in status),
+                    failed   = sum(s == "failed" for s in status),
+                    total    = len(blocks),
+                )
+                report["early"] = report["scored"] + report["failed"] < report["total"]
+                st.set(**report)
+        finally:
+            legs.shutdown(wait=False)
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        text_idx  = [i for i, k in enumerate(kinds) if k == "text"]
+        media_idx = [i for i, k in enumerate(kinds) if k == "media"]
+        return (topk_snapshot(blocks, text_idx,  heaps["text"],  status),
+                topk_snapshot(blocks, media_idx, heaps["media"], status),
+                report)
+
+
+    def _warm_media(self, media_docs: List[Document]):
+        for doc in media_docs:
+            path = doc.metadata.get("img_path")
+            if path:
+                self.image_cache.get(path)
+
+
+    def run(self, query: str) -> Iterator[dict]:
+        t0 = time.perf_counter()
+        top_text, top_media, report = self.select(query, t0)
+        if report["early"]:
+            logger.info(f"[pipeline] top-k 已稳定，已打分 {report['scored']}/{report['total']}，提前开始生成")
+        yield {"event": "media", "data": [media_brief(d) for d in top_media]}
+
+        side = ThreadPoolExecutor(max_workers=1)
+        try:
+            if self.image_cache is not None and top_media:
+                side.submit(self._warm_media, top_media)
+
+            token_iter, done = self.reason_fn(query, top_text, top_media)
+            for tok in token_iter:
+                if "ttft_s" not in report:
+                    report["ttft_s"] = time.perf_counter() - t0
+                    record("pipeline_ttft", report["ttft_s"], early=report["early"])
+                yield {"event": "token", "data": tok}
+            report["generate_s"] = time.perf_counter() - t0
+
+            if self.rewrite_fn is not None and top_media:
+                yield {"event": "rewrite", "data": self.rewrite_fn(done()[1], top_media)}
+                report["rewrite_s"] = time.perf_counter() - t0
+        finally:
+            side.shutdown(wait=False, cancel_futures=True)
+            self.last_report = report
+
+        yield {"event": "done",
+               "ttft_ms":    report.get("ttft_s", 0.0) * 1000,
+               "latency_ms": (time.perf_counter() - t0) * 1000,
+               "rerank":     {k: report[k] for k in ("scored", "failed", "total", "early")}}
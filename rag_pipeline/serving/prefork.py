@@ -0,0 +1,106 @@
+import os
+import gc
+import time
+import signal
+import socket
+from typing import Any, Callable, Dict, List
+
+from .stats import process_memory
+
+
+
+def report_worker_memory(pids: List[int]) -> Dict[int, Dict[str, int]]:
+    """打印并返回每个 worker 的 Rss / Pss / Shared / Private（kB）"""
+    report = {pid: process_memory(pid) for pid in pids}
+    for pid, mem in report.items():
+        if not mem:
+            continue
+        print(
+            f"[worker {pid}] RSS={mem['rss_kb'] / 1024:.1f}MB "
+            f"PSS={mem['pss_kb'] / 1024:.1f}MB "
+            f"shared={mem['shared_kb'] / 1024:.1f}MB "
+            f"private={mem['private_kb'] / 1024:.1f}MB"
+        )
+    return report
+
+
+
+def prefork_serve(build_state: Callable[[], Any],
+                  make_server: Callable[[Any], Any],
+                  n_workers: int = 4,
+                  host: str = "127.0.0.1",
+                  port: int = 8000,
+                  report_interval: float = 60.0):
+    """
+    Pre-fork 启动器
+    --------------------------------------------------------------
+    1) 父进程调用 build_state() 构建 / 加载全部只读检索状态
+       （推荐 Hybrid_Retriever 配 SHARED_STATE，语料 / BM25 / FAISS 均为 mmap）
+    2) gc.freeze() 把已有对象移入永久代，fork 后子进程的 GC 不再遍历、改写这些对象
+    3) 父进程 bind + listen，fork n_workers 个子进程共享同一监听 socket
+    4) 每个 worker 内调用 make_server(state) 创建 RAG_Server（线程只能在 fork 之后创建）
+    5) 父进程每 report_interval 秒报告各 worker 的 RSS/PSS，worker 异常退出时自动补齐
+
+    注意：嵌入模型需在 CPU 上加载（configs["DEVICE"]="cpu"），CUDA 上下文无法跨 fork 使用。
+    """
+    state = build_state()
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    print(f"RAG pre-fork master {os.getpid()} listening on http://{host}:{port}, {n_workers} workers")
+
+    def spawn() -> int:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT,  signal.SIG_DFL)
+            code = 0
+            try:
+                make_server(state).serve_on_socket(sock)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        return pid
+
+    workers = [spawn() for _ in range(n_workers)]
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT,  _stop)
+
+    last_report = time.monotonic()
+    try:
+        while not stopping:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in workers:
+                print(f"[master] worker {pid} exited, respawning")
+                workers[workers.index(pid)] = spawn()
+
+            if time.monotonic() - last_report >= report_interval:
+                report_worker_memory(workers)
+                last_report = time.monotonic()
+            time.sleep(0.5)
+    finally:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in workers:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        sock.close()
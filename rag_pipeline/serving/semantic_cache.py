@@ -0,0 +1,189 @@
+from __future__ import annotations
+import os
+import time
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from ..reranking.score_cache import normalize_query
+from ..monitoring.hooks import stage
+
+
+
+def corpus_version(*paths: str) -> str:
+    """按文件 / 目录的 (路径, 大小, mtime) 计算语料版本号；语料或索引重建后版本随之改变"""
+    h = hashlib.blake2b(digest_size=8)
+    for p in paths:
+        if not p:
+            continue
+        files = [p]
+        if os.path.isdir(p):
+            files = sorted(os.path.join(d, f) for d, _, fs in os.walk(p) for f in fs)
+        for f in files:
+            st = os.stat(f)
+            h.update(f"{f}\x00{st.st_size}\x00{st.st_mtime_ns}\x00".encode())
+    return h.hexdigest()
+
+
+
+@dataclass
+class Cache_Entry():
+    query:   str
+    text:    str                        # 完整的流式输出（含 <think> 标签）
+    media:   List[dict]                 # media_brief 列表
+    version: str
+    created: float = field(default_factory=time.time)
+    hits:    int   = 0
+    last:    float = field(default_factory=time.time)
+
+
+
+class Semantic_Cache():
+    """
+    近似问题的语义答案缓存（位于检索 → 重排 → 推理整条链路之前）
+    --------------------------------------------------------------
+    • query 用现有稠密模型嵌入（embed_fn，一般为 retriever.embed_queries，与检索走同一条 query 嵌入路径），
+      L2 归一化后在小型 FAISS 内积索引（IndexIDMap2 + IndexFlatIP）中查最近的已答问题
+    • 未命中时 lookup() 返回未归一化的 query 向量，交给检索复用（RAG_Server 传给
+      hybrid_retrieve_parents_batch 的 vecs），每个 query 只嵌入一次
+    • 余弦相似度 >= threshold 且语料版本一致时命中，返回缓存的答案与图表选择；
+      归一化后完全相同的 query 直接命中，不做嵌入
+    • 容量 capacity，超出时按 policy 淘汰：lru（最久未命中）/ lfu（命中最少，平手时最久未命中）
+    • 语料版本变化（corpus_version 不同）的条目视为过期，查到即删除
+    • 只在本进程内有效；pre-fork 部署时每个 worker 各有一份
+    stats() 返回 查询 / 命中（含精确命中）/ 过期 / 淘汰次数与命中率
+    """
+
+    def __init__(self,
+                 embed_fn: Callable[[List[str]], Sequence[Sequence[float]]],
+                 threshold: float = 0.92,
+                 capacity: int = 2000,
+                 policy: str = "lru",
+                 version: str = ""):
+        if policy not in {"lru", "lfu"}:
+            raise ValueError(f"未知的淘汰策略: {policy}（可选 'lru' / 'lfu'）")
+        self.embed_fn  = embed_fn
+        self.threshold = threshold
+        self.capacity  = capacity
+        self.policy    = policy
+        self.version   = version
+
+        self._index   = None
+        self._entries: "OrderedDict[int, Cache_Entry]" = OrderedDict()
+        self._exact:   Dict[str, int] = {}
+        self._next_id = 0
+        self._lock    = threading.Lock()
+        self.counters = {"lookups": 0, "hits": 0, "exact_hits": 0, "misses": 0,
+                         "stale": 0, "stores": 0, "evictions": 0}
+
+
+    def embed(self, query: str) -> np.ndarray:
+        return np.asarray(self.embed_fn([query]), dtype="float32").reshape(1, -1)
+
+
+    @staticmethod
+    def _unit(vec: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+
+    def _faiss(self, dim: int):
+        if self._index is None:
+            import faiss
+            self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        return self._index
+
+
+    def _drop(self, eid: int):
+        entry = self._entries.pop(eid)
+        self._exact.pop(normalize_query(entry.query), None)
+        self._index.remove_ids(np.asarray([eid], dtype="int64"))
+
+
+    def _touch(self, eid: int) -> Cache_Entry:
+        entry = self._entries[eid]
+        entry.hits += 1
+        entry.last  = time.time()
+        self._entries.move_to_end(eid)
+        return entry
+
+
+    def _valid(self, eid: int) -> bool:
+        if self._entries[eid].version == self.version:
+            return True
+        self._drop(eid)
+        self.counters["stale"] += 1
+        return False
+
+
+    def lookup(self, query: str) -> Tuple[Optional[Cache_Entry], Optional[np.ndarray], float]:
+        """
+        返回 (命中的条目或 None, query 向量, 相似度)
+        query 向量（embed_fn 的原始输出，未归一化）在未命中时交给检索与 store() 复用，
+        避免同一 query 嵌入多次；精确命中时为 None
+        """
+        key = normalize_query(query)
+        with self._lock:
+            self.counters["lookups"] += 1
+            eid = self._exact.get(key)
+            if eid is not None and self._valid(eid):
+                self.counters["hits"] += 1
+                self.counters["exact_hits"] += 1
+                return self._touch(eid), None, 1.0
+
+        with stage("semantic_cache_embed"):
+            vec = self.embed(query)
+
+        with self._lock:
+            if self._index is not None and self._index.ntotal > 0:
+                sims, ids = self._index.search(self._unit(vec), 1)
+                sim, eid  = float(sims[0][0]), int(ids[0][0])
+                if eid in self._entries and sim >= self.threshold and self._valid(eid):
+                    self.counters["hits"] += 1
+                    return self._touch(eid), vec, sim
+            self.counters["misses"] += 1
+        return None, vec, 0.0
+
+
+    def _victim(self) -> int:
+        if self.policy == "lru":
+            return next(iter(self._entries))
+        return min(self._entries, key=lambda e: (self._entries[e].hits, self._entries[e].last))
+
+
+    def store(self, query: str, text: str, media: List[dict], vec: Optional[np.ndarray] = None):
+        if vec is None:
+            vec = self.embed(query)
+        vec = self._unit(vec)
+        key = normalize_query(query)
+        with self._lock:
+            old = self._exact.get(key)
+            if old is not None:
+                self._drop(old)
+            index = self._faiss(vec.shape[1])
+            eid, self._next_id = self._next_id, self._next_id + 1
+            index.add_with_ids(vec, np.asarray([eid], dtype="int64"))
+            self._entries[eid] = Cache_Entry(query=query, text=text, media=list(media), version=self.version)
+            self._exact[key] = eid
+            self.counters["stores"] += 1
+            while len(self._entries) > self.capacity:
+                self._drop(self._victim())
+                self.counters["evictions"] += 1
+
+
+    def set_version(self, version: str):
+        """语料更新后调用：旧条目在下次被查到时作废"""
+        with self._lock:
+            self.version = version
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            c, size = dict(self.counters), len(self._entries)
+        return {**c,
+                "size":     size,
+                "policy":   self.policy,
+                "hit_rate": c["hits"] / c["lookups"] if c["lookups"] else 0.0}
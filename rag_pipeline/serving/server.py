@@ -0,0 +1,250 @@
+from __future__ import annotations
+import os
+import json
+import time
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Callable, List
+
+from .batcher import MicroBatcher
+from .stats import LatencyStats, process_memory
+from ..monitoring.hooks import trace
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+
+
+def media_brief(doc: Document) -> dict:
+    """返回给客户端的图表父块摘要（不含大段正文）"""
+    md = doc.metadata
+    return {
+        "type":     md.get("type"),
+        "book_idx": md.get("book_idx"),
+        "page_idx": md.get("page_idx"),
+        "img_path": md.get("img_path"),
+    }
+
+
+
+class RAG_Server():
+    """
+    常驻内存的本地检索问答服务
+    --------------------------------------------------------------
+    • 进程启动时只加载一次 Hybrid_Retriever 与 reranker
+    • 并发请求经 MicroBatcher 攒批后统一做嵌入 + FAISS 检索
+    • 推理 token 以 NDJSON 事件流式返回：
+          {"event": "media", "data": [...]}      重排后的图表父块
+          {"event": "token", "data": "..."}      逐 token（含 <think> 标签）
+          {"event": "done",  "latency_ms": ...}
+    • GET /stats 返回 p50/p99 延迟、QPS 与批次统计；
+      传入 stage_hist（已注册的 Histogram_Sink）时附带各阶段延迟分布，
+      reranker 挂了 score_cache 时附带缓存命中率
+    • 每个请求带 trace id（请求体 trace_id 字段或自动生成），攒批检索事件通过 links 关联
+    • 传入 semantic_cache（Semantic_Cache）时，近似问题直接返回缓存的答案与图表：
+          {"event": "cache", "query": 命中的原问题, "similarity": ...} 之后是 media / token / done 事件；
+      请求自带 top_text / top_media / rerank_batch 或 "cache": false 时不查也不写缓存
+    """
+
+    def __init__(self,
+                 retriever,
+                 reranker,
+                 reason_fn: Callable,
+                 max_batch_size: int = 16,
+                 max_wait_ms: float = 10.0,
+                 top_text: int = 20,
+                 top_media: int = 5,
+                 rerank_batch: int = 8,
+                 stage_hist=None,
+                 hedgers=None,
+                 image_cache=None,
+                 semantic_cache=None):
+        self.retriever    = retriever
+        self.reranker     = reranker
+        self.reason_fn    = reason_fn                 # 例：DeepSeek_Stream / DeepSeek_Client 实例
+        self.top_text     = top_text
+        self.top_media    = top_media
+        self.rerank_batch = rerank_batch
+        self.stage_hist   = stage_hist
+        self.hedgers      = hedgers or {}             # {调用点: Hedger}，仅用于 /stats 报告对冲计数
+        self.image_cache  = image_cache               # Image_Cache，仅用于 /stats 报告缩略图命中与节省字节
+        self.semantic_cache = semantic_cache
+
+        self.batcher = MicroBatcher(self._retrieve_batch,
+                                    max_batch_size=max_batch_size,
+                                    max_wait_ms=max_wait_ms)
+        self.latency   = LatencyStats()               # 端到端（含生成）
+        self.retrieval = LatencyStats()               # 排队 + 检索
+
+
+    def _retrieve_batch(self, items: List[tuple]) -> List[List[Document]]:
+        trace_ids = [tid for tid, _, _ in items]
+        vecs      = [vec for _, _, vec in items]
+        with trace(links=trace_ids):
+            return self.retriever.hybrid_retrieve_parents_batch([q for _, q, _ in items], vecs=vecs)
+
+
+    def answer_stream(self, req: dict):
+        """单个请求的完整流程，逐个产出 NDJSON 事件 dict"""
+        query = req["query"]
+        t0 = time.perf_counter()
+        ok = False
+        with trace(req.get("trace_id")) as tid:
+            yield {"event": "trace", "trace_id": tid}
+            try:
+                yield from self._answer_events(req, query, tid, t0)
+                ok = True
+            finally:
+                self.latency.record(time.perf_counter() - t0, ok=ok)
+
+
+    def _cacheable(self, req: dict) -> bool:
+        if self.semantic_cache is None or req.get("cache", True) is False:
+            return False
+        return not any(k in req for k in ("top_text", "top_media", "rerank_batch"))
+
+
+    def _answer_events(self, req: dict, query: str, tid: str, t0: float):
+        cacheable, vec = self._cacheable(req), None
+        if cacheable:
+            hit, vec, sim = self.semantic_cache.lookup(query)
+            if hit is not None:
+                yield {"event": "cache", "query": hit.query, "similarity": sim}
+                yield {"event": "media", "data": hit.media}
+                yield {"event": "token", "data": hit.text}
+                yield {"event": "done", "latency_ms": (time.perf_counter() - t0) * 1000, "cached": True}
+                return
+
+        parents = self.batcher.submit((tid, query, vec)).result()   # 语义缓存已算的向量交给检索复用
+        self.retrieval.record(time.perf_counter() - t0)
+
+        top_text_parents, top_media_parents = self.reranker.rerank_parents(
+            query   = query,
+            parents = parents,
+            n_text  = int(req.get("top_text",     self.top_text)),
+            n_media = int(req.get("top_media",    self.top_media)),
+            batch   = int(req.get("rerank_batch", self.rerank_batch)),
+        )
+        media = [media_brief(d) for d in top_media_parents]
+        yield {"event": "media", "data": media}
+
+        token_iter, _ = self.reason_fn(query, top_text_parents, top_media_parents)
+        tokens = []
+        for tok in token_iter:
+            tokens.append(tok)
+            yield {"event": "token", "data": tok}
+        if cacheable:                                  # 只缓存完整生成的回答
+            self.semantic_cache.store(query, "".join(tokens), media, vec)
+        yield {"event": "done", "latency_ms": (time.perf_counter() - t0) * 1000}
+
+
+    def stats(self) -> dict:
+        cache = getattr(self.reranker, "score_cache", None)
+        return {
+            "latency":   self.latency.snapshot(),
+            "retrieval": self.retrieval.snapshot(),
+            "batcher":   self.batcher.stats(),
+            "stages":    self.stage_hist.snapshot() if self.stage_hist else {},
+            "score_cache": cache.stats() if cache is not None else {},
+            "reranker":  self.reranker.stats() if hasattr(self.reranker, "stats") else {},
+            "reasoning": self.reason_fn.stats() if hasattr(self.reason_fn, "stats") else {},
+            "hedging":   {name: h.stats() for name, h in self.hedgers.items()},
+            "image_cache": self.image_cache.stats() if self.image_cache is not None else {},
+            "semantic_cache": self.semantic_cache.stats() if self.semantic_cache is not None else {},
+            "pid":       os.getpid(),
+            "memory":    process_memory(),
+        }
+
+
+    # ------------------------------------------------------------------
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):      # 不往 stderr 刷访问日志
+                pass
+
+            def _send_json(self, code: int, obj: dict):
+                body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _write_chunk(self, obj: dict):
+                data = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    self._send_json(200, server.stats())
+                else:
+                    self._send_json(404, {"error": f"unknown path {self.path}"})
+
+            def do_POST(self):
+                if self.path != "/query":
+                    self._send_json(404, {"error": f"unknown path {self.path}"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    req = json.loads(self.rfile.read(length) or b"{}")
+                    if not req.get("query"):
+                        raise ValueError("缺少 query 字段")
+                except Exception as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for event in server.answer_stream(req):
+                        self._write_chunk(event)
+                except (BrokenPipeError, ConnectionResetError):
+                    return                             # 客户端断开
+                except Exception as e:
+                    self._write_chunk({"event": "error", "error": str(e)})
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+    def serve(self, host: str = "127.0.0.1", port: int = 8000):
+        httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        print(f"RAG server listening on http://{host}:{port}")
+        self._run(httpd)
+
+
+    def serve_on_socket(self, sock):
+        """在已 bind + listen 的 socket 上服务（pre-fork worker 共享父进程的监听 socket）"""
+        httpd = ThreadingHTTPServer(sock.getsockname()[:2], self._make_handler(),
+                                    bind_and_activate=False)
+        httpd.socket.close()
+        httpd.socket = sock
+        self._run(httpd)
+
+
+    def serve_unix(self, socket_path: str):
+        class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        httpd = UnixHTTPServer(socket_path, self._make_handler())
+        print(f"RAG server listening on unix://{socket_path}")
+        self._run(httpd)
+
+
+    def _run(self, httpd):
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
+            self.batcher.close()
@@ -0,0 +1,88 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Dict
+
+
+
+class LatencyStats():
+    """
+    线程安全的延迟 / QPS 统计
+    - 保留最近 window 条延迟样本，用于计算 p50 / p99
+    - QPS 按最近 qps_window 秒内完成的请求数计算
+    """
+
+    def __init__(self, window: int = 2048, qps_window: float = 60.0):
+        self._lock       = threading.Lock()
+        self._latencies  = deque(maxlen=window)      # 秒
+        self._finished   = deque()                   # 完成时间戳
+        self.qps_window  = qps_window
+        self.total       = 0
+        self.errors      = 0
+        self.started_at  = time.time()
+
+
+    def record(self, latency: float, ok: bool = True):
+        now = time.time()
+        with self._lock:
+            self._latencies.append(latency)
+            self._finished.append(now)
+            self.total += 1
+            if not ok:
+                self.errors += 1
+            self._expire(now)
+
+
+    def _expire(self, now: float):
+        while self._finished and now - self._finished[0] > self.qps_window:
+            self._finished.popleft()
+
+
+    @staticmethod
+    def _percentile(sorted_vals, q: float) -> float:
+        if not sorted_vals:
+            return 0.0
+        k = min(len(sorted_vals) - 1, max(0, int(round(q / 100 * (len(sorted_vals) - 1)))))
+        return sorted_vals[k]
+
+
+    def snapshot(self) -> Dict[str, float]:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            vals   = sorted(self._latencies)
+            recent = len(self._finished)
+            total, errors = self.total, self.errors
+        span = min(self.qps_window, max(now - self.started_at, 1.0))
+        return {
+            "count":  total,
+            "errors": errors,
+            "qps":    recent / span,
+            "p50_ms": self._percentile(vals, 50) * 1000,
+            "p99_ms": self._percentile(vals, 99) * 1000,
+        }
+
+
+
+def process_memory(pid: "int | str" = "self") -> Dict[str, int]:
+    """
+    读取 /proc/<pid>/smaps_rollup，返回 kB 计的 Rss / Pss / Shared / Private。
+    pre-fork 模式下 worker 的 Shared 越大、Private 越小，说明 COW 共享越成功。
+    非 Linux 平台返回空 dict。
+    """
+    path = f"/proc/{pid}/smaps_rollup"
+    if not os.path.exists(path):
+        return {}
+    fields = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    return {
+        "rss_kb":     fields.get("Rss", 0),
+        "pss_kb":     fields.get("Pss", 0),
+        "shared_kb":  fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private_kb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
@@ -0,0 +1,124 @@
+import os
+import logging
+import argparse
+from rag_pipeline.retrieval import Hybrid_Retriever, load_serialized_docs, export_shared_state, qwen_configs
+from rag_pipeline.reranking import (Qwenvl_Reranker, ScoreCache, CrossEncoder_Reranker,
+                                    Cascade_Reranker, Anytime_Reranker)
+from rag_pipeline.reasoning import DeepSeek_Client, Context_Packer, Context_Compressor, ResponseCache
+from rag_pipeline.serving import RAG_Server, prefork_serve, Semantic_Cache, corpus_version
+from rag_pipeline.monitoring import add_sink, Histogram_Sink, JSONL_Sink, Logging_Sink
+from rag_pipeline.remote import Hedger, Image_Cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host",         type=str,   default="127.0.0.1")
+    parser.add_argument("--port",         type=int,   default=8000)
+    parser.add_argument("--unix_socket",  type=str,   default=None)
+    parser.add_argument("--parents",      type=str,   default="/data/huali_mm/chunks/mm_parents.json")
+    parser.add_argument("--children",     type=str,   default="/data/huali_mm/chunks/mm_children.json")
+    parser.add_argument("--max_batch",    type=int,   default=16)     # micro-batch 上限
+    parser.add_argument("--max_wait_ms",  type=float, default=10.0)   # 攒批最长等待
+    parser.add_argument("--top_text",     type=int,   default=20)
+    parser.add_argument("--top_media",    type=int,   default=5)
+    parser.add_argument("--rerank_batch", type=int,   default=8)
+    parser.add_argument("--workers",      type=int,   default=1)      # >1 时走 pre-fork
+    parser.add_argument("--shared_state", type=str,   default=None)   # export_shared_state 导出目录
+    parser.add_argument("--export_state", type=str,   default=None)   # 仅导出共享状态后退出
+    parser.add_argument("--metrics_log",  action="store_true")        # 各阶段耗时写入 logging
+    parser.add_argument("--metrics_jsonl",type=str,   default=None)   # 各阶段耗时写入 JSON lines
+    parser.add_argument("--score_cache",  type=str,   default=None)   # 重排分数缓存 SQLite 路径
+    parser.add_argument("--score_ttl",    type=float, default=7 * 24 * 3600)
+    parser.add_argument("--cascade_ce",   type=str,   default=None)   # 级联第一级 Cross-Encoder 模型目录
+    parser.add_argument("--cascade_m",    type=int,   nargs=2, default=[20, 10])   # 进入 VL 的文本 / 多媒体数
+    parser.add_argument("--rerank_deadline", type=float, default=None)  # VL 重排截止时间（秒），到期返回当前最优
+    parser.add_argument("--hedge_pct",    type=float, default=None)   # 远程调用对冲分位数（如 95），不设则不对冲
+    parser.add_argument("--hedge_extra",  type=float, default=0.1)    # 对冲带来的额外请求上限（占比）
+    parser.add_argument("--image_cache",  type=str,   default=None)   # 缩略图缓存目录，不设则发送原图
+    parser.add_argument("--image_side",   type=int,   default=1024)   # 缩略图最长边
+    parser.add_argument("--image_fmt",    type=str,   default="JPEG", choices=["JPEG", "WEBP"])
+    parser.add_argument("--image_quality",type=int,   default=85)
+    parser.add_argument("--context_budget", type=int, default=None) # 检索上下文 token 预算，不设则全文拼接
+    parser.add_argument("--compress",     type=str,   default=None, choices=["bm25", "embedding"])  # 文本父块抽取式压缩，不设则关闭
+    parser.add_argument("--compress_ratio", type=float, default=0.3) # 每个父块保留的句子比例
+    parser.add_argument("--response_cache", type=str, default=None) # 推理回复缓存 SQLite 路径（完全相同的 prompt 直接回放）
+    parser.add_argument("--response_ttl", type=float, default=24 * 3600)
+    parser.add_argument("--semantic_cache", type=float, default=None) # 语义答案缓存的相似度阈值（如 0.92），不设则关闭
+    parser.add_argument("--semantic_size",  type=int,   default=2000)
+    parser.add_argument("--semantic_policy",type=str,   default="lru", choices=["lru", "lfu"])
+    args = parser.parse_args()
+    if args.workers > 1 and not args.shared_state and not args.export_state:
+        # 普通 list 状态会被引用计数写穿、每个 worker 各复制一份；嵌入模型也可能落在 CUDA 上，fork 后不可用
+        parser.error("--workers > 1 需要配合 --shared_state（先用 --export_state 导出）")
+    logging.basicConfig(level=logging.INFO if args.metrics_log else logging.WARNING)
+
+    def build_state():
+        # 只在启动时加载一次语料、索引与模型
+        score_cache = ScoreCache(args.score_cache, ttl=args.score_ttl) if args.score_cache else None
+        # 重排打分与推理首包的延迟分布不同，各用一个 Hedger
+        hedgers     = ({"rerank":    Hedger(args.hedge_pct, max_extra=args.hedge_extra),
+                        "reasoning": Hedger(args.hedge_pct, max_extra=args.hedge_extra, initial_delay_s=5.0)}
+                       if args.hedge_pct else {})
+        image_cache = (Image_Cache(args.image_cache, max_side=args.image_side,
+                                   fmt=args.image_fmt, quality=args.image_quality)
+                       if args.image_cache else None)
+        reranker    = Qwenvl_Reranker(score_cache=score_cache, hedger=hedgers.get("rerank"),
+                                      image_cache=image_cache)
+        if args.rerank_deadline:
+            reranker = Anytime_Reranker(reranker, deadline_s=args.rerank_deadline, workers=args.rerank_batch)
+        if args.cascade_ce:
+            first    = CrossEncoder_Reranker(args.cascade_ce, device="cpu" if args.workers > 1 else None)
+            reranker = Cascade_Reranker(first, reranker, m_text=args.cascade_m[0], m_media=args.cascade_m[1])
+        if args.shared_state:
+            configs = {**qwen_configs, "SHARED_STATE": args.shared_state, "DEVICE": "cpu"}
+            return Hybrid_Retriever(None, configs), reranker, hedgers, image_cache
+        mm_parents  = load_serialized_docs(args.parents)
+        mm_children = load_serialized_docs(args.children)
+        return Hybrid_Retriever((mm_children, mm_parents), qwen_configs), reranker, hedgers, image_cache
+
+    def make_server(state):
+        mm_hier_hret, llm_reranker, hedgers, image_cache = state
+        stage_hist = add_sink(Histogram_Sink())
+        if args.metrics_log:
+            add_sink(Logging_Sink())
+        if args.metrics_jsonl:
+            add_sink(JSONL_Sink(f"{args.metrics_jsonl}.{os.getpid()}" if args.workers > 1 else args.metrics_jsonl))
+        # 推理客户端的连接池在 worker 内（fork 之后）创建，并提前完成建连
+        packer   = Context_Packer(args.context_budget) if args.context_budget else None
+        responses = ResponseCache(args.response_cache, ttl=args.response_ttl) if args.response_cache else None
+        compressor = (Context_Compressor(args.compress, ratio=args.compress_ratio,
+                                         embed_fn=mm_hier_hret.embeddings.embed_documents
+                                         if args.compress == "embedding" else None)
+                      if args.compress else None)
+        reasoner = DeepSeek_Client(hedger=hedgers.get("reasoning"), packer=packer, response_cache=responses,
+                                   compressor=compressor)
+        reasoner.warmup()
+        semantic = None
+        if args.semantic_cache:
+            version  = corpus_version(args.shared_state) if args.shared_state else corpus_version(args.parents, args.children)
+            semantic = Semantic_Cache(mm_hier_hret.embed_queries, threshold=args.semantic_cache,
+                                      capacity=args.semantic_size, policy=args.semantic_policy, version=version)
+        return RAG_Server(mm_hier_hret, llm_reranker, reasoner,
+                          max_batch_size=args.max_batch,
+                          max_wait_ms   =args.max_wait_ms,
+                          top_text      =args.top_text,
+                          top_media     =args.top_media,
+                          rerank_batch  =args.rerank_batch,
+                          stage_hist    =stage_hist,
+                          hedgers       =hedgers,
+                          image_cache   =image_cache,
+                          semantic_cache=semantic)
+
+    if args.export_state:
+        hret = Hybrid_Retriever((load_serialized_docs(args.children),
+                                 load_serialized_docs(args.parents)), qwen_configs)
+        export_shared_state(hret.children, hret.parents, hret.vectordb, args.export_state)
+    elif args.workers > 1:
+        prefork_serve(build_state, make_server, n_workers=args.workers,
+                      host=args.host, port=args.port)
+    else:
+        server = make_server(build_state())
+        if args.unix_socket:
+            server.serve_unix(args.unix_socket)
+        else:
+            server.serve(args.host, args.port)
@@ -26,7 +26,8 @@ setup(
         "langchain>=0.2.0",
         "langchain-openai>=0.0.1",
         "langchain-community>=0.0.1",
-        "ipykernel>=6.25.0"
+        "ipykernel>=6.25.0",
+        "httpx>=0.24"
     ],
     include_package_data=True,
     classifiers=[
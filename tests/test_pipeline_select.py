@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from rag_pipeline.serving.pipeline import Pipelined_RAG, Stability_Rule
+
+
+def doc(page: int, typ: str = "parent", text: str = ""):
+    return SimpleNamespace(page_content=text or f"p{page}",
+                           metadata={"type": typ, "book_idx": 0, "page_idx": page})
+
+
+class Stub_Retriever():
+    """与 Hybrid_Retriever 相同的返回形状：两路都返回 (child_hits, parent_hits)"""
+
+    def __init__(self, dense, sparse):
+        self.dense, self.sparse = dense, sparse
+
+    merge_key = staticmethod(lambda d: (d.metadata["book_idx"], d.metadata["page_idx"], d.metadata["type"]))
+
+    def dense_retrieve_parents(self, query):
+        return [doc(-1, "text")], list(self.dense)
+
+    def bm25_retrieve_text_parents(self, query):
+        return [doc(-2, "text")], list(self.sparse)
+
+
+class Stub_Reranker():
+    def _score_block(self, query, block):
+        if block.page_content == "fail":
+            raise RuntimeError("remote error")
+        return float(block.metadata["page_idx"])
+
+
+def test_select_admits_both_legs_with_real_return_shapes():
+    dense  = [doc(1), doc(2, "table"), doc(3)]
+    sparse = [doc(3), doc(4), doc(5, text="fail")]            # page 3 与稠密一路重复
+    rag = Pipelined_RAG(Stub_Retriever(dense, sparse), Stub_Reranker(), reason_fn=None,
+                        top_text=4, top_media=1, rule=Stability_Rule(min_fraction=1.0), workers=2)
+
+    top_text, top_media, report = rag.select("q")
+
+    assert [d.metadata["page_idx"] for d in top_text] == [4, 3, 1, 5]     # 打分失败的排在最后
+    assert [d.metadata["page_idx"] for d in top_media] == [2]
+    assert report["total"] == 5 and report["scored"] == 4 and report["failed"] == 1
+    assert not report["early"]
@@ -0,0 +1,104 @@
+import re
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+from stubs import Fake_OpenAI_Server, Fake_QwenVL
+from rag_pipeline.remote.async_client import DashScope_AsyncClient
+from rag_pipeline.reranking.qwen_vl import Qwenvl_Reranker
+
+QUERY = "fourier transform theorem"
+
+
+def doc(page: int, text: str, typ: str = "parent", img_path: str = None):
+    meta = {"type": typ, "book_idx": 0, "page_idx": page}
+    if img_path:
+        meta["img_path"] = img_path
+    return SimpleNamespace(page_content=text, metadata=meta)
+
+
+class Recorder():
+    """包一层 Fake_QwenVL：记录每次请求的候选数 / 图片数，按 rules 改写回复"""
+
+    def __init__(self, rules=None):
+        self.inner    = Fake_QwenVL(base_ms=0, per_item_ms=0, per_image_ms=0)
+        self.rules    = rules or {}
+        self.requests = []
+
+    def __call__(self, messages):
+        parts = messages[-1]["content"]
+        text  = "".join(p.get("text", "") for p in parts)
+        n     = len(re.findall(r"\[\d+\] \(\w+\)\n", text))
+        self.requests.append({"listwise": n > 0, "n": n, "images": sum("image" in p for p in parts)})
+        for needle, reply in self.rules.items():
+            if needle in text:
+                return reply(text) if callable(reply) else reply
+        return self.inner(messages)
+
+
+@pytest.fixture
+def remote():
+    server = Fake_OpenAI_Server(capacity=64, latency_ms=0)
+    url    = server.start()
+    client = DashScope_AsyncClient(api_key="test", base_url=url, max_retries=0)
+
+    def make(rules=None, **kwargs):
+        server.responder = Recorder(rules)
+        return Qwenvl_Reranker(mode="listwise", client=client, **kwargs), server.responder
+
+    yield make
+    client.close()
+    server.stop()
+
+
+def test_parse_score_vector_malformed_and_partial():
+    parse = Qwenvl_Reranker.parse_score_vector
+    assert parse('好的：{"1": 0.9, "3": 0.2}', 3) == {0: 0.9, 2: 0.2}
+    assert parse("[0.5, 0.7]", 3) == {0: 0.5, 1: 0.7}
+    assert parse('{"1": 0.9, "2": ', 2) == {0: 0.9}                  # 截断的 JSON 退回逐行匹配
+    assert parse("[1]: 0.4\n[2]: 0.6", 2) == {0: 0.4, 1: 0.6}
+    assert parse('{"1": 1.7, "5": 0.3, "2": 0.1}', 2) == {1: 0.1}     # 越界分数 / 编号丢弃
+    assert parse("无法评分", 2) == {}
+
+
+def test_missing_ids_fall_back_to_pointwise(remote):
+    parents = [doc(i, f"fourier transform chapter {i}") for i in range(4)]
+    parents[2].page_content = "fourier transform theorem"
+    rr, rec = remote(rules={"请分别给出": '{"1": 0.1, "2": 0.2}'})     # 每组只回前两个编号
+
+    top_text, _ = rr.rerank_parents(QUERY, parents, n_text=4, n_media=0)
+
+    assert [r["listwise"] for r in rec.requests] == [True, False, False]
+    assert top_text[0] is parents[2]                                  # 补打分：重合度 1.0
+    assert [d.metadata["page_idx"] for d in top_text[1:]] == [3, 1, 0]
+
+
+def test_failed_items_rank_last(remote):
+    parents = [doc(0, "broken block"), doc(1, "fourier transform"), doc(2, "theorem")]
+    rr, _ = remote(rules={"请分别给出": "???", "broken block": "not a score"})
+
+    scores = rr._score_many(QUERY, parents, batch=4)
+    top_text, _ = rr.rerank_parents(QUERY, parents, n_text=3, n_media=0)
+
+    assert scores[0] is None and scores[1] > scores[2] > 0
+    assert [d.metadata["page_idx"] for d in top_text] == [1, 2, 0]
+
+
+def test_images_per_request_bounded(remote, tmp_path):
+    parents = []
+    for i in range(6):
+        img = tmp_path / f"fig{i}.png"
+        img.write_bytes(b"\x89PNG fake")
+        parents.append(doc(i, f"fourier figure {i}", typ="image", img_path=str(img)))
+    parents += [doc(10 + i, f"transform text {i}") for i in range(4)]
+    rr, rec = remote(group_size=8, max_images=2)
+
+    rr.rerank_parents(QUERY, parents, n_text=4, n_media=6)
+
+    listwise = [r for r in rec.requests if r["listwise"]]
+    assert sum(r["n"] for r in listwise) == len(parents)
+    assert all(r["images"] <= 2 and r["n"] <= 8 for r in listwise)
@@ -0,0 +1,20 @@
+from post_processing.streaming_rewrite import Paragraph_Parser
+
+
+def feed_all(text: str, step: int):
+    parser, out = Paragraph_Parser(), []
+    for i in range(0, len(text), step):
+        out += parser.feed(text[i:i + step])
+    return out
+
+
+def test_latex_backslash_u_kept_literal():
+    text = r'{"enhanced_paragraphs": ["\underline{y} 与 \upsilon", "中"]}'
+    for step in (1, 2, 3, len(text)):
+        assert feed_all(text, step) == ["underline{y} 与 upsilon", "中"]
+
+
+def test_unicode_escape_split_across_chunks():
+    parser = Paragraph_Parser()
+    assert parser.feed(r'{"enhanced_paragraphs": ["a\u4e') == []
+    assert parser.feed(r'2d"]}') == ["a中"]